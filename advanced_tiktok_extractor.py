@@ -8,12 +8,13 @@ import requests
 import logging
 from urllib.parse import urlparse, parse_qs
 import yt_dlp
+import deadline
 
 logger = logging.getLogger(__name__)
 
 class AdvancedTikTokExtractor:
     def __init__(self):
-        self.session = requests.Session()
+        self.session = deadline.instrument_session(requests.Session())
         # Use multiple user agents to avoid detection
         self.user_agents = [
             'Mozilla/5.0 (iPhone; CPU iPhone OS 14_0 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/14.0 Mobile/15E148 Safari/604.1',
@@ -66,14 +67,17 @@ class AdvancedTikTokExtractor:
         ]
         
         for i, method in enumerate(methods, 1):
+            if not deadline.allows(deadline.MIN_ATTEMPT_SECONDS):
+                logger.warning("Skipping TikTok extraction methods %s-%s: request deadline too close", i, len(methods))
+                break
             try:
-                logger.info(f"Trying TikTok extraction method {i}")
+                logger.info("Trying TikTok extraction method %s", i)
                 result = method(url)
                 if result:
-                    logger.info(f"TikTok extraction successful with method {i}")
+                    logger.info("TikTok extraction successful with method %s", i)
                     return result
             except Exception as e:
-                logger.warning(f"Method {i} failed: {str(e)}")
+                logger.warning("Method %s failed: %s", i, e)
                 continue
         
         return None
@@ -81,7 +85,8 @@ class AdvancedTikTokExtractor:
     def _method_enhanced_yt_dlp(self, url):
         """Enhanced yt-dlp method with latest options"""
         opts = self.get_enhanced_yt_dlp_options(url)
-        with yt_dlp.YoutubeDL(opts) as ydl:
+        with yt_dlp.YoutubeDL(deadline.ydl_opts(opts)) as ydl:
+            deadline.instrument_ydl(ydl)
             info = ydl.extract_info(url, download=False)
             return info
 
@@ -102,7 +107,8 @@ class AdvancedTikTokExtractor:
                 }
             }
         }
-        with yt_dlp.YoutubeDL(opts) as ydl:
+        with yt_dlp.YoutubeDL(deadline.ydl_opts(opts)) as ydl:
+            deadline.instrument_ydl(ydl)
             info = ydl.extract_info(url, download=False)
             return info
 
@@ -116,7 +122,8 @@ class AdvancedTikTokExtractor:
                 'X-Ladon': 'null',  
             }
         }
-        with yt_dlp.YoutubeDL(opts) as ydl:
+        with yt_dlp.YoutubeDL(deadline.ydl_opts(opts)) as ydl:
+            deadline.instrument_ydl(ydl)
             info = ydl.extract_info(url, download=False)
             return info
 
@@ -1,15 +1,39 @@
 import os
 import tempfile
 import json
-import yt_dlp
-from flask import Blueprint, request, jsonify, send_file
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from itertools import islice
+from flask import Blueprint, request, jsonify, send_file, after_this_request, Response, stream_with_context, current_app
 from werkzeug.exceptions import BadRequest
 import logging
-from utils import validate_url, cleanup_file, get_supported_formats
+from utils import (validate_url, get_supported_formats, get_filename_with_title, build_format_record,
+                   parse_fields, project_fields)
 from app import limiter
+import timing
+import archive
+import postprocess_pool
+import fragment_control
+import bandwidth
+import inflight
+import prefetch
+import delivery
+import file_serving
+import segmented
+import thumbnails
+import http_cache
+import metadata_store
+import negative_cache
+import deadline
+import extractor_backends
 
 logger = logging.getLogger(__name__)
 
+# yt_dlp is imported inside the routes that extract, so cold starts that only
+# serve /health or the platform list never pay for importing it
+
 api_bp = Blueprint('api', __name__)
 
 # Supported platforms
@@ -19,9 +43,162 @@ SUPPORTED_PLATFORMS = [
     'dailymotion.com', 'twitch.tv'
 ]
 
+def build_video_metadata(info, url):
+    """Shape a VideoMetadata (or yt-dlp info dict) into the /info metadata response"""
+    return {
+        'title': info.get('title', 'Unknown'),
+        'duration': info.get('duration'),
+        'uploader': info.get('uploader', 'Unknown'),
+        'upload_date': info.get('upload_date'),
+        'view_count': info.get('view_count'),
+        'thumbnail': info.get('thumbnail'),
+        'thumbnail_url': thumbnails.proxy_url(info.get('thumbnail'), info.get('webpage_url', url)),
+        'description': info.get('description', ''),
+        'platform': info.get('extractor_key', 'Unknown'),
+        'formats_available': len(info.get('formats', [])),
+        'webpage_url': info.get('webpage_url', url)
+    }
+
+def extract_metadata(url, ydl_opts):
+    """VideoMetadata for a URL, served from the metadata store when possible;
+    fast-path extractor backends (TikWM for TikTok) are tried before yt-dlp"""
+    import yt_dlp
+    extractor = None
+
+    def extract():
+        nonlocal extractor
+        backend, metadata = extractor_backends.extract(url)
+        if metadata is not None:
+            extractor = backend.name
+            return metadata
+        extractor = 'yt-dlp'
+        with yt_dlp.YoutubeDL(deadline.ydl_opts(ydl_opts)) as ydl:
+            timing.instrument_ydl(ydl)
+            deadline.instrument_ydl(ydl)
+            with timing.phase('extract'):
+                return deadline.call(lambda: ydl.extract_info(url, download=False))
+
+    info, cache_state = metadata_store.get_or_extract(url, lambda: negative_cache.guard(url, extract))
+
+    @after_this_request
+    def add_cache_state(response):
+        response.headers['X-Metadata-Cache'] = cache_state
+        if extractor:
+            response.headers['X-Extractor'] = extractor
+        return response
+
+    return info
+
+# Format downloaded when a request doesn't name one (and the one prefetched)
+DEFAULT_FORMAT = 'best[height<=720]'
+
+def maybe_prefetch(url, info):
+    """Start downloading the default format in the background after a metadata lookup"""
+    if not prefetch.enabled():
+        return
+    
+    def run(shared):
+        negative_cache.hold_off(url)
+        info = extractor_backends.select(url) or select_media(url, DEFAULT_FORMAT)
+        if delivery.plan(info).strategy != delivery.DOWNLOAD:
+            return None  # would be redirected or proxied, nothing to keep
+        path, downloaded_info, _ = download_media(url, shared.temp_dir, DEFAULT_FORMAT, shared=shared, info=info)
+        return path, downloaded_info
+    
+    prefetch.prefetcher.start(inflight.download_key(url, DEFAULT_FORMAT), url, info, run)
+
+# Playlist pages: entries per page by default and at most, and how many
+# entries are fully extracted at once when a client asks for expansion
+PLAYLIST_PAGE_SIZE = 50
+PLAYLIST_MAX_PAGE_SIZE = 500
+PLAYLIST_EXPAND_CONCURRENCY = int(os.environ.get('PLAYLIST_EXPAND_CONCURRENCY', 4))
+
+def resolve_playlist(ydl, url, max_hops=3):
+    """Flat-extract a URL, following url-type results (e.g. channel -> videos tab)"""
+    result = ydl.extract_info(url, download=False, process=False)
+    for _ in range(max_hops):
+        if result.get('_type') not in ('url', 'url_transparent'):
+            break
+        result = ydl.extract_info(result['url'], download=False, process=False, ie_key=result.get('ie_key'))
+    return result
+
+def playlist_page(entries, start, limit):
+    """Iterate entries[start:start + limit] without materialising the rest of the playlist"""
+    if entries is None:
+        return iter(())
+    if hasattr(entries, 'getslice'):
+        # yt-dlp PagedList: only the pages covering the slice are fetched
+        return iter(entries.getslice(start, start + limit))
+    return islice(iter(entries), start, start + limit)
+
+def build_playlist_entry(entry, index):
+    """Shape a flat playlist entry for the NDJSON stream"""
+    thumbnail = entry.get('thumbnail') or next(
+        (t.get('url') for t in reversed(entry.get('thumbnails') or []) if t.get('url')), None)
+    url = entry.get('webpage_url') or entry.get('url')
+    return {
+        'type': 'entry',
+        'index': index,
+        'id': entry.get('id'),
+        'title': entry.get('title'),
+        'url': url,
+        'duration': entry.get('duration'),
+        'uploader': entry.get('uploader') or entry.get('channel'),
+        'view_count': entry.get('view_count'),
+        'thumbnail_url': thumbnails.proxy_url(thumbnail, url),
+        'entry_type': entry.get('_type', 'video'),
+    }
+
+# Multi-URL archives: URLs per request and concurrent downloads per archive
+ARCHIVE_MAX_URLS = int(os.environ.get('ARCHIVE_MAX_URLS', 20))
+ARCHIVE_WORKERS = int(os.environ.get('ARCHIVE_WORKERS', 3))
+
+# Audio-only downloads: 'native' keeps the source codec (no re-encode), the
+# others are explicit conversions and only transcode when the codec differs
+AUDIO_FORMATS = {
+    'native': 'bestaudio/best',
+    'm4a': 'bestaudio[ext=m4a]/bestaudio/best',
+    'opus': 'bestaudio[acodec=opus]/bestaudio/best',
+    'mp3': 'bestaudio[acodec=mp3]/bestaudio/best',
+}
+
+def audio_codec_family(acodec):
+    """Map a yt-dlp acodec string (e.g. 'mp4a.40.2') to an FFmpegExtractAudio codec name"""
+    acodec = (acodec or '').lower()
+    if acodec.startswith('mp4a') or acodec == 'aac':
+        return 'aac'
+    for family in ('opus', 'vorbis', 'mp3', 'flac', 'alac'):
+        if acodec.startswith(family):
+            return family
+    return None
+
+def plan_audio_extraction(info, audio_format='native'):
+    """Decide how to deliver audio for the selected format
+
+    Returns (path, preferredcodec): path is 'copy' (serve the downloaded
+    stream as-is), 'remux' (ffmpeg stream copy into an audio container) or
+    'transcode' (re-encode); preferredcodec is None when no postprocessor runs.
+    """
+    source = audio_codec_family(info.get('acodec'))
+    audio_only = info.get('vcodec') == 'none'
+    ext = info.get('ext')
+
+    if audio_format == 'native':
+        if audio_only:
+            return 'copy', None
+        return 'remux', 'best'
+
+    matches = source == audio_format or (audio_format == 'm4a' and source == 'aac')
+    if not matches:
+        return 'transcode', audio_format
+    if audio_only and ext == audio_format:
+        return 'copy', None
+    return 'remux', audio_format
+
 @api_bp.route('/info', methods=['POST'])
 def get_video_info():
     """Get video metadata without downloading"""
+    import yt_dlp
     try:
         data = request.get_json()
         if not data or 'url' not in data:
@@ -38,45 +215,415 @@ def get_video_info():
             'extract_flat': False,
         }
         
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        try:
+            info = extract_metadata(url, ydl_opts)
+            
+            # Extract relevant metadata
+            metadata = build_video_metadata(info, url)
+            maybe_prefetch(url, info)
+            
+            return jsonify({
+                'success': True,
+                'metadata': metadata,
+                'supported_formats': get_supported_formats()
+            })
+            
+        except negative_cache.CachedFailure as e:
+            return negative_cache.failure_response(e, 'Failed to extract video info')
+        except deadline.DeadlineExceeded as e:
+            return deadline.exceeded_response(e)
+        except yt_dlp.DownloadError as e:
+            logger.error("yt-dlp download error: %s", e)
+            return jsonify({'error': f'Failed to extract video info: {str(e)}'}), 400
+        except Exception as e:
+            logger.error("Unexpected error during info extraction: %s", e)
+            return jsonify({'error': 'Unable to process this URL'}), 500
+            
+    except Exception as e:
+        logger.error("Error in get_video_info: %s", e)
+        return jsonify({'error': 'Internal server error'}), 500
+
+@api_bp.route('/inspect', methods=['GET', 'POST'])
+@http_cache.cache_control(http_cache.METADATA)
+def inspect_video():
+    """Metadata and formats from a single extraction, with optional field projection"""
+    import yt_dlp
+    try:
+        # GET (?url=&fields=) responses can be cached by browsers and the edge
+        data = request.args.to_dict() if request.method == 'GET' else request.get_json()
+        if not data or 'url' not in data:
+            return jsonify({'error': 'URL is required'}), 400
+        
+        url = data['url'].strip()
+        if not validate_url(url):
+            return jsonify({'error': 'Invalid URL format'}), 400
+        
+        try:
+            fields = parse_fields(data.get('fields', request.args.get('fields')))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        ydl_opts = {
+            'quiet': True,
+            'no_warnings': True,
+            'extract_flat': False,
+        }
+        
+        try:
+            info = extract_metadata(url, ydl_opts)
+            
+            document = build_video_metadata(info, url)
+            document['formats'] = [build_format_record(fmt) for fmt in info.get('formats', [])]
             try:
-                info = ydl.extract_info(url, download=False)
-                
-                # Extract relevant metadata
-                metadata = {
-                    'title': info.get('title', 'Unknown'),
-                    'duration': info.get('duration'),
-                    'uploader': info.get('uploader', 'Unknown'),
-                    'upload_date': info.get('upload_date'),
-                    'view_count': info.get('view_count'),
-                    'thumbnail': info.get('thumbnail'),
-                    'description': info.get('description', ''),
-                    'platform': info.get('extractor_key', 'Unknown'),
-                    'formats_available': len(info.get('formats', [])),
-                    'webpage_url': info.get('webpage_url', url)
-                }
-                
-                return jsonify({
-                    'success': True,
-                    'metadata': metadata,
-                    'supported_formats': get_supported_formats()
-                })
-                
-            except yt_dlp.DownloadError as e:
-                logger.error(f"yt-dlp download error: {str(e)}")
-                return jsonify({'error': f'Failed to extract video info: {str(e)}'}), 400
-            except Exception as e:
-                logger.error(f"Unexpected error during info extraction: {str(e)}")
-                return jsonify({'error': 'Unable to process this URL'}), 500
-                
+                document = project_fields(document, fields)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            
+            maybe_prefetch(url, info)
+            return jsonify({'success': True, **document})
+            
+        except negative_cache.CachedFailure as e:
+            return negative_cache.failure_response(e, 'Failed to inspect video')
+        except deadline.DeadlineExceeded as e:
+            return deadline.exceeded_response(e)
+        except yt_dlp.DownloadError as e:
+            logger.error("yt-dlp download error: %s", e)
+            return jsonify({'error': f'Failed to inspect video: {str(e)}'}), 400
+            
     except Exception as e:
-        logger.error(f"Error in get_video_info: {str(e)}")
+        logger.error("Error in inspect_video: %s", e)
         return jsonify({'error': 'Internal server error'}), 500
 
+@api_bp.route('/playlist', methods=['POST'])
+def playlist_entries():
+    """Stream playlist/channel entries as NDJSON, one page per request"""
+    import yt_dlp
+    data = request.get_json()
+    if not data or 'url' not in data:
+        return jsonify({'error': 'URL is required'}), 400
+    
+    url = data['url'].strip()
+    if not validate_url(url):
+        return jsonify({'error': 'Invalid URL format'}), 400
+    
+    try:
+        start = int(data.get('cursor') or 0)
+        page_size = min(int(data.get('page_size', PLAYLIST_PAGE_SIZE)), PLAYLIST_MAX_PAGE_SIZE)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'cursor and page_size must be integers'}), 400
+    if start < 0 or page_size < 1:
+        return jsonify({'error': 'cursor and page_size must be positive'}), 400
+    expand = bool(data.get('expand', False))
+    
+    # Flat, lazy extraction: entries are only listed, never resolved, and
+    # generator-backed playlists are only paged as far as this page needs
+    ydl_opts = {
+        'quiet': True,
+        'no_warnings': True,
+        'extract_flat': 'in_playlist',
+        'lazy_playlist': True,
+    }
+    
+    # The YoutubeDL instance lives as long as the stream, so it is closed by
+    # the generator rather than a with-block
+    resources = ExitStack()
+    ydl = timing.instrument_ydl(resources.enter_context(yt_dlp.YoutubeDL(ydl_opts)))
+    try:
+        with timing.phase('extract'):
+            result = resolve_playlist(ydl, url)
+    except yt_dlp.DownloadError as e:
+        resources.close()
+        logger.error("yt-dlp playlist error: %s", e)
+        return jsonify({'error': f'Failed to list playlist: {str(e)}'}), 400
+    except Exception as e:
+        resources.close()
+        logger.error("Error in playlist_entries: %s", e)
+        return jsonify({'error': 'Internal server error'}), 500
+    
+    if result.get('_type') in ('playlist', 'multi_video'):
+        header = {
+            'type': 'playlist',
+            'id': result.get('id'),
+            'title': result.get('title'),
+            'uploader': result.get('uploader') or result.get('channel'),
+            'webpage_url': result.get('webpage_url', url),
+            'playlist_count': result.get('playlist_count'),
+        }
+        entries = result.get('entries')
+    else:
+        # A single video behaves like a one-entry playlist
+        header = {'type': 'playlist', 'id': result.get('id'), 'title': result.get('title'),
+                  'uploader': result.get('uploader'), 'webpage_url': result.get('webpage_url', url),
+                  'playlist_count': 1}
+        entries = [result]
+    
+    local = threading.local()
+    # Expansion threads run outside the request; they get the app context
+    app = current_app._get_current_object()
+    
+    def thread_ydl():
+        # YoutubeDL isn't thread-safe; each expansion (or refresh) thread gets its own
+        if not hasattr(local, 'ydl'):
+            local.ydl = yt_dlp.YoutubeDL({'quiet': True, 'no_warnings': True})
+        return local.ydl
+    
+    def expand_entry(entry):
+        """Full extraction of one entry (through the metadata store), on a worker thread"""
+        entry_url = entry.get('webpage_url') or entry.get('url')
+        with app.app_context():
+            if entry.get('formats') or not entry_url:
+                return build_video_metadata(entry, entry_url)
+            info, _ = metadata_store.get_or_extract(
+                entry_url, lambda: thread_ydl().extract_info(entry_url, download=False))
+            return build_video_metadata(info, entry_url)
+    
+    def finish(record, future):
+        try:
+            record['metadata'] = future.result()
+        except Exception as e:
+            record['error'] = str(e)
+        return record
+    
+    def generate():
+        # Closing the generator (the client disconnected or stopped reading)
+        # stops the enumeration and cancels expansions that haven't started
+        pool = ThreadPoolExecutor(max_workers=PLAYLIST_EXPAND_CONCURRENCY) if expand else None
+        pending = deque()
+        sent = 0
+        has_more = False
+        try:
+            yield json.dumps(header, ensure_ascii=False) + '\n'
+            # One entry past the page tells us whether there is a next page
+            for offset, entry in enumerate(playlist_page(entries, start, page_size + 1)):
+                if offset == page_size:
+                    has_more = True
+                    break
+                if entry is None:
+                    continue
+                record = build_playlist_entry(entry, start + offset)
+                sent += 1
+                if pool is None:
+                    yield json.dumps(record, ensure_ascii=False) + '\n'
+                    continue
+                pending.append((record, pool.submit(expand_entry, entry)))
+                if len(pending) >= PLAYLIST_EXPAND_CONCURRENCY:
+                    yield json.dumps(finish(*pending.popleft()), ensure_ascii=False) + '\n'
+            while pending:
+                yield json.dumps(finish(*pending.popleft()), ensure_ascii=False) + '\n'
+            next_cursor = str(start + page_size) if has_more else None
+            yield json.dumps({'type': 'end', 'count': sent, 'next_cursor': next_cursor}) + '\n'
+        finally:
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
+            resources.close()
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+def select_format(url, format_selector, audio_only=False, audio_format='native'):
+    """yt-dlp format selector for a download request"""
+    if audio_only:
+        return AUDIO_FORMATS[audio_format]
+    # Improved format selection for different platforms
+    if 'tiktok.com' in url.lower():
+        # TikTok specific format handling
+        return 'best[ext=mp4]/mp4/best'
+    elif 'facebook.com' in url.lower() or 'fb.watch' in url.lower():
+        # Facebook format handling
+        return 'best[ext=mp4]/mp4/best'
+    elif 'instagram.com' in url.lower():
+        # Instagram format handling
+        return 'best[ext=mp4]/mp4/best'
+    elif 'twitter.com' in url.lower() or 'x.com' in url.lower():
+        # Twitter/X format handling
+        return 'best[ext=mp4]/mp4/best'
+    # For YouTube and other platforms, use user selection
+    return format_selector
+
+def media_ydl_opts(url, temp_dir, format_selector, audio_only=False, audio_format='native'):
+    """yt-dlp options for extracting and downloading one URL"""
+    # Configure yt-dlp options with emoji support
+    return {
+        'outtmpl': os.path.join(temp_dir, '%(title)s.%(ext)s'),
+        'quiet': True,
+        'no_warnings': True,
+        'restrictfilenames': False,  # Allow unicode characters and emojis
+        'ignoreerrors': False,  # Don't ignore errors, handle them properly
+        'writesubtitles': False,
+        'writeautomaticsub': False,
+        'no_check_certificate': True,  # Help with some platform issues
+        'extractor_args': {
+            'tiktok': {
+                'webpage_url_domain': 'tiktok.com'
+            }
+        },
+        'postprocessor_hooks': [timing.postprocessor_hook()],
+        'format': select_format(url, format_selector, audio_only, audio_format),
+    }
+
+def select_media(url, format_selector, audio_only=False, audio_format='native'):
+    """
+    Extract a URL and select its format(s) without downloading within the
+    request's deadline; raises yt_dlp.DownloadError, deadline.DeadlineExceeded,
+    or negative_cache.CachedFailure while the URL is held off
+    """
+    import yt_dlp
+    
+    opts = deadline.ydl_opts(media_ydl_opts(url, tempfile.gettempdir(), format_selector, audio_only, audio_format))
+    with yt_dlp.YoutubeDL(opts) as ydl:
+        timing.instrument_ydl(ydl)
+        deadline.instrument_ydl(ydl)
+        with timing.phase('extract'):
+            ie_result = negative_cache.guard(
+                url, lambda: deadline.call(lambda: ydl.extract_info(url, download=False, process=False)))
+        with timing.phase('select-format'):
+            return deadline.call(lambda: ydl.process_ie_result(ie_result, download=False))
+
+def download_media(url, temp_dir, format_selector, audio_only=False, audio_format='native', shared=None,
+                   info=None):
+    """
+    Extract, select a format and download one URL into temp_dir.
+    Returns (file path or None, info, audio_path); raises yt_dlp.DownloadError.
+    `shared` (an inflight.InflightDownload) gets to follow the download;
+    `info` from select_media() skips the extraction; a selection made by a
+    fast-path extractor backend is fetched from its direct URL without yt-dlp.
+    """
+    import yt_dlp
+    
+    if info is not None and info.get('extractor_backend'):
+        return download_direct(info, temp_dir, shared), info, None
+    
+    ydl_opts = media_ydl_opts(url, temp_dir, format_selector, audio_only, audio_format)
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        timing.instrument_ydl(ydl)
+        postprocess_pool.schedule(ydl)
+        
+        # Extract info first
+        if info is None:
+            with timing.phase('extract'):
+                ie_result = negative_cache.guard(url, lambda: ydl.extract_info(url, download=False, process=False))
+            with timing.phase('select-format'):
+                info = ydl.process_ie_result(ie_result, download=False)
+        
+        audio_path = preferred_codec = None
+        if audio_only:
+            audio_path, preferred_codec = plan_audio_extraction(info, audio_format)
+            if preferred_codec:
+                from yt_dlp.postprocessor import FFmpegExtractAudioPP
+                ydl.add_post_processor(FFmpegExtractAudioPP(
+                    ydl,
+                    preferredcodec=preferred_codec,
+                    preferredquality='192' if audio_path == 'transcode' else None,
+                ), when='post_process')
+        
+        # Single direct files are fetched over several connections (segmented.py)
+        # rather than yt-dlp's one; they need no merging or fixups afterwards
+        if segmented.enabled() and inflight.is_streamable(info, postprocessed=bool(preferred_codec)):
+            return download_direct(info, temp_dir, shared), info, audio_path
+        
+        # Fragment concurrency (DASH/HLS) is chosen per download from observed throughput
+        host = fragment_control.download_host(info)
+        lease = fragment_control.controller.acquire(host)
+        lease.instrument(ydl)
+        # The download's ratelimit follows its share of the global ingress cap
+        transfer = bandwidth.scheduler.register('ingress', label=host, size=bandwidth.expected_size(info),
+                                                duration=info.get('duration'))
+        transfer.instrument(ydl)
+        if shared is not None:
+            shared.instrument(ydl, info, postprocessed=bool(preferred_codec))
+        
+        # Download the already-extracted info instead of re-extracting the URL
+        try:
+            with timing.phase('download'):
+                ydl.process_ie_result(ydl.sanitize_info(info, remove_private_keys=True), download=True)
+        finally:
+            transfer.release()
+            lease.release()
+    
+    # Find the downloaded file
+    files = os.listdir(temp_dir)
+    if not files:
+        return None, info, audio_path
+    return os.path.join(temp_dir, files[0]), info, audio_path
+
+def download_direct(info, temp_dir, shared=None):
+    """Fetch the direct URL of a single-file selection into temp_dir, without yt-dlp"""
+    path = os.path.join(temp_dir, get_filename_with_title(info.get('title', 'video'), info.get('ext', 'mp4')))
+    hooks = []
+    if shared is not None:
+        shared.publish(info)
+        hooks.append(shared.progress_hook)
+    return delivery.fetch(info, path, hooks, label=info.get('extractor_key'),
+                          size=delivery.estimate_bytes(info)[0])
+
+def download_filename(file_path, info):
+    """Title-based filename (including emojis), using the extension of the file
+    actually produced (postprocessing may change it)"""
+    ext = os.path.splitext(file_path)[1].lstrip('.') or info.get('ext', 'mp4')
+    return get_filename_with_title(info.get('title', 'video'), ext)
+
+def shared_download_error(error):
+    """Error response for a download that failed in another request"""
+    import yt_dlp
+    if isinstance(error, yt_dlp.DownloadError):
+        return jsonify({'error': f'Download failed: {str(error)}'}), 400
+    return jsonify({'error': 'Download failed due to server error'}), 500
+
+def serve_shared_download(shared):
+    """Serve a request that attached to a download another request is running"""
+    request_deadline = deadline.current()
+    state = shared.wait_ready(None if request_deadline is None else request_deadline.remaining())
+    if state == 'timeout':
+        shared.release()
+        return deadline.exceeded_response(deadline.DeadlineExceeded(
+            'Timed out waiting for an identical download in progress'))
+    if state == 'failed':
+        shared.release()
+        if prefetch.is_cancellation(shared.error):
+            return None  # a prefetch that gave up; plan the request normally
+        return shared_download_error(shared.error)
+    
+    info = shared.info
+    with timing.phase('serve'):
+        if state == 'done':
+            # The temp dir goes away once every request reading it is done
+            response = file_serving.send(shared.path, download_filename(shared.path, info), shared.release,
+                                         label=info.get('extractor_key'))
+        else:
+            # Follow the file while the other request is still downloading it;
+            # closing the reader releases it
+            response = send_file(shared.open_reader(), as_attachment=True,
+                                 download_name=get_filename_with_title(info.get('title', 'video'), info.get('ext', 'mp4')),
+                                 mimetype='application/octet-stream', conditional=False, etag=False)
+            size = shared.total_bytes
+            if size:
+                response.content_length = size
+            bandwidth.scheduler.throttle_response(response, label=info.get('extractor_key'), size=size)
+    response.headers['X-Shared-Download'] = state
+    delivery.DeliveryPlan(delivery.DOWNLOAD, 'attached to an in-flight download').apply_headers(response)
+    logger.info('shared_download', extra={'fields': {
+        'event': 'shared_download', 'state': state, 'readers': shared.readers,
+    }})
+    return response
+
+def redirect_response(info, plan, follow_redirect=True):
+    """302 to the platform's direct URL, or the same information as JSON"""
+    body = {
+        'success': True,
+        'delivery': plan.as_dict(),
+        'direct_url': info['url'],
+        'filename': get_filename_with_title(info.get('title', 'video'), info.get('ext', 'mp4')),
+        'http_headers': info.get('http_headers') or {},
+    }
+    response = jsonify(body)
+    if follow_redirect:
+        response.status_code = 302
+        response.headers['Location'] = info['url']
+    return plan.apply_headers(response)
+
 @api_bp.route('/download', methods=['POST'])
 def download_video():
-    """Download video with specified options"""
-    temp_file = None
+    """Deliver a video as planned: redirect to it, proxy it or download it server-side"""
+    import yt_dlp
     try:
         data = request.get_json()
         if not data or 'url' not in data:
@@ -87,104 +634,164 @@ def download_video():
             return jsonify({'error': 'Invalid URL format'}), 400
         
         # Parse options
-        format_selector = data.get('format', 'best[height<=720]')
+        format_selector = data.get('format', DEFAULT_FORMAT)
         audio_only = data.get('audio_only', False)
         
-        # Create temporary directory
-        temp_dir = tempfile.mkdtemp()
+        audio_format = data.get('audio_format', 'native')
+        if audio_only and audio_format not in AUDIO_FORMATS:
+            return jsonify({'error': f'Unsupported audio_format, use one of: {", ".join(AUDIO_FORMATS)}'}), 400
+        prefer = data.get('delivery')
+        if prefer not in (None, 'auto') + delivery.STRATEGIES:
+            return jsonify({'error': f'Unsupported delivery, use one of: auto, {", ".join(delivery.STRATEGIES)}'}), 400
         
-        # Configure yt-dlp options with emoji support
-        ydl_opts = {
-            'outtmpl': os.path.join(temp_dir, '%(title)s.%(ext)s'),
-            'quiet': True,
-            'no_warnings': True,
-            'restrictfilenames': False,  # Allow unicode characters and emojis
-            'ignoreerrors': False,  # Don't ignore errors, handle them properly
-            'writesubtitles': False,
-            'writeautomaticsub': False,
-            'no_check_certificate': True,  # Help with some platform issues
-            'extractor_args': {
-                'tiktok': {
-                    'webpage_url_domain': 'tiktok.com'
-                }
-            }
-        }
+        # Attach to an identical download that is already running
+        key = inflight.download_key(url, format_selector, audio_only, audio_format)
+        shared = inflight.registry.attach(key)
+        if shared is not None:
+            prefetch.prefetcher.note_attach(shared)
+            response = serve_shared_download(shared)
+            if response is not None:
+                return response
         
-        if audio_only:
-            ydl_opts['format'] = 'bestaudio/best'
-            ydl_opts['postprocessors'] = [{
-                'key': 'FFmpegExtractAudio',
-                'preferredcodec': 'mp3',
-                'preferredquality': '192',
-            }]
-        else:
-            # Improved format selection for different platforms
-            if 'tiktok.com' in url.lower():
-                # TikTok specific format handling
-                ydl_opts['format'] = 'best[ext=mp4]/mp4/best'
-            elif 'facebook.com' in url.lower() or 'fb.watch' in url.lower():
-                # Facebook format handling
-                ydl_opts['format'] = 'best[ext=mp4]/mp4/best'
-            elif 'instagram.com' in url.lower():
-                # Instagram format handling
-                ydl_opts['format'] = 'best[ext=mp4]/mp4/best'
-            elif 'twitter.com' in url.lower() or 'x.com' in url.lower():
-                # Twitter/X format handling
-                ydl_opts['format'] = 'best[ext=mp4]/mp4/best'
-            else:
-                # For YouTube and other platforms, use user selection
-                ydl_opts['format'] = format_selector
-        
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        try:
+            # TikTok and other fast-path URLs are delivered from the backend's
+            # direct URLs; audio conversions need yt-dlp's format data. A held
+            # off URL is answered before any backend is called
+            negative_cache.hold_off(url)
+            info = None if audio_only else extractor_backends.select(url, format_selector)
+            if info is None:
+                info = select_media(url, format_selector, audio_only, audio_format)
+            extractor = info.get('extractor_backend', 'yt-dlp')
+            
+            @after_this_request
+            def add_extractor(response):
+                response.headers['X-Extractor'] = extractor
+                return response
+            
+            audio_path, preferred_codec = (plan_audio_extraction(info, audio_format) if audio_only
+                                           else (None, None))
+            plan = delivery.plan(info, postprocessed=bool(preferred_codec), prefer=prefer)
+            logger.info('delivery_plan', extra={'fields': {
+                'event': 'delivery_plan', **plan.as_dict(), 'requested': prefer,
+                'extractor': extractor,
+            }})
+            
+            if plan.strategy is None:
+                return jsonify({'error': 'This video cannot be delivered by this server',
+                                'delivery': plan.as_dict()}), 400
+            if plan.strategy == delivery.REDIRECT:
+                return redirect_response(info, plan, data.get('redirect', True))
+            if plan.strategy == delivery.PROXY:
+                response = delivery.proxy_response(
+                    info, get_filename_with_title(info.get('title', 'video'), info.get('ext', 'mp4')),
+                    label=info.get('extractor_key'), size=plan.estimated_bytes)
+                if audio_path:
+                    response.headers['X-Audio-Path'] = audio_path
+                return plan.apply_headers(response)
+        except negative_cache.CachedFailure as e:
+            return negative_cache.failure_response(e, 'Download failed')
+        except deadline.DeadlineExceeded as e:
+            return deadline.exceeded_response(e)
+        except yt_dlp.DownloadError as e:
+            logger.error("yt-dlp download error: %s", e)
+            return jsonify({'error': f'Download failed: {str(e)}'}), 400
+        except Exception as e:
+            logger.error("Unexpected error during download: %s", e)
+            return jsonify({'error': 'Download failed due to server error'}), 500
+        
+        # Server-side download, shared with identical requests arriving meanwhile
+        while True:
+            shared, leader = inflight.registry.acquire(key)
+            if leader:
+                break
+            response = serve_shared_download(shared)
+            if response is not None:
+                return response
+        
+        response = None
+        try:
             try:
-                # Extract info first
-                info = ydl.extract_info(url, download=False)
-                title = info.get('title', 'video')
-                ext = info.get('ext', 'mp4')
-                
-                # Generate filename with title (including emojis)
-                from utils import get_filename_with_title
-                desired_filename = get_filename_with_title(title, ext)
-                
-                # Download the video
-                ydl.download([url])
-                
-                # Find the downloaded file
-                files = os.listdir(temp_dir)
-                if not files:
-                    return jsonify({'error': 'Download completed but no file found'}), 500
-                
-                temp_file = os.path.join(temp_dir, files[0])
-                
-                # Get file info
-                file_size = os.path.getsize(temp_file)
-                
-                # Use the sanitized title as download filename
-                return send_file(
-                    temp_file,
-                    as_attachment=True,
-                    download_name=desired_filename,  # Use title-based filename
-                    mimetype='application/octet-stream'
-                )
-                
-            except yt_dlp.DownloadError as e:
-                logger.error(f"yt-dlp download error: {str(e)}")
-                return jsonify({'error': f'Download failed: {str(e)}'}), 400
-            except Exception as e:
-                logger.error(f"Unexpected error during download: {str(e)}")
-                return jsonify({'error': 'Download failed due to server error'}), 500
-                
+                temp_file, info, audio_path = download_media(url, shared.temp_dir, format_selector, audio_only,
+                                                             audio_format, shared=shared, info=info)
+            except BaseException as e:
+                shared.fail(e)
+                raise
+            shared.finish(temp_file, info)
+            if temp_file is None:
+                return jsonify({'error': 'Download completed but no file found'}), 500
+            
+            # Get file info
+            file_size = os.path.getsize(temp_file)
+            
+            # Use the sanitized title as download filename; the temp dir goes
+            # away once every request reading it is done
+            with timing.phase('serve'):
+                response = file_serving.send(temp_file, download_filename(temp_file, info), shared.release,
+                                             label=info.get('extractor_key'))
+            plan.apply_headers(response)
+            
+            if audio_path:
+                response.headers['X-Audio-Path'] = audio_path
+                response.headers['X-Audio-Codec'] = audio_codec_family(info.get('acodec')) or 'unknown'
+                logger.info('audio_delivery', extra={'fields': {
+                    'event': 'audio_delivery',
+                    'path': audio_path,
+                    'requested': audio_format,
+                    'source_acodec': info.get('acodec'),
+                    'source_ext': info.get('ext'),
+                    'bytes': file_size,
+                }})
+            return response
+            
+        except yt_dlp.DownloadError as e:
+            logger.error("yt-dlp download error: %s", e)
+            return jsonify({'error': f'Download failed: {str(e)}'}), 400
+        except Exception as e:
+            logger.error("Unexpected error during download: %s", e)
+            return jsonify({'error': 'Download failed due to server error'}), 500
+        finally:
+            if response is None:
+                shared.release()
+            
     except Exception as e:
-        logger.error(f"Error in download_video: {str(e)}")
+        logger.error("Error in download_video: %s", e)
         return jsonify({'error': 'Internal server error'}), 500
-    finally:
-        # Cleanup temporary files
-        if temp_file and os.path.exists(temp_file):
-            cleanup_file(temp_file)
+
+@api_bp.route('/download/archive', methods=['POST'])
+def download_archive():
+    """Download several URLs concurrently and stream them back as one ZIP"""
+    data = request.get_json()
+    if not data or not isinstance(data.get('urls'), list) or not data['urls']:
+        return jsonify({'error': 'urls must be a non-empty list'}), 400
+    
+    urls = [str(url).strip() for url in data['urls']]
+    if len(urls) > ARCHIVE_MAX_URLS:
+        return jsonify({'error': f'At most {ARCHIVE_MAX_URLS} URLs per archive'}), 400
+    invalid = [url for url in urls if not validate_url(url)]
+    if invalid:
+        return jsonify({'error': 'Invalid URL format', 'urls': invalid}), 400
+    
+    format_selector = data.get('format', DEFAULT_FORMAT)
+    audio_only = data.get('audio_only', False)
+    audio_format = data.get('audio_format', 'native')
+    if audio_only and audio_format not in AUDIO_FORMATS:
+        return jsonify({'error': f'Unsupported audio_format, use one of: {", ".join(AUDIO_FORMATS)}'}), 400
+    
+    def download(url, temp_dir):
+        path, info, _ = download_media(url, temp_dir, format_selector, audio_only, audio_format)
+        return path, download_filename(path, info) if path else None
+    
+    body = archive.stream_archive(urls, download, ARCHIVE_WORKERS)
+    if bandwidth.scheduler.limits['egress']:
+        body = bandwidth.scheduler.throttle(body, label='archive')
+    response = Response(stream_with_context(body), mimetype='application/zip')
+    response.headers['Content-Disposition'] = 'attachment; filename="videos.zip"'
+    return response
 
 @api_bp.route('/formats', methods=['POST'])
 def get_available_formats():
     """Get available formats for a video"""
+    import yt_dlp
     try:
         data = request.get_json()
         if not data or 'url' not in data:
@@ -200,39 +807,33 @@ def get_available_formats():
             'listformats': True,
         }
         
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            try:
-                info = ydl.extract_info(url, download=False)
-                formats = []
-                
-                for fmt in info.get('formats', []):
-                    format_info = {
-                        'format_id': fmt.get('format_id'),
-                        'ext': fmt.get('ext'),
-                        'resolution': fmt.get('resolution', 'audio only' if fmt.get('vcodec') == 'none' else 'unknown'),
-                        'filesize': fmt.get('filesize'),
-                        'fps': fmt.get('fps'),
-                        'vcodec': fmt.get('vcodec'),
-                        'acodec': fmt.get('acodec'),
-                        'format_note': fmt.get('format_note', '')
-                    }
-                    formats.append(format_info)
-                
-                return jsonify({
-                    'success': True,
-                    'formats': formats,
-                    'title': info.get('title', 'Unknown')
-                })
-                
-            except yt_dlp.DownloadError as e:
-                logger.error(f"yt-dlp error: {str(e)}")
-                return jsonify({'error': f'Failed to get formats: {str(e)}'}), 400
-                
+        try:
+            info = extract_metadata(url, ydl_opts)
+            formats = []
+            
+            for fmt in info.get('formats', []):
+                formats.append(build_format_record(fmt))
+            
+            return jsonify({
+                'success': True,
+                'formats': formats,
+                'title': info.get('title', 'Unknown')
+            })
+            
+        except negative_cache.CachedFailure as e:
+            return negative_cache.failure_response(e, 'Failed to get formats')
+        except deadline.DeadlineExceeded as e:
+            return deadline.exceeded_response(e)
+        except yt_dlp.DownloadError as e:
+            logger.error("yt-dlp error: %s", e)
+            return jsonify({'error': f'Failed to get formats: {str(e)}'}), 400
+            
     except Exception as e:
-        logger.error(f"Error in get_available_formats: {str(e)}")
+        logger.error("Error in get_available_formats: %s", e)
         return jsonify({'error': 'Internal server error'}), 500
 
 @api_bp.route('/supported-platforms')
+@http_cache.cache_control(http_cache.STATIC)
 def supported_platforms():
     """Get list of supported platforms"""
     return jsonify({
@@ -241,7 +842,25 @@ def supported_platforms():
         'total': len(SUPPORTED_PLATFORMS)
     })
 
+@api_bp.route('/thumbnail/<key>')
+def thumbnail(key):
+    """Serve a cached, optionally downsized thumbnail (?w=<width>)"""
+    return thumbnails.serve(key)
+
+@api_bp.route('/metrics')
+@http_cache.cache_control(http_cache.NO_STORE)
+def metrics():
+    """Runtime metrics for the download pipeline"""
+    return jsonify({
+        'bandwidth': bandwidth.stats(),
+        'fragments': fragment_control.stats(),
+        'inflight': inflight.stats(),
+        'prefetch': prefetch.stats(),
+        'postprocess': postprocess_pool.stats()
+    })
+
 @api_bp.route('/health')
+@http_cache.cache_control(http_cache.NO_STORE)
 def health_check():
     """Health check endpoint"""
     return jsonify({
@@ -5,12 +5,24 @@ This version addresses serverless limitations and timeouts
 import os
 import tempfile
 import logging
-from flask import Blueprint, request, jsonify, Response, stream_template
-import yt_dlp
-from utils import validate_url, cleanup_file, sanitize_filename, get_filename_with_title
+from flask import Blueprint, request, jsonify, Response, stream_template, after_this_request
+from utils import (validate_url, sanitize_filename, get_filename_with_title,
+                   build_format_record, parse_fields, project_fields)
+import timing
+import thumbnails
+import http_cache
+import metadata_store
+import negative_cache
+import deadline
+import delivery
+import extractor_backends
 
 logger = logging.getLogger(__name__)
 
+# yt_dlp is imported only where extraction actually runs, so cold starts that
+# only serve /health or the platform list, and requests answered from the
+# metadata store, never pay for importing it
+
 # Create Blueprint for API routes
 api_bp = Blueprint('api', __name__, url_prefix='/api')
 
@@ -61,7 +73,78 @@ def get_supported_platforms():
         'Facebook', 'Vimeo', 'Dailymotion', 'Twitch'
     ]
 
+def simplify_formats(formats):
+    """Keep one video format per height, sorted by quality (highest first)"""
+    simplified_formats = []
+    seen_qualities = set()
+    
+    for fmt in formats:
+        if fmt.get('vcodec') != 'none':  # Video formats only
+            height = fmt.get('height')
+            # Fast-path backends (TikWM) name their formats instead of giving heights
+            quality = f"{height}p" if height else fmt.get('format_note')
+            if quality and quality not in seen_qualities:
+                simplified_formats.append({
+                    'format_id': fmt.get('format_id'),
+                    'height': height,
+                    'width': fmt.get('width'),
+                    'ext': fmt.get('ext'),
+                    'filesize': fmt.get('filesize'),
+                    'quality': quality
+                })
+                seen_qualities.add(quality)
+    
+    # Sort by quality (highest first); named formats keep the backend's order
+    simplified_formats.sort(key=lambda x: x.get('height') or 0, reverse=True)
+    return simplified_formats
+
+def build_info_response(info, url):
+    """Essential metadata for /info and /inspect"""
+    return {
+        'title': info.get('title', 'Unknown'),
+        'duration': info.get('duration'),
+        'uploader': info.get('uploader'),
+        'view_count': info.get('view_count'),
+        'upload_date': info.get('upload_date'),
+        'description': info.get('description', '')[:500] if info.get('description') else '',  # Truncate description
+        'thumbnail': info.get('thumbnail'),
+        'thumbnail_url': thumbnails.proxy_url(info.get('thumbnail'), info.get('webpage_url', url)),
+        'webpage_url': info.get('webpage_url'),
+        'extractor': info.get('extractor')
+    }
+
+def extract_metadata(url, ydl_opts):
+    """VideoMetadata for a URL, served from the metadata store when possible;
+    fast-path extractor backends (TikWM for TikTok) are tried before yt-dlp"""
+    import yt_dlp
+    extractor = None
+
+    def extract():
+        nonlocal extractor
+        backend, metadata = extractor_backends.extract(url)
+        if metadata is not None:
+            extractor = backend.name
+            return metadata
+        extractor = 'yt-dlp'
+        with yt_dlp.YoutubeDL(deadline.ydl_opts(ydl_opts)) as ydl:
+            timing.instrument_ydl(ydl)
+            deadline.instrument_ydl(ydl)
+            with timing.phase('extract'):
+                return deadline.call(lambda: ydl.extract_info(url, download=False))
+
+    info, cache_state = metadata_store.get_or_extract(url, lambda: negative_cache.guard(url, extract))
+
+    @after_this_request
+    def add_cache_state(response):
+        response.headers['X-Metadata-Cache'] = cache_state
+        if extractor:
+            response.headers['X-Extractor'] = extractor
+        return response
+
+    return info
+
 @api_bp.route('/health', methods=['GET'])
+@http_cache.cache_control(http_cache.NO_STORE)
 def health_check():
     """Health check endpoint - optimized for serverless"""
     return jsonify({
@@ -72,6 +155,7 @@ def health_check():
     })
 
 @api_bp.route('/platforms', methods=['GET'])
+@http_cache.cache_control(http_cache.STATIC)
 def get_platforms():
     """Get supported platforms - cached response"""
     return jsonify({
@@ -79,6 +163,11 @@ def get_platforms():
         'total': len(get_supported_platforms())
     })
 
+@api_bp.route('/thumbnail/<key>', methods=['GET'])
+def thumbnail(key):
+    """Serve a cached, optionally downsized thumbnail (?w=<width>)"""
+    return thumbnails.serve(key)
+
 @api_bp.route('/info', methods=['POST'])
 def get_video_info():
     """Get video metadata - optimized for fast response"""
@@ -100,31 +189,75 @@ def get_video_info():
             'youtube_include_dash_manifest': False,
         }
         
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        try:
+            info = extract_metadata(url, ydl_opts)
+            
+            # Return essential info only to reduce response time
+            return jsonify(build_info_response(info, url))
+            
+        except negative_cache.CachedFailure as e:
+            return negative_cache.failure_response(e, 'Failed to extract video info')
+        except deadline.DeadlineExceeded as e:
+            return deadline.exceeded_response(e)
+        except Exception as e:
+            logger.error("yt-dlp extraction error: %s", e)
+            return jsonify({'error': f'Failed to extract video info: {str(e)}'}), 400
+            
+    except Exception as e:
+        logger.error("Video info error: %s", e)
+        return jsonify({'error': 'Internal server error'}), 500
+
+@api_bp.route('/inspect', methods=['GET', 'POST'])
+@http_cache.cache_control(http_cache.METADATA)
+def inspect_video():
+    """Metadata and formats from a single extraction, with optional field projection"""
+    try:
+        # GET (?url=&fields=) responses can be cached by browsers and the edge
+        data = request.args.to_dict() if request.method == 'GET' else request.get_json()
+        if not data or 'url' not in data:
+            return jsonify({'error': 'URL is required'}), 400
+        
+        url = data['url']
+        if not validate_url(url):
+            return jsonify({'error': 'Invalid URL format'}), 400
+        
+        try:
+            fields = parse_fields(data.get('fields', request.args.get('fields')))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        ydl_opts = {
+            'quiet': True,
+            'no_warnings': True,
+            'socket_timeout': 20,
+            'extract_flat': False,
+            'youtube_include_dash_manifest': False,
+        }
+        
+        try:
+            info = extract_metadata(url, ydl_opts)
+            
+            document = build_info_response(info, url)
+            document['platform'] = info.get('extractor_key', 'Unknown')
+            document['formats_available'] = len(info.get('formats', []))
+            document['formats'] = [build_format_record(fmt) for fmt in info.get('formats', [])]
             try:
-                info = ydl.extract_info(url, download=False)
-                
-                # Return essential info only to reduce response time
-                response_data = {
-                    'title': info.get('title', 'Unknown'),
-                    'duration': info.get('duration'),
-                    'uploader': info.get('uploader'),
-                    'view_count': info.get('view_count'),
-                    'upload_date': info.get('upload_date'),
-                    'description': info.get('description', '')[:500] if info.get('description') else '',  # Truncate description
-                    'thumbnail': info.get('thumbnail'),
-                    'webpage_url': info.get('webpage_url'),
-                    'extractor': info.get('extractor')
-                }
-                
-                return jsonify(response_data)
-                
-            except Exception as e:
-                logger.error(f"yt-dlp extraction error: {str(e)}")
-                return jsonify({'error': f'Failed to extract video info: {str(e)}'}), 400
-                
+                document = project_fields(document, fields)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            
+            return jsonify({'success': True, **document})
+            
+        except negative_cache.CachedFailure as e:
+            return negative_cache.failure_response(e, 'Failed to inspect video')
+        except deadline.DeadlineExceeded as e:
+            return deadline.exceeded_response(e)
+        except Exception as e:
+            logger.error("Inspect extraction error: %s", e)
+            return jsonify({'error': f'Failed to inspect video: {str(e)}'}), 400
+            
     except Exception as e:
-        logger.error(f"Video info error: {str(e)}")
+        logger.error("Inspect error: %s", e)
         return jsonify({'error': 'Internal server error'}), 500
 
 @api_bp.route('/formats', methods=['POST'])
@@ -147,49 +280,67 @@ def get_available_formats():
             'listformats': False,
         }
         
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            try:
-                info = ydl.extract_info(url, download=False)
-                formats = info.get('formats', [])
-                
-                # Filter and simplify formats for Vercel
-                simplified_formats = []
-                seen_qualities = set()
-                
-                for fmt in formats:
-                    if fmt.get('vcodec') != 'none':  # Video formats only
-                        height = fmt.get('height')
-                        if height and height not in seen_qualities:
-                            simplified_formats.append({
-                                'format_id': fmt.get('format_id'),
-                                'height': height,
-                                'width': fmt.get('width'),
-                                'ext': fmt.get('ext'),
-                                'filesize': fmt.get('filesize'),
-                                'quality': f"{height}p" if height else 'Unknown'
-                            })
-                            seen_qualities.add(height)
-                
-                # Sort by quality (highest first)
-                simplified_formats.sort(key=lambda x: x.get('height', 0), reverse=True)
-                
-                return jsonify({
-                    'formats': simplified_formats[:10],  # Limit to top 10 formats
-                    'total': len(simplified_formats)
-                })
-                
-            except Exception as e:
-                logger.error(f"Format extraction error: {str(e)}")
-                return jsonify({'error': f'Failed to get formats: {str(e)}'}), 400
-                
+        try:
+            info = extract_metadata(url, ydl_opts)
+            formats = info.get('formats', [])
+            
+            simplified_formats = simplify_formats(formats)
+            
+            return jsonify({
+                'formats': simplified_formats[:10],  # Limit to top 10 formats
+                'total': len(simplified_formats)
+            })
+            
+        except negative_cache.CachedFailure as e:
+            return negative_cache.failure_response(e, 'Failed to get formats')
+        except deadline.DeadlineExceeded as e:
+            return deadline.exceeded_response(e)
+        except Exception as e:
+            logger.error("Format extraction error: %s", e)
+            return jsonify({'error': f'Failed to get formats: {str(e)}'}), 400
+            
     except Exception as e:
-        logger.error(f"Formats error: {str(e)}")
+        logger.error("Formats error: %s", e)
         return jsonify({'error': 'Internal server error'}), 500
 
+def select_redirect_target(url, format_selector, allowed):
+    """(info, target format, plan) for a redirect; fast-path backends (TikWM
+    for TikTok) answer with direct URLs before yt-dlp is started"""
+    import yt_dlp
+    
+    negative_cache.hold_off(url)
+    target = extractor_backends.select(url, format_selector)
+    if target is not None:
+        return target, target, delivery.plan(target, allowed=allowed)
+    
+    # Vercel-optimized download options; nothing is written, and extraction
+    # errors are raised (ignoreerrors would turn them into a None result)
+    ydl_opts = get_vercel_ydl_opts(format_selector, url=url)
+    ydl_opts['ignoreerrors'] = False
+    
+    with yt_dlp.YoutubeDL(deadline.ydl_opts(ydl_opts)) as ydl:
+        timing.instrument_ydl(ydl)
+        deadline.instrument_ydl(ydl)
+        # Quick info extraction first
+        with timing.phase('extract'):
+            info = negative_cache.guard(
+                url, lambda: deadline.call(lambda: ydl.extract_info(url, download=False)))
+    if info is None:
+        raise yt_dlp.DownloadError('No video information could be extracted')
+    target = info
+    with timing.phase('select-format'):
+        plan = delivery.plan(target, allowed=allowed)
+        if plan.strategy != delivery.REDIRECT:
+            # The selection needs merging or a manifest; fall back to a single file
+            fallback = delivery.best_progressive(info, max_height=720)
+            if fallback is not None:
+                target = fallback
+                plan = delivery.plan(target, allowed=allowed)
+    return info, target, plan
+
 @api_bp.route('/download', methods=['POST'])
 def download_video():
     """Download video - with Vercel timeout protection"""
-    temp_file = None
     try:
         data = request.get_json()
         if not data or 'url' not in data:
@@ -201,71 +352,54 @@ def download_video():
         
         format_selector = data.get('quality', 'best[height<=720]')  # Default to 720p for speed
         
-        # Create temporary directory
-        temp_dir = tempfile.mkdtemp()
-        
-        # Vercel-optimized download options
-        ydl_opts = get_vercel_ydl_opts(format_selector, temp_dir, url)
-        
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            try:
-                # Quick info extraction first
-                info = ydl.extract_info(url, download=False)
-                title = info.get('title', 'video')
-                ext = info.get('ext', 'mp4')
-                
-                # Generate filename with title (including emojis)
-                filename_with_title = get_filename_with_title(title, ext)
-                
-                # Check if video is too long for Vercel (suggest direct link instead)
-                duration = info.get('duration')
-                if duration and duration > 600:  # 10 minutes
-                    return jsonify({
-                        'error': 'Video too long for serverless download',
-                        'suggestion': 'Use direct video URL',
-                        'direct_url': info.get('url'),
-                        'title': title,
-                        'filename': filename_with_title,
-                        'duration': duration
-                    }), 400
-                
-                # For Vercel, return the direct video URL instead of downloading
-                # This avoids timeout and storage limitations
-                formats = info.get('formats', [])
-                if formats:
-                    # Find best format within limits
-                    suitable_format = None
-                    for fmt in formats:
-                        if (fmt.get('vcodec') != 'none' and 
-                            fmt.get('height', 0) <= 720 and
-                            fmt.get('filesize', 0) < 50*1024*1024):  # 50MB limit
-                            suitable_format = fmt
-                            break
-                    
-                    if suitable_format:
-                        return jsonify({
-                            'success': True,
-                            'title': title,
-                            'filename': filename_with_title,  # Include filename with emojis
-                            'direct_url': suitable_format.get('url'),
-                            'format': suitable_format.get('format_note', 'Unknown'),
-                            'filesize': suitable_format.get('filesize'),
-                            'note': 'Direct video URL provided for Vercel compatibility'
-                        })
-                
-                return jsonify({'error': 'No suitable format found for serverless download'}), 400
-                
-            except Exception as e:
-                logger.error(f"Download error: {str(e)}")
-                return jsonify({'error': f'Download failed: {str(e)}'}), 400
+        try:
+            # Serverless functions can't hold long transfers, so the only way to
+            # deliver here is pointing the client at the direct URL
+            redirect_allowed = delivery.REDIRECT in delivery.allowed_strategies((delivery.REDIRECT,))
+            allowed = (delivery.REDIRECT,) if redirect_allowed else ()
+            if not allowed:
+                return jsonify({
+                    'error': 'Redirect delivery disabled; it is the only delivery available here '
+                             '(see DELIVERY_STRATEGIES)'
+                }), 503
+            info, target, plan = select_redirect_target(url, format_selector, allowed)
+            
+            if plan.strategy != delivery.REDIRECT:
+                return jsonify({
+                    'error': 'No suitable format found for serverless download',
+                    'delivery': plan.as_dict()
+                }), 400
+            
+            # Generate filename with title (including emojis)
+            filename_with_title = get_filename_with_title(info.get('title', 'video'), target.get('ext', 'mp4'))
+            response = jsonify({
+                'success': True,
+                'title': info.get('title', 'video'),
+                'filename': filename_with_title,  # Include filename with emojis
+                'direct_url': target['url'],
+                'format': target.get('format_note', 'Unknown'),
+                'filesize': plan.estimated_bytes,
+                'duration': info.get('duration'),
+                'delivery': plan.as_dict(),
+                'note': 'Direct video URL provided for Vercel compatibility'
+            })
+            response.headers['X-Extractor'] = target.get('extractor_backend', 'yt-dlp')
+            if data.get('redirect'):
+                response.status_code = 302
+                response.headers['Location'] = target['url']
+            return plan.apply_headers(response)
+            
+        except negative_cache.CachedFailure as e:
+            return negative_cache.failure_response(e, 'Download failed')
+        except deadline.DeadlineExceeded as e:
+            return deadline.exceeded_response(e)
+        except Exception as e:
+            logger.error("Download error: %s", e)
+            return jsonify({'error': f'Download failed: {str(e)}'}), 400
                 
     except Exception as e:
-        logger.error(f"Download endpoint error: {str(e)}")
+        logger.error("Download endpoint error: %s", e)
         return jsonify({'error': 'Internal server error'}), 500
-    finally:
-        # Cleanup
-        if temp_file and os.path.exists(temp_file):
-            cleanup_file(temp_file)
 
 @api_bp.errorhandler(404)
 def not_found(error):
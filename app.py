@@ -2,24 +2,42 @@ import os
 import logging
 from flask import Flask
 from werkzeug.middleware.proxy_fix import ProxyFix
-from flask_limiter import Limiter
-from flask_limiter.util import get_remote_address
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+# Configure logging (queued, sampled, structured - see log_config.py)
+from log_config import configure_logging, init_app as init_logging
+configure_logging()
 logger = logging.getLogger(__name__)
 
 # Create the app
 app = Flask(__name__)
 app.secret_key = os.environ.get("SESSION_SECRET", "dev-secret-key-change-in-production")
 app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
+init_logging(app)
 
-# Configure rate limiter (disabled for unlimited access)
-limiter = Limiter(
-    key_func=get_remote_address,
-    default_limits=[]
-)
-limiter.init_app(app)
+# Configure rate limiter (disabled for unlimited access). flask_limiter is
+# only imported when a default limit is configured, e.g. RATELIMIT_DEFAULT="100/hour"
+limiter = None
+if os.environ.get('RATELIMIT_DEFAULT'):
+    from flask_limiter import Limiter
+    from flask_limiter.util import get_remote_address
+    limiter = Limiter(
+        key_func=get_remote_address,
+        default_limits=[os.environ['RATELIMIT_DEFAULT']]
+    )
+    limiter.init_app(app)
+
+# ETags, Cache-Control and compression; registered before timing so it runs
+# after the timing echo has been added to the body
+import http_cache
+http_cache.init_app(app)
+
+# Per-request phase timing (Server-Timing headers)
+import timing
+timing.init_app(app)
+
+# End-to-end deadline carried by every request (REQUEST_DEADLINE / X-Request-Timeout)
+import deadline
+deadline.init_app(app)
 
 # Import and register blueprints
 from api import api_bp
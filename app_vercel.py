@@ -6,11 +6,9 @@ import logging
 from flask import Flask, render_template, jsonify
 from werkzeug.middleware.proxy_fix import ProxyFix
 
-# Configure logging for Vercel
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# Configure logging for Vercel (queued, sampled, structured - see log_config.py)
+from log_config import configure_logging, init_app as init_logging
+configure_logging()
 
 # Create Flask app
 app = Flask(__name__)
@@ -18,6 +16,22 @@ app.secret_key = os.environ.get("SESSION_SECRET", "vercel-fallback-secret-key")
 
 # Add ProxyFix for Vercel deployment
 app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
+init_logging(app)
+
+# ETags, Cache-Control and compression; registered before timing so it runs
+# after the timing echo has been added to the body
+import http_cache
+http_cache.init_app(app)
+
+# Per-request phase timing (Server-Timing headers)
+import timing
+timing.init_app(app)
+
+# End-to-end deadline carried by every request; the function is killed at
+# vercel.json's maxDuration, so work is planned to finish before that
+import deadline
+VERCEL_MAX_DURATION = 60
+deadline.init_app(app, platform_limit=VERCEL_MAX_DURATION - 5)
 
 # Import Vercel-optimized API routes
 try:
@@ -25,7 +39,7 @@ try:
     app.register_blueprint(api_bp)
     logging.info("Vercel API blueprint registered successfully")
 except ImportError as e:
-    logging.error(f"Failed to import Vercel API blueprint: {e}")
+    logging.error("Failed to import Vercel API blueprint: %s", e)
     # Fallback to regular API if available
     try:
         from api import api_bp
@@ -38,7 +52,7 @@ except ImportError as e:
 @app.errorhandler(Exception)
 def handle_exception(e):
     """Handle unexpected exceptions in serverless environment"""
-    logging.error(f"Unhandled exception: {str(e)}")
+    logging.error("Unhandled exception: %s", e)
     return jsonify({
         'error': 'Internal server error',
         'message': 'Something went wrong processing your request'
@@ -51,7 +65,7 @@ def index():
     try:
         return render_template('index.html')
     except Exception as e:
-        logging.error(f"Template error: {e}")
+        logging.error("Template error: %s", e)
         return jsonify({
             'service': 'yt-dlp API (Vercel)',
             'status': 'running',
@@ -71,7 +85,7 @@ def docs():
     try:
         return render_template('docs.html')
     except Exception as e:
-        logging.error(f"Documentation template error: {e}")
+        logging.error("Documentation template error: %s", e)
         return jsonify({
             'documentation': 'Template not found',
             'api_info': 'Visit /api/health for API status',
@@ -0,0 +1,108 @@
+"""
+Streaming ZIP archives for multi-URL downloads
+Members are written in store mode (media is already compressed) to an
+unseekable sink, so every chunk can be sent to the client as soon as it is
+written; sizes and CRCs go in data descriptors after each member. Nothing but
+the member currently being copied is ever held, and only in small chunks.
+"""
+import logging
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class ChunkSink:
+    """Write-only, unseekable file object that hands written bytes back to a generator"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def unique_name(name, used):
+    """De-duplicate archive member names: "a.mp4", "a (2).mp4", ..."""
+    stem, ext = os.path.splitext(name)
+    candidate, counter = name, 2
+    while candidate.lower() in used:
+        candidate = f'{stem} ({counter}){ext}'
+        counter += 1
+    used.add(candidate.lower())
+    return candidate
+
+
+def stream_archive(urls, download, workers=3):
+    """
+    Download urls concurrently with download(url, temp_dir) -> (path, filename)
+    and yield a ZIP archive of the results in completion order. Failed URLs are
+    listed in an errors.txt member. Closing the generator cancels queued
+    downloads and removes their temp files.
+    """
+    sink = ChunkSink()
+    archive = zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_STORED, allowZip64=True)
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='archive')
+    temp_dirs = {}
+    futures = {}
+    for url in urls:
+        temp_dir = tempfile.mkdtemp()
+        future = pool.submit(download, url, temp_dir)
+        temp_dirs[future] = temp_dir
+        futures[future] = url
+
+    used_names = set()
+    errors = []
+    try:
+        for future in as_completed(futures):
+            url = futures[future]
+            try:
+                path, filename = future.result()
+                if path is None:
+                    raise FileNotFoundError('Download completed but no file found')
+            except Exception as e:
+                logger.warning("Archive member failed for %s: %s", url, e)
+                errors.append(f'{url}: {e}')
+                shutil.rmtree(temp_dirs.pop(future), ignore_errors=True)
+                continue
+
+            member = zipfile.ZipInfo(unique_name(filename, used_names), time.localtime()[:6])
+            member.compress_type = zipfile.ZIP_STORED
+            member.file_size = os.path.getsize(path)
+            with open(path, 'rb') as source, archive.open(member, 'w') as target:
+                while True:
+                    chunk = source.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    target.write(chunk)
+                    data = sink.drain()
+                    if data:
+                        yield data
+            # Member trailer (data descriptor)
+            yield sink.drain()
+            shutil.rmtree(temp_dirs.pop(future), ignore_errors=True)
+
+        if errors:
+            archive.writestr('errors.txt', '\n'.join(errors) + '\n')
+        archive.close()
+        yield sink.drain()
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+        # Downloads still running when the client went away clean up after themselves
+        for future, temp_dir in temp_dirs.items():
+            future.add_done_callback(lambda _, temp_dir=temp_dir: shutil.rmtree(temp_dir, ignore_errors=True))
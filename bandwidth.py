@@ -0,0 +1,285 @@
+"""
+Process-wide bandwidth scheduler
+Every transfer that moves media bytes registers here: yt-dlp downloads as
+ingress, files and archives streamed to clients as egress. Each direction
+has an optional global cap, shared between its active transfers by weighted
+max-min fairness. Small (interactive) transfers get a larger weight so a
+short clip isn't starved by a 4K download, and transfers that can't use
+their whole share hand the rest to the others. Shares are recomputed when
+transfers come and go and about once a second while they run; yt-dlp
+downloads pick up the new rate through their ratelimit option, streamed
+responses are paced by the scheduler itself.
+
+Environment variables:
+    BANDWIDTH_INGRESS_LIMIT  Global download cap in bytes/s (default unlimited)
+    BANDWIDTH_EGRESS_LIMIT   Global cap on bytes sent to clients in bytes/s (default unlimited)
+    BANDWIDTH_SMALL_BYTES    Transfers up to this size count as interactive (default 25 MB)
+"""
+import itertools
+import os
+import threading
+import time
+
+DIRECTIONS = ('ingress', 'egress')
+# Weight of interactive transfers relative to bulk ones
+INTERACTIVE_WEIGHT = 4.0
+# Clips of unknown size up to this duration count as interactive
+INTERACTIVE_SECONDS = 180
+REBALANCE_INTERVAL = 1.0
+# A transfer using less than this fraction of its share is limited elsewhere
+# (CDN, client); its demand is then estimated from what it actually moved
+UNDERUSE_RATIO = 0.8
+DEMAND_HEADROOM = 1.25
+# Paced streams may send this much time's worth of bytes in a burst
+BURST_SECONDS = 0.25
+MIN_RATE = 16 * 1024
+
+
+def _limit(name):
+    value = int(os.environ.get(name, 0) or 0)
+    return value if value > 0 else None
+
+
+def fair_shares(capacity, transfers):
+    """
+    Weighted max-min fair split of `capacity` between transfers, given as
+    {key: (weight, demand)} with demand None for "as much as possible".
+    """
+    shares = {}
+    remaining = float(capacity)
+    active = dict(transfers)
+    while active:
+        total_weight = sum(weight for weight, _ in active.values())
+        satisfied = {key: demand for key, (weight, demand) in active.items()
+                     if demand is not None and demand <= remaining * weight / total_weight}
+        if not satisfied:
+            for key, (weight, _) in active.items():
+                shares[key] = remaining * weight / total_weight
+            break
+        for key, demand in satisfied.items():
+            shares[key] = demand
+            remaining -= demand
+            del active[key]
+    return shares
+
+
+def expected_size(info):
+    """Best guess of the bytes a download will move, or None"""
+    formats = info.get('requested_formats') or [info]
+    sizes = [fmt.get('filesize') or fmt.get('filesize_approx') for fmt in formats]
+    if all(sizes):
+        return sum(sizes)
+    return None
+
+
+def is_interactive(size=None, duration=None, small_bytes=None):
+    if size is not None:
+        return size <= small_bytes
+    return duration is not None and duration <= INTERACTIVE_SECONDS
+
+
+class Transfer:
+    """One registered transfer; `rate` is its current share in bytes/s (None when uncapped)"""
+
+    def __init__(self, scheduler, key, direction, label, weight, interactive):
+        self.scheduler = scheduler
+        self.key = key
+        self.direction = direction
+        self.label = label
+        self.weight = weight
+        self.interactive = interactive
+        self.rate = None
+        self.bytes = 0
+        self.measured = None
+        self._window_bytes = 0
+        self._window_start = time.monotonic()
+        self._next_send = 0.0
+        self._ydl_params = None
+        self._seen = {}
+        self._released = False
+
+    def record(self, nbytes):
+        """Account for bytes moved by someone else (e.g. yt-dlp)"""
+        self.bytes += nbytes
+        self._window_bytes += nbytes
+        self.scheduler.maybe_rebalance()
+
+    def consume(self, nbytes):
+        """Account for bytes about to be sent and wait until the share allows it"""
+        self.record(nbytes)
+        rate = self.rate
+        if not rate:
+            return
+        now = time.monotonic()
+        self._next_send = max(self._next_send, now - BURST_SECONDS) + nbytes / rate
+        delay = self._next_send - now
+        if delay > 0:
+            time.sleep(delay)
+
+    def progress_hook(self, status):
+        filename = status.get('filename')
+        downloaded = status.get('downloaded_bytes') or 0
+        delta = downloaded - self._seen.get(filename, 0)
+        if delta > 0:
+            self._seen[filename] = downloaded
+            self.record(delta)
+
+    def instrument(self, ydl):
+        """Let a YoutubeDL follow this transfer's share (call after the fragment concurrency is set)"""
+        self._ydl_params = ydl.params
+        self.apply()
+        ydl.add_progress_hook(self.progress_hook)
+        return ydl
+
+    def apply(self):
+        """Push the current share to the yt-dlp downloader, split across its fragment threads"""
+        params = self._ydl_params
+        if params is None:
+            return
+        if self.rate is None:
+            params.pop('ratelimit', None)
+            return
+        fragments = max(1, int(params.get('concurrent_fragment_downloads') or 1))
+        params['ratelimit'] = max(MIN_RATE, int(self.rate / fragments))
+
+    def release(self):
+        if self._released:
+            return
+        self._released = True
+        self.scheduler.release(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class ThrottledStream:
+    """Response iterable that paces its chunks through an egress transfer"""
+
+    def __init__(self, chunks, transfer):
+        self._source = chunks
+        self._chunks = iter(chunks)
+        self.transfer = transfer
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        chunk = next(self._chunks)
+        self.transfer.consume(len(chunk))
+        return chunk
+
+    def close(self):
+        try:
+            close = getattr(self._source, 'close', None)
+            if close is not None:
+                close()
+        finally:
+            self.transfer.release()
+
+
+class BandwidthScheduler:
+    """Share global ingress/egress caps between active transfers"""
+
+    def __init__(self, ingress_limit=None, egress_limit=None, small_bytes=None):
+        # 0 means unlimited, like the environment variables
+        self.limits = {
+            'ingress': (ingress_limit if ingress_limit is not None else _limit('BANDWIDTH_INGRESS_LIMIT')) or None,
+            'egress': (egress_limit if egress_limit is not None else _limit('BANDWIDTH_EGRESS_LIMIT')) or None,
+        }
+        self.small_bytes = small_bytes or int(os.environ.get('BANDWIDTH_SMALL_BYTES', 25 * 1024 * 1024))
+        self._transfers = {}
+        self._ids = itertools.count(1)
+        self._totals = {direction: 0 for direction in DIRECTIONS}
+        self._last_rebalance = time.monotonic()
+        self._lock = threading.Lock()
+
+    def register(self, direction, label=None, size=None, duration=None, weight=1.0):
+        """Start a transfer; small ones (by size, or duration when the size is unknown) get priority"""
+        interactive = is_interactive(size, duration, self.small_bytes)
+        if interactive:
+            weight *= INTERACTIVE_WEIGHT
+        with self._lock:
+            transfer = Transfer(self, next(self._ids), direction, label, weight, interactive)
+            self._transfers[transfer.key] = transfer
+            self._rebalance(direction)
+        return transfer
+
+    def release(self, transfer):
+        with self._lock:
+            if self._transfers.pop(transfer.key, None) is None:
+                return
+            self._totals[transfer.direction] += transfer.bytes
+            self._rebalance(transfer.direction)
+
+    def throttle(self, chunks, label=None, size=None):
+        """Wrap a response body so it's sent within the egress share; close() releases it"""
+        return ThrottledStream(chunks, self.register('egress', label=label, size=size))
+
+    def throttle_response(self, response, label=None, size=None):
+        """Pace a buffered or file response when an egress cap is configured"""
+        if self.limits['egress'] is None:
+            return response
+        response.response = self.throttle(response.response, label=label, size=size)
+        return response
+
+    def maybe_rebalance(self):
+        if time.monotonic() - self._last_rebalance < REBALANCE_INTERVAL:
+            return
+        with self._lock:
+            if time.monotonic() - self._last_rebalance < REBALANCE_INTERVAL:
+                return
+            for direction in DIRECTIONS:
+                self._rebalance(direction)
+
+    def _rebalance(self, direction):
+        """Recompute the shares of one direction (called with the lock held)"""
+        now = time.monotonic()
+        self._last_rebalance = now
+        transfers = [t for t in self._transfers.values() if t.direction == direction]
+        demands = {}
+        for transfer in transfers:
+            elapsed = now - transfer._window_start
+            if elapsed >= REBALANCE_INTERVAL:
+                transfer.measured = transfer._window_bytes / elapsed
+                transfer._window_bytes, transfer._window_start = 0, now
+            demand = None
+            if transfer.rate and transfer.measured is not None and transfer.measured < transfer.rate * UNDERUSE_RATIO:
+                demand = max(MIN_RATE, transfer.measured * DEMAND_HEADROOM)
+            demands[transfer.key] = (transfer.weight, demand)
+
+        limit = self.limits[direction]
+        shares = fair_shares(limit, demands) if limit else {}
+        for transfer in transfers:
+            transfer.rate = max(MIN_RATE, shares[transfer.key]) if limit else None
+            transfer.apply()
+
+    def stats(self):
+        """Snapshot for /api/metrics"""
+        with self._lock:
+            result = {}
+            for direction in DIRECTIONS:
+                transfers = [t for t in self._transfers.values() if t.direction == direction]
+                result[direction] = {
+                    'limit_bps': self.limits[direction],
+                    'active': len(transfers),
+                    'bytes_total': self._totals[direction] + sum(t.bytes for t in transfers),
+                    'transfers': [{
+                        'label': t.label,
+                        'interactive': t.interactive,
+                        'weight': t.weight,
+                        'rate_bps': round(t.rate) if t.rate else None,
+                        'measured_bps': round(t.measured) if t.measured is not None else None,
+                        'bytes': t.bytes,
+                    } for t in transfers],
+                }
+            return result
+
+
+scheduler = BandwidthScheduler()
+
+
+def stats():
+    return scheduler.stats()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Worker CPU per GB served, by FILE_SERVING mode
+Each request builds its response with file_serving.send() and hands it to a
+minimal WSGI writer that behaves like gunicorn's: a body that is the
+server's wsgi.file_wrapper goes out with os.sendfile(), anything else is
+iterated and written with sendall(). The client end of a socket pair is
+drained on another thread. Only the serving thread's CPU time is counted,
+so the proxy modes show what the worker spends on the hand-off; the front
+proxy's own cost of sending the file is not included.
+
+Usage:
+    python benchmarks/bench_file_serving.py [--size-mb 64] [--requests 8]
+        [--modes python sendfile x-accel-redirect] [--output serving.json]
+"""
+import argparse
+import json
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from flask import Flask
+import file_serving
+
+GB = 1024 ** 3
+
+
+class SendfileWrapper:
+    """wsgi.file_wrapper in the style of gunicorn's: iterable, but the server
+    sends it with os.sendfile() when it recognises it"""
+
+    __slots__ = ('filelike', 'blksize')
+
+    def __init__(self, filelike, blksize=8192):
+        self.filelike = filelike
+        self.blksize = blksize
+
+    def __iter__(self):
+        while True:
+            data = self.filelike.read(self.blksize)
+            if not data:
+                return
+            yield data
+
+    def close(self):
+        self.filelike.close()
+
+
+def write_body(body, sock):
+    """What the WSGI server does with the app's body; returns bytes sent"""
+    sent = 0
+    try:
+        if isinstance(body, SendfileWrapper):
+            fd = body.filelike.fileno()
+            offset = body.filelike.tell()
+            size = os.fstat(fd).st_size
+            while offset < size:
+                count = os.sendfile(sock.fileno(), fd, offset, size - offset)
+                if count == 0:
+                    break
+                offset += count
+                sent += count
+        else:
+            for chunk in body:
+                sock.sendall(chunk)
+                sent += len(chunk)
+    finally:
+        if hasattr(body, 'close'):
+            body.close()
+    return sent
+
+
+def drain(sock):
+    buffer = bytearray(1024 * 1024)
+    while sock.recv_into(buffer):
+        pass
+
+
+def measure(app, path, mode, requests):
+    os.environ['FILE_SERVING'] = mode
+    server_end, client_end = socket.socketpair()
+    drainer = threading.Thread(target=drain, args=(client_end,), daemon=True)
+    drainer.start()
+    released = []
+    sent = 0
+    cpu_started, wall_started = time.thread_time(), time.perf_counter()
+    for _ in range(requests):
+        with app.test_request_context(environ_base={'wsgi.file_wrapper': SendfileWrapper}) as ctx:
+            response = file_serving.send(path, 'media.mp4', lambda: released.append(1))
+            body = response(ctx.request.environ, lambda status, headers: None)
+            sent += write_body(body, server_end)
+    cpu, wall = time.thread_time() - cpu_started, time.perf_counter() - wall_started
+    server_end.close()
+    drainer.join()
+    client_end.close()
+    served = os.path.getsize(path) * requests
+    return {
+        'bytes_served': served,
+        'bytes_from_worker': sent,
+        'worker_cpu_ms': round(cpu * 1000, 1),
+        'worker_cpu_ms_per_gb': round(cpu * 1000 * GB / served, 1),
+        'worker_seconds_per_gb': round(wall * GB / served, 3),
+        'released': len(released),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Worker CPU per GB served by FILE_SERVING mode')
+    parser.add_argument('--size-mb', type=float, default=64)
+    parser.add_argument('--requests', type=int, default=8)
+    parser.add_argument('--modes', nargs='+', default=[file_serving.PYTHON, file_serving.SENDFILE,
+                                                       file_serving.X_ACCEL_REDIRECT])
+    parser.add_argument('--output', help='Write JSON results to this file')
+    args = parser.parse_args()
+
+    os.environ['FILE_SERVING_CLEANUP_DELAY'] = '0'
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'media.mp4')
+    with open(path, 'wb') as f:
+        f.write(os.urandom(int(args.size_mb * 1024 * 1024)))
+
+    app = Flask(__name__)
+    results = {'file_bytes': os.path.getsize(path), 'requests': args.requests, 'modes': {}}
+    try:
+        for mode in args.modes:
+            results['modes'][mode] = measure(app, path, mode, args.requests)
+        time.sleep(0.1)  # let the proxy modes' cleanup timers run
+    finally:
+        os.remove(path)
+        os.rmdir(directory)
+
+    print(f"{'mode':>18} {'CPU ms/GB':>10} {'worker s/GB':>11} {'bytes via worker':>17}")
+    for mode, result in results['modes'].items():
+        print(f"{mode:>18} {result['worker_cpu_ms_per_gb']:>10} {result['worker_seconds_per_gb']:>11} "
+              f"{result['bytes_from_worker']:>17}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Offline microbenchmarks for the request hot paths
+Runs without network access: yt-dlp is replaced by a stub that returns
+recorded-style fixtures whenever a Flask endpoint is measured.
+
+Usage:
+    python benchmarks/bench_hotpaths.py --output bench.json
+    python benchmarks/bench_hotpaths.py --compare bench.json
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import timeit
+from contextlib import contextmanager
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import yt_dlp
+from fixtures import make_info, long_emoji_title
+
+REAL_YOUTUBEDL = yt_dlp.YoutubeDL
+FIXTURE_INFO = make_info(format_count=400)
+
+
+class StubYoutubeDL:
+    """Offline stand-in for yt_dlp.YoutubeDL used by the endpoint benchmarks"""
+
+    def __init__(self, params=None):
+        self.params = params or {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def urlopen(self, req):
+        raise RuntimeError('Network access is disabled in benchmarks')
+
+    def extract_info(self, url, download=False, process=True):
+        return FIXTURE_INFO
+
+    def process_ie_result(self, ie_result, download=False):
+        return ie_result
+
+    @staticmethod
+    def sanitize_info(info_dict, remove_private_keys=False):
+        return info_dict
+
+
+@contextmanager
+def stubbed_yt_dlp():
+    yt_dlp.YoutubeDL = StubYoutubeDL
+    try:
+        yield
+    finally:
+        yt_dlp.YoutubeDL = REAL_YOUTUBEDL
+
+
+def bench_utils():
+    import utils
+
+    urls = [
+        'https://www.youtube.com/watch?v=dQw4w9WgXcQ',
+        'https://vm.tiktok.com/ZMabcdef/',
+        'not a url',
+        'https://www.instagram.com/reel/' + 'a' * 300,
+    ]
+    title = long_emoji_title()
+
+    return {
+        'utils.validate_url': lambda: [utils.validate_url(u) for u in urls],
+        'utils.sanitize_filename[emoji]': lambda: utils.sanitize_filename(title),
+        'utils.get_filename_with_title[emoji]': lambda: utils.get_filename_with_title(title, 'mp4'),
+    }
+
+
+def bench_shaping():
+    from app import app  # noqa: F401  (api.py imports the limiter from app)
+    import api
+    import api_vercel
+
+    formats = FIXTURE_INFO['formats']
+    url = FIXTURE_INFO['webpage_url']
+
+    return {
+        'api.build_video_metadata': lambda: api.build_video_metadata(FIXTURE_INFO, url),
+        'api_vercel.simplify_formats[400]': lambda: api_vercel.simplify_formats(formats),
+    }
+
+
+def bench_ydl_construction():
+    params = {'quiet': True, 'no_warnings': True, 'extract_flat': False}
+
+    def construct():
+        with REAL_YOUTUBEDL(params):
+            pass
+
+    return {'yt_dlp.YoutubeDL()': construct}
+
+
+def bench_endpoints():
+    from app import app
+    from app_vercel import app as vercel_app
+
+    client = app.test_client()
+    vercel_client = vercel_app.test_client()
+    body = {'url': FIXTURE_INFO['webpage_url']}
+
+    def endpoint(test_client, method, path):
+        if method == 'GET':
+            return lambda: test_client.get(path)
+        return lambda: test_client.post(path, json=body)
+
+    return {
+        'flask GET /api/health': endpoint(client, 'GET', '/api/health'),
+        'flask GET /api/supported-platforms': endpoint(client, 'GET', '/api/supported-platforms'),
+        'flask POST /api/info': endpoint(client, 'POST', '/api/info'),
+        'flask POST /api/formats': endpoint(client, 'POST', '/api/formats'),
+        'vercel GET /api/health': endpoint(vercel_client, 'GET', '/api/health'),
+        'vercel GET /api/platforms': endpoint(vercel_client, 'GET', '/api/platforms'),
+        'vercel POST /api/info': endpoint(vercel_client, 'POST', '/api/info'),
+        'vercel POST /api/formats': endpoint(vercel_client, 'POST', '/api/formats'),
+    }
+
+
+def measure(func, repeat, min_time=0.05):
+    """Time func, auto-scaling the loop count so each sample runs at least min_time"""
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    number = max(1, int(number * min_time / 0.2))
+    samples = [t / number for t in timer.repeat(repeat=repeat, number=number)]
+    median = statistics.median(samples)
+    return {
+        'number': number,
+        'repeat': repeat,
+        'per_op_us': {
+            'min': round(min(samples) * 1e6, 3),
+            'median': round(median * 1e6, 3),
+            'mean': round(statistics.fmean(samples) * 1e6, 3),
+        },
+        'ops_per_sec': round(1 / median, 1) if median else None,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, text=True).strip()
+    except Exception:
+        return None
+
+
+def run(repeat, name_filter=None):
+    benchmarks = {}
+    benchmarks.update(bench_utils())
+    benchmarks.update(bench_shaping())
+    benchmarks.update(bench_ydl_construction())
+
+    results = {}
+    with stubbed_yt_dlp():
+        benchmarks.update(bench_endpoints())
+        for name, func in benchmarks.items():
+            if name_filter and name_filter not in name:
+                continue
+            results[name] = measure(func, repeat)
+            print(f"{name:45s} {results[name]['per_op_us']['median']:>12.2f} us/op", file=sys.stderr)
+
+    return {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'git_revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'yt_dlp': yt_dlp.version.__version__,
+        },
+        'results': results,
+    }
+
+
+def compare(current, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)['results']
+    print(f"{'benchmark':45s} {'baseline':>12s} {'current':>12s} {'ratio':>8s}")
+    for name, result in current['results'].items():
+        if name not in baseline:
+            continue
+        old = baseline[name]['per_op_us']['median']
+        new = result['per_op_us']['median']
+        ratio = new / old if old else float('nan')
+        print(f"{name:45s} {old:>12.2f} {new:>12.2f} {ratio:>7.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline microbenchmarks for the request hot paths')
+    parser.add_argument('--output', help='Write JSON results to this file (default: stdout)')
+    parser.add_argument('--compare', help='Compare against a previous JSON result file')
+    parser.add_argument('--repeat', type=int, default=5, help='Samples per benchmark')
+    parser.add_argument('--filter', help='Only run benchmarks whose name contains this string')
+    parser.add_argument('--keep-logging', action='store_true', help='Keep application logging enabled')
+    args = parser.parse_args()
+
+    if not args.keep_logging:
+        logging.disable(logging.CRITICAL)
+
+    current = run(args.repeat, args.filter)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(current, f, indent=2)
+    elif not args.compare:
+        json.dump(current, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        compare(current, args.compare)
+
+
+if __name__ == '__main__':
+    main()
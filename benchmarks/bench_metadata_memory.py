@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Memory and serialization cost of cached metadata
+Compares holding raw yt-dlp info dicts with the slotted VideoMetadata model
+(models.py): bytes retained per entry, as measured by tracemalloc, and the
+time to serialize an entry to JSON for the metadata store.
+
+Usage:
+    python benchmarks/bench_metadata_memory.py [--entries 200] [--formats 200] [--output memory.json]
+"""
+import argparse
+import gc
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fixtures import make_info
+from models import VideoMetadata
+
+
+def retained_bytes(build, count):
+    """Bytes still allocated after building `count` entries with build(i)"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    entries = [build(i) for i in range(count)]
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del entries
+    return after - before
+
+
+def serialize_us(dump, repeat=50):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        dump()
+        samples.append(time.perf_counter() - started)
+    return round(statistics.median(samples) * 1e6, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Raw info dicts vs the slotted metadata model')
+    parser.add_argument('--entries', type=int, default=200)
+    parser.add_argument('--formats', type=int, default=200)
+    parser.add_argument('--output', help='Write JSON results to this file')
+    args = parser.parse_args()
+
+    # Every entry is a distinct extraction, as in a cache holding many videos; decoding
+    # JSON gives each one its own strings, the way a real extraction does
+    sources = [json.dumps(make_info(format_count=args.formats, seed=seed)) for seed in range(args.entries)]
+    raw = retained_bytes(lambda i: json.loads(sources[i]), args.entries)
+    model = retained_bytes(lambda i: VideoMetadata.from_info(json.loads(sources[i])), args.entries)
+    model_urls = retained_bytes(lambda i: VideoMetadata.from_info(json.loads(sources[i]), keep_urls=True),
+                                args.entries)
+
+    info = json.loads(sources[0])
+    metadata = VideoMetadata.from_info(info)
+    results = {
+        'entries': args.entries,
+        'formats_per_entry': args.formats,
+        'bytes_per_entry': {
+            'raw_dict': raw // args.entries,
+            'model': model // args.entries,
+            'model_with_urls': model_urls // args.entries,
+        },
+        'json_us': {
+            'raw_dict': serialize_us(lambda: json.dumps(info, ensure_ascii=False)),
+            'model': serialize_us(lambda: json.dumps(metadata.to_dict(), ensure_ascii=False)),
+        },
+        'json_bytes': {
+            'raw_dict': len(json.dumps(info, ensure_ascii=False).encode()),
+            'model': len(json.dumps(metadata.to_dict(), ensure_ascii=False).encode()),
+        },
+    }
+
+    per_entry = results['bytes_per_entry']
+    print(f"{'retained per entry':20s} raw {per_entry['raw_dict'] / 1024:9.1f} KiB  "
+          f"model {per_entry['model'] / 1024:9.1f} KiB  ({per_entry['raw_dict'] / per_entry['model']:.1f}x)  "
+          f"model+urls {per_entry['model_with_urls'] / 1024:9.1f} KiB")
+    for name in ('json_us', 'json_bytes'):
+        values = results[name]
+        print(f"{name:20s} raw {values['raw_dict']:13.1f}  model {values['model']:13.1f}  "
+              f"({values['raw_dict'] / values['model']:.1f}x)")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Per-invocation overhead of the Netlify function adapter
+Compares the module-scope WSGI adapter in netlify/functions/api.py with the
+previous handler, which re-imported the app and replayed every request
+through app.test_client().
+
+Usage:
+    python benchmarks/bench_netlify_adapter.py [--invocations 2000] [--output netlify.json]
+"""
+import argparse
+import importlib.util
+import json
+import logging
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+
+def load_netlify_function():
+    spec = importlib.util.spec_from_file_location('netlify_api', os.path.join(ROOT, 'netlify', 'functions', 'api.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def legacy_handler(event, context):
+    """The handler as it was before the WSGI adapter (kept for comparison)"""
+    try:
+        from app_vercel import app
+
+        method = event.get('httpMethod', 'GET')
+        path = event.get('path', '/')
+        query_string = event.get('queryStringParameters') or {}
+        headers = event.get('headers', {})
+        body = event.get('body', '')
+
+        query_string_formatted = '&'.join(f"{k}={v}" for k, v in query_string.items() if v)
+
+        with app.test_client() as client:
+            if method == 'GET':
+                response = client.get(path, query_string=query_string_formatted)
+            else:
+                response = client.open(path, method=method, data=body,
+                                       content_type=headers.get('content-type', 'application/json'))
+
+        return {
+            'statusCode': response.status_code,
+            'headers': dict(response.headers),
+            'body': response.get_data(as_text=True)
+        }
+    except Exception as e:
+        return {'statusCode': 500, 'body': json.dumps({'error': str(e)})}
+
+
+EVENTS = {
+    'GET /api/health': {'httpMethod': 'GET', 'path': '/api/health', 'headers': {'host': 'bench.netlify.app'}},
+    'GET /api/platforms': {'httpMethod': 'GET', 'path': '/api/platforms', 'headers': {'host': 'bench.netlify.app'}},
+    'POST /api/info (invalid url)': {
+        'httpMethod': 'POST', 'path': '/api/info',
+        'headers': {'host': 'bench.netlify.app', 'content-type': 'application/json'},
+        'body': json.dumps({'url': 'not-a-url'}),
+    },
+}
+
+
+def measure(handler, event, invocations):
+    handler(event, None)  # warm
+    samples = []
+    for _ in range(invocations):
+        started = time.perf_counter()
+        handler(event, None)
+        samples.append(time.perf_counter() - started)
+    samples.sort()
+    return {
+        'median_us': round(statistics.median(samples) * 1e6, 1),
+        'p95_us': round(samples[int(len(samples) * 0.95) - 1] * 1e6, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Netlify adapter per-invocation overhead')
+    parser.add_argument('--invocations', type=int, default=2000)
+    parser.add_argument('--output', help='Write JSON results to this file')
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    netlify = load_netlify_function()
+    results = {}
+    for name, event in EVENTS.items():
+        results[name] = {
+            'legacy': measure(legacy_handler, event, args.invocations),
+            'adapter': measure(netlify.handler, event, args.invocations),
+        }
+        legacy, adapter = results[name]['legacy']['median_us'], results[name]['adapter']['median_us']
+        print(f"{name:32s} legacy {legacy:9.1f} us  adapter {adapter:9.1f} us  ({legacy / adapter:.2f}x)")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Segmented vs single-stream downloads against a throttled stub server
+The stub serves one file and throttles every connection separately, the way
+CDNs do, optionally cutting some responses off halfway. Each run downloads
+the file with segmented.download() at a given connection count (1 is the
+single-stream baseline) and reports wall time, throughput and retries.
+
+Usage:
+    python benchmarks/bench_segmented.py [--size-mb 32] [--per-connection-kbps 16000]
+        [--connections 1 2 4 8] [--cut-rate 0.0] [--no-ranges] [--repeat 3] [--output segmented.json]
+"""
+import argparse
+import json
+import os
+import random
+import re
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+import requests
+from requests.adapters import HTTPAdapter
+import segmented
+
+
+def make_stub_server(body, per_connection_bytes, ranges=True, cut_rate=0.0):
+    """Threaded server for `body` at /media.mp4, throttled per connection"""
+
+    class ThrottledHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            start, end, status = 0, len(body) - 1, 200
+            match = re.match(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+            if ranges and match:
+                start = int(match.group(1))
+                end = min(int(match.group(2)), end) if match.group(2) else end
+                status = 206
+            self.send_response(status)
+            self.send_header('Content-Length', str(end - start + 1))
+            if ranges:
+                self.send_header('Accept-Ranges', 'bytes')
+            if status == 206:
+                self.send_header('Content-Range', f'bytes {start}-{end}/{len(body)}')
+            self.end_headers()
+            data = memoryview(body)[start:end + 1]
+            if end > start and random.random() < cut_rate:
+                data = data[:len(data) // 2]
+                self.close_connection = True
+            chunk = max(1024, per_connection_bytes // 50)
+            started = time.monotonic()
+            for offset in range(0, len(data), chunk):
+                try:
+                    self.wfile.write(data[offset:offset + chunk])
+                except (BrokenPipeError, ConnectionResetError):
+                    return
+                # Pace to the per-connection rate
+                delay = started + (offset + chunk) / per_connection_bytes - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ThrottledHandler)
+    server.daemon_threads = True
+    return server
+
+
+def run(url, connections, expected):
+    path = os.path.join(tempfile.mkdtemp(), 'media.mp4')
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_maxsize=max(connections, 10))
+    session.mount('http://', adapter)
+    started = time.perf_counter()
+    summary = segmented.download(session, url, path, connection_count=connections)
+    elapsed = time.perf_counter() - started
+    with open(path, 'rb') as f:
+        assert f.read() == expected, 'downloaded file differs'
+    os.remove(path)
+    return elapsed, summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Segmented downloader against a throttled stub server')
+    parser.add_argument('--size-mb', type=float, default=32)
+    parser.add_argument('--per-connection-kbps', type=float, default=16000,
+                        help='Throttle applied to every connection, in kbit/s')
+    parser.add_argument('--connections', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--cut-rate', type=float, default=0.0,
+                        help='Fraction of responses cut off halfway (exercises segment retries)')
+    parser.add_argument('--no-ranges', action='store_true', help='Stub ignores Range headers')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help='Write JSON results to this file')
+    args = parser.parse_args()
+
+    body = os.urandom(int(args.size_mb * 1024 * 1024))
+    per_connection = int(args.per_connection_kbps * 1000 / 8)
+    server = make_stub_server(body, per_connection, ranges=not args.no_ranges, cut_rate=args.cut_rate)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_address[1]}/media.mp4'
+
+    results = {'size_bytes': len(body), 'per_connection_kbps': args.per_connection_kbps,
+               'cut_rate': args.cut_rate, 'ranges': not args.no_ranges, 'runs': {}}
+    try:
+        for connections in args.connections:
+            samples, summaries = [], []
+            for _ in range(args.repeat):
+                elapsed, summary = run(url, connections, body)
+                samples.append(elapsed)
+                summaries.append(summary)
+            seconds = statistics.median(samples)
+            results['runs'][str(connections)] = {
+                'mode': summaries[-1]['mode'],
+                'segments': summaries[-1]['segments'],
+                'seconds': round(seconds, 3),
+                'mbps': round(len(body) * 8 / seconds / 1e6, 1),
+                'retries': sum(summary['retries'] for summary in summaries),
+            }
+    finally:
+        server.shutdown()
+
+    baseline = results['runs'].get('1')
+    if baseline:
+        for run_result in results['runs'].values():
+            run_result['speedup'] = round(baseline['seconds'] / run_result['seconds'], 2)
+
+    print(f"{'connections':>11} {'mode':>9} {'segments':>8} {'seconds':>8} {'Mbit/s':>8} {'retries':>7} {'speedup':>7}")
+    for connections, run_result in results['runs'].items():
+        print(f"{connections:>11} {run_result['mode']:>9} {run_result['segments']:>8} {run_result['seconds']:>8} "
+              f"{run_result['mbps']:>8} {run_result['retries']:>7} {run_result.get('speedup', ''):>7}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""
+Deterministic offline fixtures shaped like real yt-dlp extraction results
+Used by the benchmarks so they never touch the network
+"""
+import random
+
+EMOJI_TITLE = (
+    "Next kis pa bnao 🤌......./... comment karo ...../ ❤️‍🩹 "
+    "Recipe: Homemade Pizza 🍕👨‍🍳 - Step by Step | Travel Vlog: Tokyo Adventure 🗾🏮 Day 1 "
+)
+
+VIDEO_CODECS = ['avc1.64001F', 'avc1.4d401e', 'vp9', 'av01.0.08M.08']
+AUDIO_CODECS = ['mp4a.40.2', 'opus']
+HEIGHTS = [144, 240, 360, 480, 720, 1080, 1440, 2160]
+
+
+def long_emoji_title(repeat=8):
+    """Return a long, emoji-heavy title with filesystem-hostile characters"""
+    return EMOJI_TITLE * repeat
+
+
+def make_format(index, rng):
+    """Build one format entry resembling a YouTube DASH/progressive format"""
+    if index % 5 == 0:
+        return {
+            'format_id': f'{140 + index}',
+            'ext': rng.choice(['m4a', 'webm']),
+            'vcodec': 'none',
+            'acodec': rng.choice(AUDIO_CODECS),
+            'abr': rng.choice([48, 128, 160]),
+            'tbr': rng.choice([48, 128, 160]),
+            'filesize': rng.randint(1_000_000, 9_000_000),
+            'format_note': 'audio only',
+            'url': f'https://rr1---sn-example.googlevideo.com/videoplayback?itag={index}&expire=0&sig=' + 'x' * 200,
+            'http_headers': {'User-Agent': 'Mozilla/5.0', 'Accept': '*/*', 'Accept-Language': 'en-us,en;q=0.5'},
+        }
+    height = rng.choice(HEIGHTS)
+    return {
+        'format_id': f'{index}',
+        'ext': rng.choice(['mp4', 'webm']),
+        'vcodec': rng.choice(VIDEO_CODECS),
+        'acodec': rng.choice(['none', 'mp4a.40.2']),
+        'height': height,
+        'width': height * 16 // 9,
+        'fps': rng.choice([24, 30, 60]),
+        'tbr': rng.randint(100, 20000),
+        'filesize': rng.choice([None, rng.randint(1_000_000, 900_000_000)]),
+        'format_note': f'{height}p',
+        'resolution': f'{height * 16 // 9}x{height}',
+        'url': f'https://rr1---sn-example.googlevideo.com/videoplayback?itag={index}&expire=0&sig=' + 'x' * 200,
+        'fragments': [{'url': f'sq/{n}', 'duration': 5.0} for n in range(rng.randint(0, 40))],
+        'http_headers': {'User-Agent': 'Mozilla/5.0', 'Accept': '*/*', 'Accept-Language': 'en-us,en;q=0.5'},
+    }
+
+
+def make_info(format_count=200, seed=1234):
+    """Build a yt-dlp style info dict with a large format list"""
+    rng = random.Random(seed)
+    return {
+        'id': 'dQw4w9WgXcQ',
+        'title': long_emoji_title(2),
+        'duration': 212,
+        'uploader': 'Rick Astley',
+        'upload_date': '20091025',
+        'view_count': 1_600_000_000,
+        'like_count': 18_000_000,
+        'thumbnail': 'https://i.ytimg.com/vi/dQw4w9WgXcQ/maxresdefault.jpg',
+        'description': 'The official video for “Never Gonna Give You Up” by Rick Astley. ' * 40,
+        'extractor': 'youtube',
+        'extractor_key': 'Youtube',
+        'webpage_url': 'https://www.youtube.com/watch?v=dQw4w9WgXcQ',
+        'ext': 'mp4',
+        'formats': [make_format(i, rng) for i in range(format_count)],
+    }
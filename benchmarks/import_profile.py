@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Cold-start import profile for the entry points
+Imports each entry point in a fresh interpreter (python -X importtime),
+serves one /api/health request, and reports the wall time plus a
+per-package breakdown: main as Vercel starts it, app (app.py and api.py,
+the long-running server), app_vercel and the Netlify function. With
+--check, fails when an entry point exceeds its budget in
+cold_start_budget.json or imports a module that must stay lazy.
+test_cold_start.py only checks the lazy modules; wall-clock budgets
+depend on the machine.
+
+Usage:
+    python benchmarks/import_profile.py                # profile every entry point
+    python benchmarks/import_profile.py --check        # enforce the budget
+    python benchmarks/import_profile.py --entry main --top 15
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+BUDGET_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cold_start_budget.json')
+
+# Code run in the child interpreter: import the entry point and define
+# serve(), which handles one cheap request the way the platform would
+ENTRY_POINTS = {
+    'main': "import main\nserve = lambda: main.app.test_client().get('/api/health')",
+    'app': "import app\nserve = lambda: app.app.test_client().get('/api/health')",
+    'app_vercel': "import app_vercel\nserve = lambda: app_vercel.app.test_client().get('/api/health')",
+    'netlify': (
+        "import importlib.util\n"
+        "spec = importlib.util.spec_from_file_location('netlify_api', 'netlify/functions/api.py')\n"
+        "module = importlib.util.module_from_spec(spec); spec.loader.exec_module(module)\n"
+        "serve = lambda: module.handler({'httpMethod': 'GET', 'path': '/api/health', 'headers': {}}, None)"
+    ),
+}
+
+CHILD_TEMPLATE = """
+import json, sys, time
+started = time.perf_counter()
+{load}
+imported = time.perf_counter()
+serve()
+served = time.perf_counter()
+print(json.dumps({{
+    'import_ms': (imported - started) * 1000,
+    'first_request_ms': (served - imported) * 1000,
+    'cold_start_ms': (served - started) * 1000,
+    'modules': sorted(sys.modules),
+}}))
+"""
+
+
+def run_child(entry, env_overrides=None):
+    """Import one entry point in a fresh interpreter and collect timings"""
+    env = dict(os.environ, LOG_ASYNC='0', LOG_LEVEL='ERROR', **(env_overrides or {}))
+    code = CHILD_TEMPLATE.format(load=ENTRY_POINTS[entry])
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=ROOT, env=env,
+                            capture_output=True, text=True, check=True)
+    data = json.loads(result.stdout.strip().splitlines()[-1])
+    data['packages'] = parse_importtime(result.stderr)
+    return data
+
+
+def parse_importtime(stderr):
+    """Sum -X importtime self times (ms) per top-level package"""
+    packages = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        parts = line[len('import time:'):].split('|')
+        if len(parts) != 3:
+            continue
+        top = parts[2].strip().split('.')[0]
+        packages[top] = packages.get(top, 0) + int(parts[0]) / 1000
+    return dict(sorted(packages.items(), key=lambda item: item[1], reverse=True))
+
+
+def entry_env(entry):
+    """Environment an entry point is started with on its platform"""
+    return {'VERCEL': '1'} if entry == 'main' else {}
+
+
+def lazy_failures(entry, modules, lazy_modules):
+    """Modules that must stay lazy but were imported by `entry`"""
+    return [f"{entry}: '{module}' was imported at cold start" for module in lazy_modules if module in modules]
+
+
+def profile(entry, runs):
+    """Profile an entry point over several fresh interpreters, keeping the median"""
+    samples = [run_child(entry, entry_env(entry)) for _ in range(runs)]
+    median_run = sorted(samples, key=lambda s: s['import_ms'])[len(samples) // 2]
+    return {
+        'import_ms': round(statistics.median(s['import_ms'] for s in samples), 1),
+        'first_request_ms': round(statistics.median(s['first_request_ms'] for s in samples), 1),
+        'cold_start_ms': round(statistics.median(s['cold_start_ms'] for s in samples), 1),
+        'packages_ms': {name: round(ms, 1) for name, ms in median_run['packages'].items()},
+        'modules': median_run['modules'],
+    }
+
+
+def check(results, budget):
+    """Return a list of budget violations"""
+    failures = []
+    for entry, result in results.items():
+        limit = budget.get('cold_start_ms', {}).get(entry)
+        if limit is not None and result['cold_start_ms'] > limit:
+            failures.append(f"{entry}: cold start took {result['cold_start_ms']} ms (budget {limit} ms)")
+        failures.extend(lazy_failures(entry, result['modules'], budget.get('lazy_modules', [])))
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Cold-start import profile for serverless entry points')
+    parser.add_argument('--entry', action='append', choices=sorted(ENTRY_POINTS))
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--top', type=int, default=10, help='Packages to show per entry point')
+    parser.add_argument('--check', action='store_true', help='Fail when the budget is exceeded')
+    parser.add_argument('--output', help='Write the full JSON profile to this file')
+    args = parser.parse_args()
+
+    results = {entry: profile(entry, args.runs) for entry in (args.entry or ENTRY_POINTS)}
+
+    for entry, result in results.items():
+        print(f"{entry}: cold start {result['cold_start_ms']} ms "
+              f"(import {result['import_ms']} ms, first /api/health {result['first_request_ms']} ms)")
+        for name, ms in list(result['packages_ms'].items())[:args.top]:
+            print(f"    {name:30s} {ms:8.1f} ms")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({entry: {k: v for k, v in r.items() if k != 'modules'} for entry, r in results.items()}, f, indent=2)
+
+    if args.check:
+        with open(BUDGET_FILE) as f:
+            failures = check(results, json.load(f))
+        for failure in failures:
+            print(f"❌ {failure}")
+        if failures:
+            sys.exit(1)
+        print("✅ Cold-start budget respected")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Load driver for /api/info and /api/download
+Keeps a fixed number of requests in flight and reports throughput and
+p50/p95/p99 latency. Point it at an app started with
+`upstream_replay.py app` to load test without touching real platforms.
+
+Usage:
+    python benchmarks/load_driver.py --base http://127.0.0.1:5000 --concurrency 16 \
+        --requests 200 --endpoint info --endpoint download URL [URL ...]
+"""
+import argparse
+import itertools
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+_local = threading.local()
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(1, int(round(pct / 100 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def _session():
+    if not hasattr(_local, 'session'):
+        _local.session = requests.Session()
+    return _local.session
+
+
+def one_request(base, endpoint, url, fmt, timeout):
+    payload = {'url': url}
+    if endpoint == 'download':
+        payload['format'] = fmt
+    started = time.perf_counter()
+    size = 0
+    try:
+        with _session().post(f'{base}/api/{endpoint}', json=payload, stream=True, timeout=timeout) as response:
+            for chunk in response.iter_content(64 * 1024):
+                size += len(chunk)
+            status = response.status_code
+    except requests.RequestException as e:
+        status = type(e).__name__
+    return endpoint, status, time.perf_counter() - started, size
+
+
+def summarize(samples, elapsed):
+    latencies = sorted(s[2] for s in samples)
+    statuses = {}
+    for _, status, _, _ in samples:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    total_bytes = sum(s[3] for s in samples)
+
+    def ms(value):
+        return round(value * 1000, 2) if value is not None else None
+
+    return {
+        'requests': len(samples),
+        'elapsed_s': round(elapsed, 3),
+        'throughput_rps': round(len(samples) / elapsed, 2) if elapsed else None,
+        'throughput_mbps': round(total_bytes * 8 / elapsed / 1e6, 2) if elapsed else None,
+        'statuses': statuses,
+        'latency_ms': {
+            'p50': ms(percentile(latencies, 50)),
+            'p95': ms(percentile(latencies, 95)),
+            'p99': ms(percentile(latencies, 99)),
+            'max': ms(latencies[-1] if latencies else None),
+        },
+    }
+
+
+def run(base, urls, endpoints, concurrency, total, fmt, timeout):
+    jobs = itertools.islice(itertools.cycle(itertools.product(endpoints, urls)), total)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        samples = list(pool.map(lambda job: one_request(base, job[0], job[1], fmt, timeout), jobs))
+    elapsed = time.perf_counter() - started
+
+    report = {'concurrency': concurrency, 'overall': summarize(samples, elapsed), 'endpoints': {}}
+    for endpoint in endpoints:
+        report['endpoints'][endpoint] = summarize([s for s in samples if s[0] == endpoint], elapsed)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load driver for /api/info and /api/download')
+    parser.add_argument('urls', nargs='+')
+    parser.add_argument('--base', default='http://127.0.0.1:5000')
+    parser.add_argument('--endpoint', action='append', choices=['info', 'formats', 'download'])
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=100)
+    parser.add_argument('--format', default='best[height<=720]')
+    parser.add_argument('--timeout', type=float, default=120)
+    parser.add_argument('--output', help='Write the JSON report to this file (default: stdout)')
+    args = parser.parse_args()
+
+    report = run(args.base.rstrip('/'), args.urls, args.endpoint or ['info'], args.concurrency,
+                 args.requests, args.format, args.timeout)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
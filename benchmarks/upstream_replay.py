@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+"""
+Record/replay harness for upstream HTTP traffic
+Lets the full stack be load tested without touching YouTube, TikTok or TikWM.
+
+    record  Run /api/info and /api/download in-process for some URLs and capture
+            every upstream exchange made by yt-dlp and requests (TikWMExtractor)
+            into a fixture directory.
+    serve   Serve recorded exchanges from a local stand-in server with
+            configurable latency, bandwidth and error injection.
+    app     Run the API with all upstream traffic redirected to the stand-in server.
+
+Usage:
+    python benchmarks/upstream_replay.py record --fixtures fx/ URL [URL ...]
+    python benchmarks/upstream_replay.py serve --fixtures fx/ --port 8900 --latency-ms 80 --bandwidth-kbps 4000
+    python benchmarks/upstream_replay.py app --upstream http://127.0.0.1:8900 --port 5000
+"""
+import argparse
+import hashlib
+import io
+import json
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote, unquote, urlsplit
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+import requests
+import yt_dlp
+from yt_dlp.networking import Response as YDLResponse
+from yt_dlp.networking.exceptions import HTTPError as YDLHTTPError
+
+logger = logging.getLogger('upstream_replay')
+
+# Response header carrying the URL the recorded exchange finally resolved to
+FINAL_URL_HEADER = 'X-Replay-Final-Url'
+HOP_BY_HOP_HEADERS = {'connection', 'keep-alive', 'transfer-encoding', 'content-encoding',
+                      'content-length', 'content-range', 'accept-ranges'}
+
+_original_ydl_urlopen = yt_dlp.YoutubeDL.urlopen
+_original_session_send = requests.Session.send
+
+
+class FixtureStore:
+    """Recorded upstream exchanges stored as index.json plus one body file each"""
+
+    def __init__(self, path):
+        self.path = path
+        self.exchanges = []
+        self._lock = threading.Lock()
+
+    @property
+    def index_path(self):
+        return os.path.join(self.path, 'index.json')
+
+    def load(self):
+        with open(self.index_path) as f:
+            self.exchanges = json.load(f)['exchanges']
+        return self
+
+    def save(self):
+        os.makedirs(self.path, exist_ok=True)
+        with open(self.index_path, 'w') as f:
+            json.dump({'exchanges': self.exchanges}, f, indent=2)
+
+    def add(self, method, url, status, headers, body, final_url=None):
+        """Record one exchange and write its body to disk"""
+        os.makedirs(os.path.join(self.path, 'bodies'), exist_ok=True)
+        digest = hashlib.sha1(f'{method} {url}'.encode()).hexdigest()[:16]
+        with self._lock:
+            body_file = f'bodies/{len(self.exchanges):04d}-{digest}.bin'
+            with open(os.path.join(self.path, body_file), 'wb') as f:
+                f.write(body)
+            self.exchanges.append({
+                'method': method,
+                'url': url,
+                'final_url': final_url or url,
+                'status': status,
+                'headers': [[k, v] for k, v in headers if k.lower() not in HOP_BY_HOP_HEADERS],
+                'body_file': body_file,
+                'size': len(body),
+            })
+
+    def lookup(self, method, url):
+        """Find an exchange by exact URL, falling back to the same host and path"""
+        for exchange in self.exchanges:
+            if exchange['method'] == method and exchange['url'] == url:
+                return exchange
+        parts = urlsplit(url)
+        for exchange in self.exchanges:
+            recorded = urlsplit(exchange['url'])
+            if exchange['method'] == method and (recorded.netloc, recorded.path) == (parts.netloc, parts.path):
+                return exchange
+        return None
+
+    def read_body(self, exchange):
+        with open(os.path.join(self.path, exchange['body_file']), 'rb') as f:
+            return f.read()
+
+
+# ---------------------------------------------------------------------------
+# Record mode
+# ---------------------------------------------------------------------------
+
+def install_recorder(store, max_body=50 * 1024 * 1024):
+    """Capture every upstream exchange made through yt-dlp and requests"""
+
+    def urlopen(self, req):
+        method = getattr(req, 'method', None) or 'GET'
+        url = req if isinstance(req, str) else req.url
+        try:
+            response = _original_ydl_urlopen(self, req)
+        except YDLHTTPError as e:
+            body = e.response.read()
+            store.add(method, url, e.response.status, e.response.headers.items(), body, e.response.url)
+            raise
+        body = response.read()
+        if len(body) <= max_body:
+            store.add(method, url, response.status, response.headers.items(), body, response.url)
+        return YDLResponse(io.BytesIO(body), response.url, dict(response.headers.items()),
+                           status=response.status, reason=response.reason)
+
+    def send(self, request, **kwargs):
+        response = _original_session_send(self, request, **kwargs)
+        body = response.content
+        if len(body) <= max_body:
+            store.add(request.method, request.url, response.status_code,
+                      response.headers.items(), body, response.url)
+        return response
+
+    yt_dlp.YoutubeDL.urlopen = urlopen
+    requests.Session.send = send
+
+
+def record(args):
+    store = FixtureStore(args.fixtures)
+    install_recorder(store, args.max_body_mb * 1024 * 1024)
+
+    from app import app
+    client = app.test_client()
+    for url in args.urls:
+        response = client.post('/api/info', json={'url': url})
+        print(f"info     {response.status_code} {url}")
+        if not args.skip_download:
+            response = client.post('/api/download', json={'url': url, 'format': args.format})
+            print(f"download {response.status_code} {url} ({len(response.data)} bytes)")
+
+    store.save()
+    print(f"Recorded {len(store.exchanges)} exchanges into {args.fixtures}")
+
+
+# ---------------------------------------------------------------------------
+# Replay mode: stand-in upstream server
+# ---------------------------------------------------------------------------
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    """Serve recorded exchanges; the original URL is the quoted request path"""
+
+    protocol_version = 'HTTP/1.1'
+    store = None
+    latency = 0.0
+    bandwidth = None
+    error_rate = 0.0
+    reset_rate = 0.0
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def _serve(self, send_body=True):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+
+        url = unquote(self.path.lstrip('/'))
+        exchange = self.store.lookup(self.command, url)
+        if exchange is None and self.command == 'HEAD':
+            exchange = self.store.lookup('GET', url)
+
+        if self.latency:
+            time.sleep(self.latency)
+
+        if random.random() < self.reset_rate:
+            self.close_connection = True
+            self.connection.close()
+            return
+        if exchange is None or random.random() < self.error_rate:
+            status = 404 if exchange is None else 503
+            self.send_response(status)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        body = self.store.read_body(exchange)
+        status = exchange['status']
+        start, end = 0, len(body) - 1
+        match = re.match(r'bytes=(\d*)-(\d*)', self.headers.get('Range', ''))
+        if match and status == 200 and body:
+            if match.group(1):
+                start = int(match.group(1))
+                end = min(int(match.group(2)), end) if match.group(2) else end
+            else:
+                start = max(0, len(body) - int(match.group(2)))
+            status = 206
+
+        self.send_response(status)
+        for name, value in exchange['headers']:
+            self.send_header(name, value)
+        self.send_header(FINAL_URL_HEADER, quote(exchange['final_url'], safe=''))
+        self.send_header('Accept-Ranges', 'bytes')
+        if status == 206:
+            self.send_header('Content-Range', f'bytes {start}-{end}/{len(body)}')
+        self.send_header('Content-Length', str(end - start + 1 if body else 0))
+        self.end_headers()
+        if send_body and body:
+            self._write_throttled(body[start:end + 1])
+
+    def _write_throttled(self, data):
+        if not self.bandwidth:
+            self.wfile.write(data)
+            return
+        chunk = max(1024, int(self.bandwidth / 20))
+        for offset in range(0, len(data), chunk):
+            self.wfile.write(data[offset:offset + chunk])
+            time.sleep(len(data[offset:offset + chunk]) / self.bandwidth)
+
+    def do_GET(self):
+        self._serve()
+
+    def do_POST(self):
+        self._serve()
+
+    def do_HEAD(self):
+        self._serve(send_body=False)
+
+
+def make_replay_server(store, host='127.0.0.1', port=0, latency_ms=0, bandwidth_kbps=None,
+                       error_rate=0.0, reset_rate=0.0):
+    """Build (but don't start) a threaded stand-in server for a fixture store"""
+    handler = type('ConfiguredReplayHandler', (ReplayHandler,), {
+        'store': store,
+        'latency': latency_ms / 1000,
+        'bandwidth': bandwidth_kbps * 1024 / 8 if bandwidth_kbps else None,
+        'error_rate': error_rate,
+        'reset_rate': reset_rate,
+    })
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def serve(args):
+    store = FixtureStore(args.fixtures).load()
+    server = make_replay_server(store, args.host, args.port, args.latency_ms, args.bandwidth_kbps,
+                                args.error_rate, args.reset_rate)
+    print(f"Replaying {len(store.exchanges)} exchanges on http://{args.host}:{server.server_port}")
+    server.serve_forever()
+
+
+# ---------------------------------------------------------------------------
+# Replay mode: redirect the application's upstream traffic
+# ---------------------------------------------------------------------------
+
+def install_redirect(upstream):
+    """Send every yt-dlp and requests call to the stand-in server instead"""
+    upstream = upstream.rstrip('/')
+
+    def rewrite(url):
+        if url.startswith(upstream):
+            return url
+        return f'{upstream}/{quote(url, safe="")}'
+
+    def restore_url(url, headers):
+        final_url = headers.get(FINAL_URL_HEADER)
+        return unquote(final_url) if final_url else url
+
+    def urlopen(self, req):
+        if isinstance(req, str):
+            req = yt_dlp.networking.Request(req)
+        req.url = rewrite(req.url)
+        response = _original_ydl_urlopen(self, req)
+        response.url = restore_url(response.url, response.headers)
+        return response
+
+    def send(self, request, **kwargs):
+        request.url = rewrite(request.url)
+        response = _original_session_send(self, request, **kwargs)
+        response.url = restore_url(response.url, response.headers)
+        return response
+
+    yt_dlp.YoutubeDL.urlopen = urlopen
+    requests.Session.send = send
+
+
+def run_app(args):
+    install_redirect(args.upstream)
+    if args.vercel:
+        from app_vercel import app
+    else:
+        from app import app
+    app.run(host=args.host, port=args.port, threaded=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Record/replay harness for upstream HTTP traffic')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('record', help='Capture upstream exchanges into fixtures')
+    p.add_argument('urls', nargs='+')
+    p.add_argument('--fixtures', required=True)
+    p.add_argument('--format', default='best[height<=720]')
+    p.add_argument('--skip-download', action='store_true')
+    p.add_argument('--max-body-mb', type=int, default=50)
+    p.set_defaults(func=record)
+
+    p = sub.add_parser('serve', help='Serve fixtures from a local stand-in server')
+    p.add_argument('--fixtures', required=True)
+    p.add_argument('--host', default='127.0.0.1')
+    p.add_argument('--port', type=int, default=8900)
+    p.add_argument('--latency-ms', type=float, default=0)
+    p.add_argument('--bandwidth-kbps', type=float, default=None)
+    p.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with 503')
+    p.add_argument('--reset-rate', type=float, default=0.0, help='Fraction of connections dropped')
+    p.set_defaults(func=serve)
+
+    p = sub.add_parser('app', help='Run the API against the stand-in server')
+    p.add_argument('--upstream', required=True)
+    p.add_argument('--host', default='127.0.0.1')
+    p.add_argument('--port', type=int, default=5000)
+    p.add_argument('--vercel', action='store_true', help='Run app_vercel instead of app')
+    p.set_defaults(func=run_app)
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+"""
+End-to-end request deadlines
+Every request gets a Deadline when it starts. It is derived from the
+platform limit (REQUEST_DEADLINE, lowered on Vercel to what the function may
+run) or, when shorter, from the client's X-Request-Timeout header. The
+extraction chain sizes its timeouts from what is left with timeout(),
+skips fallback methods that can't finish in time with allows(), and
+instrumented yt-dlp and requests sessions check the deadline before every
+upstream call. A client that disconnected cancels the deadline too, so the
+remaining upstream calls are never made.
+
+Downloads and streamed responses are not bounded by the deadline; they
+are paced by the bandwidth scheduler instead.
+
+Environment variables:
+    REQUEST_DEADLINE  Seconds a request may spend end to end (default 120; 55 on Vercel)
+"""
+import os
+import select
+import socket
+import time
+from flask import g, has_request_context, jsonify, request
+
+DEADLINE_HEADER = 'X-Request-Timeout'
+DEFAULT_SECONDS = 120.0
+# Kept back for building and sending the response
+RESPONSE_MARGIN = 2.0
+# Shortest timeout worth starting an upstream call with
+MIN_TIMEOUT = 1.0
+# Budget an extraction method or fallback API needs to be worth starting
+MIN_ATTEMPT_SECONDS = 3.0
+
+
+class DeadlineExceeded(Exception):
+    """The request ran out of time, or its client went away"""
+
+
+class Deadline:
+    """Time budget of one request, shared by every stage working on it"""
+
+    def __init__(self, seconds, client_socket=None):
+        self.seconds = seconds
+        self.expires = time.monotonic() + seconds
+        self.cancelled = None
+        self._socket = client_socket
+
+    def remaining(self):
+        return max(0.0, self.expires - time.monotonic())
+
+    def client_gone(self):
+        """Whether the client closed its connection (a readable socket with nothing to read)"""
+        sock = self._socket
+        if not isinstance(sock, socket.socket) or sock.fileno() < 0:
+            return False
+        try:
+            readable, _, _ = select.select([sock], [], [], 0)
+            return bool(readable) and sock.recv(1, socket.MSG_PEEK) == b''
+        except (OSError, ValueError):
+            return True
+
+    def cancel(self, reason):
+        self.cancelled = self.cancelled or reason
+
+    def check(self):
+        """Raise DeadlineExceeded when the budget is spent or the client is gone"""
+        if self.cancelled is None and self.client_gone():
+            self.cancel('client disconnected')
+        if self.cancelled:
+            raise DeadlineExceeded(f'Request cancelled: {self.cancelled}')
+        if self.remaining() <= 0:
+            raise DeadlineExceeded(f'Request deadline of {self.seconds:.0f}s exceeded')
+
+    def allows(self, seconds):
+        """Whether a stage needing about `seconds` can still finish in time"""
+        return self.cancelled is None and self.remaining() >= seconds
+
+    def timeout(self, cap):
+        """Timeout for one upstream call: `cap`, or less when the budget is short"""
+        self.check()
+        remaining = self.remaining()
+        if remaining < MIN_TIMEOUT:
+            raise DeadlineExceeded(f'Request deadline of {self.seconds:.0f}s exceeded')
+        return min(cap, remaining)
+
+
+def request_seconds(platform_limit=None):
+    """Budget for the current request: the platform limit, or the client's if shorter"""
+    limit = float(os.environ.get('REQUEST_DEADLINE', platform_limit or DEFAULT_SECONDS))
+    try:
+        requested = float(request.headers.get(DEADLINE_HEADER, 0))
+    except ValueError:
+        requested = 0
+    if requested > 0:
+        limit = min(limit, requested)
+    return max(0.0, limit - RESPONSE_MARGIN)
+
+
+def current():
+    """Deadline of the active request, or None outside one"""
+    if not has_request_context():
+        return None
+    return g.get('request_deadline')
+
+
+def timeout(cap):
+    deadline = current()
+    return cap if deadline is None else deadline.timeout(cap)
+
+
+def allows(seconds):
+    deadline = current()
+    return deadline is None or deadline.allows(seconds)
+
+
+def check():
+    deadline = current()
+    if deadline is not None:
+        deadline.check()
+
+
+def ydl_opts(opts, default_socket_timeout=20):
+    """Copy of yt-dlp options whose socket timeout fits the remaining budget"""
+    deadline = current()
+    if deadline is None:
+        return opts
+    return {**opts, 'socket_timeout': deadline.timeout(opts.get('socket_timeout') or default_socket_timeout)}
+
+
+def instrument_ydl(ydl):
+    """Check the deadline before every HTTP request a YoutubeDL instance makes"""
+    deadline = current()
+    if deadline is None:
+        return ydl
+    original_urlopen = ydl.urlopen
+
+    def urlopen(req):
+        deadline.check()
+        return original_urlopen(req)
+
+    ydl.urlopen = urlopen
+    return ydl
+
+
+def instrument_session(session):
+    """Check the deadline before every request made through a requests.Session, and cap its timeout"""
+    original_request = session.request
+
+    def request_with_deadline(method, url, *args, **kwargs):
+        deadline = current()
+        if deadline is not None:
+            timeout = kwargs.get('timeout')
+            cap = max(timeout) if isinstance(timeout, tuple) else timeout
+            kwargs['timeout'] = deadline.timeout(cap or DEFAULT_SECONDS)
+        return original_request(method, url, *args, **kwargs)
+
+    session.request = request_with_deadline
+    return session
+
+
+def call(func):
+    """Run func(); a failure after the budget ran out is reported as DeadlineExceeded"""
+    try:
+        return func()
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        deadline = current()
+        if deadline is not None and (deadline.cancelled or deadline.remaining() < MIN_TIMEOUT):
+            raise DeadlineExceeded(f'Request deadline of {deadline.seconds:.0f}s exceeded ({e})') from e
+        raise
+
+
+def exceeded_response(error):
+    response = jsonify({'error': str(error)})
+    response.status_code = 504
+    return response
+
+
+def init_app(app, platform_limit=None):
+    """Give every request served by the app a deadline"""
+
+    @app.before_request
+    def start_request_deadline():
+        environ = request.environ
+        client_socket = environ.get('gunicorn.socket') or environ.get('werkzeug.socket')
+        g.request_deadline = Deadline(request_seconds(platform_limit), client_socket)
@@ -0,0 +1,293 @@
+"""
+Size-aware delivery planning
+Decides how the selected format reaches the client:
+    redirect  302 to the platform's direct URL (no server bandwidth at all)
+    proxy     the server streams the direct URL through (titled filename,
+              works when the URL needs cookies or headers a browser won't send)
+    download  the server downloads to disk first: yt-dlp for merging,
+              transcoding and HLS/DASH, fetch() (segmented, several
+              connections) for single direct files
+The output size is estimated from filesize, filesize_approx or
+tbr * duration. Small single files are proxied, large ones redirected, and
+when the server is busy anything that can be redirected is. URLs signed for
+the server's IP (googlevideo's ip=) answer a redirected client with 403, so
+they are proxied or downloaded, and only redirected where nothing else is
+allowed.
+
+Environment variables:
+    DELIVERY_STRATEGIES      Comma-separated strategies this deployment may use
+                             (default redirect,proxy,download; Vercel: redirect)
+    DELIVERY_PROXY_MAX_BYTES Largest file proxied instead of redirected (default 100 MB)
+    DELIVERY_BUSY_TRANSFERS  Active server transfers at which the server counts as busy (default 8)
+"""
+import os
+import unicodedata
+from urllib.parse import parse_qs, quote, urlparse
+from flask import Response, request
+from werkzeug.wsgi import ClosingIterator
+import bandwidth
+import segmented
+import timing
+
+REDIRECT = 'redirect'
+PROXY = 'proxy'
+DOWNLOAD = 'download'
+STRATEGIES = (REDIRECT, PROXY, DOWNLOAD)
+
+# Protocols where the format URL is the media file itself
+DIRECT_PROTOCOLS = ('http', 'https')
+CHUNK_SIZE = 256 * 1024
+# Pooled connections kept per upstream host
+POOL_MAXSIZE = 32
+# Query parameters that tie a signed URL to the address that extracted it
+IP_BOUND_PARAMS = ('ip',)
+# Upstream response headers passed through by the proxy
+PROXIED_HEADERS = ('Content-Length', 'Content-Range', 'Accept-Ranges', 'Last-Modified')
+
+USER_AGENT = ('Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
+              '(KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36')
+
+_session = None
+
+
+def allowed_strategies(default=STRATEGIES):
+    configured = os.environ.get('DELIVERY_STRATEGIES')
+    if not configured:
+        return tuple(default)
+    return tuple(s.strip() for s in configured.split(',') if s.strip() in STRATEGIES)
+
+
+def proxy_max_bytes():
+    return int(os.environ.get('DELIVERY_PROXY_MAX_BYTES', 100 * 1024 * 1024))
+
+
+def busy_transfers():
+    return int(os.environ.get('DELIVERY_BUSY_TRANSFERS', 8))
+
+
+def current_load():
+    """Transfers the server is moving bytes for right now"""
+    stats = bandwidth.stats()
+    return stats['ingress']['active'] + stats['egress']['active']
+
+
+def estimate_format_bytes(fmt, duration=None):
+    """(bytes, source) for one format; source is filesize, filesize_approx, bitrate or None"""
+    if fmt.get('filesize'):
+        return int(fmt['filesize']), 'filesize'
+    if fmt.get('filesize_approx'):
+        return int(fmt['filesize_approx']), 'filesize_approx'
+    duration = fmt.get('duration') or duration
+    if fmt.get('tbr') and duration:
+        # tbr is in kbit/s
+        return int(fmt['tbr'] * 1000 / 8 * duration), 'bitrate'
+    return None, None
+
+
+def estimate_bytes(info):
+    """(bytes, source) for the selected format(s); None when any part is unknown"""
+    total, sources = 0, []
+    for fmt in info.get('requested_formats') or [info]:
+        size, source = estimate_format_bytes(fmt, info.get('duration'))
+        if size is None:
+            return None, None
+        total += size
+        sources.append(source)
+    # Report the least precise source used
+    for source in ('bitrate', 'filesize_approx', 'filesize'):
+        if source in sources:
+            return total, source
+    return None, None
+
+
+def needs_credentials(fmt):
+    """Whether fetching the URL takes cookies a browser following a redirect won't have"""
+    headers = {name.lower() for name in (fmt.get('http_headers') or {})}
+    return bool(fmt.get('cookies')) or 'cookie' in headers or 'authorization' in headers
+
+
+def bound_to_server(fmt):
+    """Whether the URL only works from the server's IP (e.g. googlevideo's ip=)"""
+    query = parse_qs(urlparse(fmt.get('url') or '').query)
+    return any(name in query for name in IP_BOUND_PARAMS)
+
+
+def best_progressive(info, max_height=None):
+    """Best single-file (audio+video, direct URL) format, for deployments that can only redirect"""
+    candidates = [fmt for fmt in info.get('formats') or []
+                  if fmt.get('url') and fmt.get('protocol', 'https') in DIRECT_PROTOCOLS
+                  and fmt.get('vcodec') != 'none' and fmt.get('acodec') != 'none'
+                  and (max_height is None or (fmt.get('height') or 0) <= max_height)]
+    if not candidates:
+        return None
+    # yt-dlp sorts formats worst to best
+    return {**candidates[-1], 'title': info.get('title'), 'duration': info.get('duration')}
+
+
+class DeliveryPlan:
+    """The chosen strategy and why"""
+
+    def __init__(self, strategy, reason, estimated_bytes=None, size_source=None, load=0):
+        self.strategy = strategy
+        self.reason = reason
+        self.estimated_bytes = estimated_bytes
+        self.size_source = size_source
+        self.load = load
+
+    def as_dict(self):
+        return {
+            'strategy': self.strategy,
+            'reason': self.reason,
+            'estimated_bytes': self.estimated_bytes,
+            'size_source': self.size_source,
+            'load': self.load,
+        }
+
+    def apply_headers(self, response):
+        response.headers['X-Delivery'] = self.strategy or 'none'
+        response.headers['X-Delivery-Reason'] = self.reason
+        return response
+
+
+def plan(info, postprocessed=False, prefer=None, allowed=None, load=None):
+    """
+    Choose how to deliver the selected format of `info`. `postprocessed` means
+    ffmpeg has to touch the file; `prefer` is a strategy the client asked for.
+    """
+    allowed = allowed_strategies() if allowed is None else allowed
+    load = current_load() if load is None else load
+    size, source = estimate_bytes(info)
+    formats = info.get('requested_formats') or [info]
+    fmt = formats[0]
+
+    if postprocessed:
+        candidates, reason = [DOWNLOAD], 'needs transcoding'
+    elif len(formats) > 1:
+        candidates, reason = [DOWNLOAD], f'needs merging {len(formats)} formats'
+    elif fmt.get('protocol', 'https') not in DIRECT_PROTOCOLS or not fmt.get('url'):
+        candidates, reason = [DOWNLOAD], f"{fmt.get('protocol')} needs a server-side download"
+    elif needs_credentials(fmt):
+        candidates, reason = [PROXY, DOWNLOAD], 'URL needs cookies'
+    elif bound_to_server(fmt):
+        # A redirect only works if the client shares the server's IP
+        candidates, reason = [PROXY, DOWNLOAD, REDIRECT], "URL is bound to the server's IP"
+    elif load >= busy_transfers():
+        candidates, reason = [REDIRECT, PROXY, DOWNLOAD], f'server busy ({load} transfers)'
+    elif size is None:
+        # Unknown sizes are redirected rather than risk proxying a huge file;
+        # URLs that can't be redirected were handled above
+        candidates, reason = [REDIRECT, PROXY, DOWNLOAD], 'size unknown'
+    elif size > proxy_max_bytes():
+        candidates, reason = [REDIRECT, PROXY, DOWNLOAD], 'larger than the proxy limit'
+    else:
+        candidates, reason = [PROXY, REDIRECT, DOWNLOAD], 'small enough to proxy'
+
+    if prefer in candidates:
+        candidates.remove(prefer)
+        candidates.insert(0, prefer)
+        reason = f'requested by client ({reason})'
+    elif prefer:
+        reason = f'{prefer} not possible: {reason}'
+
+    for strategy in candidates:
+        if strategy in allowed:
+            if strategy != candidates[0]:
+                reason = f'{candidates[0]} disabled here ({reason})'
+            return DeliveryPlan(strategy, reason, size, source, load)
+    return DeliveryPlan(None, f"no allowed strategy ({reason})", size, source, load)
+
+
+def attachment_header(filename):
+    """Content-Disposition parameters for a download name, as send_file builds them"""
+    try:
+        filename.encode('ascii')
+        return {'filename': filename}
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize('NFKD', filename).encode('ascii', 'ignore').decode('ascii')
+        return {'filename': simple, 'filename*': f"UTF-8''{quote(filename, safe='!#$&+-.^_`|~')}"}
+
+
+def _get_session():
+    global _session
+    if _session is None:
+        import requests
+        from requests.adapters import HTTPAdapter
+        _session = timing.instrument_session(requests.Session())
+        _session.headers.update({'User-Agent': USER_AGENT})
+        # Segmented downloads hold several connections per host at once
+        adapter = HTTPAdapter(pool_connections=16, pool_maxsize=POOL_MAXSIZE)
+        _session.mount('http://', adapter)
+        _session.mount('https://', adapter)
+    return _session
+
+
+def upstream_headers(fmt):
+    """Request headers for fetching a format's direct URL"""
+    headers = dict(fmt.get('http_headers') or {})
+    # Pass the bytes through untouched so Content-Length stays right
+    headers['Accept-Encoding'] = 'identity'
+    if fmt.get('cookies'):
+        headers['Cookie'] = fmt['cookies']
+    return headers
+
+
+def fetch(fmt, path, progress_hooks=(), label=None, size=None):
+    """
+    Download a direct format URL to `path` without yt-dlp, over several
+    connections when the server allows ranges (see segmented.py), through a
+    .part file renamed when complete. `progress_hooks` get yt-dlp style
+    status dicts (plus contiguous_bytes), so in-flight readers can follow
+    the file as with yt-dlp downloads.
+    """
+    part = path + '.part'
+    transfer = bandwidth.scheduler.register('ingress', label=label, size=size)
+    status = {'status': 'downloading', 'filename': path, 'tmpfilename': part}
+
+    def progress(downloaded, total, contiguous):
+        update = {**status, 'downloaded_bytes': downloaded, 'total_bytes': total or size,
+                  'contiguous_bytes': contiguous}
+        for hook in progress_hooks:
+            hook(update)
+
+    try:
+        with timing.phase('download'):
+            summary = segmented.download(_get_session(), fmt['url'], part, upstream_headers(fmt),
+                                         progress_callback=progress, consume=transfer.consume)
+        os.replace(part, path)
+    finally:
+        transfer.release()
+    finished = {**status, 'status': 'finished', 'downloaded_bytes': summary['bytes'],
+                'total_bytes': summary['bytes'], 'contiguous_bytes': summary['bytes']}
+    for hook in progress_hooks:
+        hook(finished)
+    return path
+
+
+def proxy_response(fmt, filename, label=None, size=None):
+    """Stream a direct format URL through the server, passing Range requests on"""
+    headers = upstream_headers(fmt)
+    if request.headers.get('Range'):
+        headers['Range'] = request.headers['Range']
+
+    with timing.phase('download'):
+        upstream = _get_session().get(fmt['url'], headers=headers, stream=True, timeout=(10, 60))
+    if upstream.status_code >= 400:
+        upstream.close()
+        raise IOError(f'Upstream returned HTTP {upstream.status_code}')
+
+    transfer = bandwidth.scheduler.register('ingress', label=label, size=size)
+
+    def generate():
+        for chunk in upstream.iter_content(CHUNK_SIZE):
+            transfer.consume(len(chunk))
+            yield chunk
+
+    # ClosingIterator also runs the callbacks when the body is never iterated
+    body = ClosingIterator(generate(), [upstream.close, transfer.release])
+    response = Response(body, status=upstream.status_code, mimetype='application/octet-stream',
+                        direct_passthrough=True)
+    for name in PROXIED_HEADERS:
+        if name in upstream.headers:
+            response.headers[name] = upstream.headers[name]
+    response.headers.set('Content-Disposition', 'attachment', **attachment_header(filename))
+    return bandwidth.scheduler.throttle_response(response, label=label, size=size)
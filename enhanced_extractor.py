@@ -4,7 +4,11 @@ Enhanced video extractor with multiple fallback methods
 Specifically designed to handle problematic platforms like TikTok
 """
 import logging
+import sqlite3
 import yt_dlp
+import deadline
+import negative_cache
+from models import VideoMetadata
 from tikwm_extractor import TikWMExtractor, is_tiktok_url
 from advanced_tiktok_extractor import extract_tiktok_with_fallback
 
@@ -15,13 +19,22 @@ class EnhancedExtractor:
         self.tikwm = TikWMExtractor()
     
     def extract_info(self, url, download=False):
-        """Enhanced extraction with multiple fallback methods"""
+        """Enhanced extraction with multiple fallback methods; raises
+        negative_cache.CachedFailure while the URL is held off, rather than
+        walking the whole fallback chain again for a URL that just failed"""
+        negative_cache.hold_off(url)
         
         if is_tiktok_url(url):
             return self._extract_tiktok_enhanced(url, download)
         else:
             return self._extract_standard(url, download)
     
+    def extract_metadata(self, url):
+        """Like extract_info(), normalized into a VideoMetadata whichever method succeeded
+        (raises negative_cache.CachedFailure the same way)"""
+        info = self.extract_info(url)
+        return VideoMetadata.from_info(info) if info else None
+    
     def _extract_tiktok_enhanced(self, url, download=False):
         """Enhanced TikTok extraction with multiple methods"""
         methods = [
@@ -32,20 +45,46 @@ class EnhancedExtractor:
             ("Advanced extractor", self._method_advanced_extractor)
         ]
         
+        errors = []
         for method_name, method_func in methods:
+            if not deadline.allows(deadline.MIN_ATTEMPT_SECONDS):
+                logger.warning("Skipping TikTok extraction from %s on: request deadline too close", method_name)
+                break
             try:
-                logger.info(f"Trying TikTok extraction method: {method_name}")
+                logger.info("Trying TikTok extraction method: %s", method_name)
                 result = method_func(url, download)
                 if result:
-                    logger.info(f"TikTok extraction successful with: {method_name}")
+                    logger.info("TikTok extraction successful with: %s", method_name)
+                    self._clear_failures(url)
                     return result
             except Exception as e:
-                logger.warning(f"Method {method_name} failed: {str(e)}")
-                continue
+                logger.warning("Method %s failed: %s", method_name, e)
+                errors.append(e)
+                # Every other method would hit the same private/deleted/geo-blocked video
+                if negative_cache.classify(e) == negative_cache.PERMANENT:
+                    break
         
         logger.error("All TikTok extraction methods failed")
+        self._record_failure(url, max(errors, key=negative_cache.severity) if errors
+                             else RuntimeError('All TikTok extraction methods failed'))
         return None
     
+    def _record_failure(self, url, error):
+        if not negative_cache.enabled():
+            return
+        try:
+            negative_cache.record(url, error)
+        except sqlite3.Error as e:
+            logger.warning("Could not record failure for %s: %s", url, e)
+    
+    def _clear_failures(self, url):
+        if not negative_cache.enabled():
+            return
+        try:
+            negative_cache.clear(url)
+        except sqlite3.Error as e:
+            logger.warning("Could not clear failures for %s: %s", url, e)
+    
     def _method_tikwm(self, url, download=False):
         """TikWM API method"""
         return self.tikwm.get_video_info(url)
@@ -74,7 +113,8 @@ class EnhancedExtractor:
             'retries': 5
         }
         
-        with yt_dlp.YoutubeDL(opts) as ydl:
+        with yt_dlp.YoutubeDL(deadline.ydl_opts(opts)) as ydl:
+            deadline.instrument_ydl(ydl)
             return ydl.extract_info(url, download=download)
     
     def _method_yt_dlp_mobile(self, url, download=False):
@@ -89,7 +129,8 @@ class EnhancedExtractor:
             'socket_timeout': 30
         }
         
-        with yt_dlp.YoutubeDL(opts) as ydl:
+        with yt_dlp.YoutubeDL(deadline.ydl_opts(opts)) as ydl:
+            deadline.instrument_ydl(ydl)
             return ydl.extract_info(url, download=download)
     
     def _method_yt_dlp_desktop(self, url, download=False):
@@ -105,7 +146,8 @@ class EnhancedExtractor:
             'socket_timeout': 30
         }
         
-        with yt_dlp.YoutubeDL(opts) as ydl:
+        with yt_dlp.YoutubeDL(deadline.ydl_opts(opts)) as ydl:
+            deadline.instrument_ydl(ydl)
             return ydl.extract_info(url, download=download)
     
     def _method_advanced_extractor(self, url, download=False):
@@ -121,5 +163,6 @@ class EnhancedExtractor:
             'retries': 3
         }
         
-        with yt_dlp.YoutubeDL(opts) as ydl:
-            return ydl.extract_info(url, download=download)
+        with yt_dlp.YoutubeDL(deadline.ydl_opts(opts)) as ydl:
+            deadline.instrument_ydl(ydl)
+            return negative_cache.guard(url, lambda: ydl.extract_info(url, download=download))
@@ -0,0 +1,118 @@
+"""
+Pluggable extraction backends
+Some platforms have a cheaper way to their media than a full yt-dlp
+extraction: the TikWM JSON API answers a TikTok URL in one round trip with
+direct no-watermark HD/SD and audio URLs. The backends listed in
+EXTRACTOR_BACKENDS are tried, in order, for the URLs they handle before the
+API falls back to yt-dlp. Their results are normalized into a VideoMetadata,
+so the endpoints shape them like any other extraction, and select() turns
+one into a download target shaped like a yt-dlp format selection, so it is
+delivered from its direct URL without running yt-dlp at all.
+
+Environment variables:
+    EXTRACTOR_BACKENDS  Comma-separated fast paths tried before yt-dlp (default "tikwm"; empty for yt-dlp only)
+"""
+import logging
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+import deadline
+import timing
+from models import VideoMetadata
+
+logger = logging.getLogger(__name__)
+
+# Video fields copied onto a selected format
+SELECTION_FIELDS = ('id', 'title', 'duration', 'uploader', 'thumbnail', 'extractor', 'extractor_key',
+                    'webpage_url')
+
+
+class TikWMBackend:
+    """TikTok through the TikWM API (mirrors only, none of the slower fallback APIs)"""
+    name = 'tikwm'
+    hosts = ('tiktok.com',)
+    # Download preference when the request doesn't name a format: no watermark first
+    preferred_formats = ('hd', 'sd', 'watermark')
+    # A fast path that isn't fast is worse than none: yt-dlp runs after it
+    timeout = 5
+    max_endpoints = 2
+
+    def __init__(self):
+        self._extractor = None
+        self._lock = threading.Lock()
+
+    @property
+    def extractor(self):
+        # Imported on first use: requests isn't needed for cold starts
+        with self._lock:
+            if self._extractor is None:
+                from tikwm_extractor import TikWMExtractor
+                self._extractor = TikWMExtractor()
+            return self._extractor
+
+    def handles(self, url):
+        host = urlsplit(url).netloc.lower().split(':')[0]
+        return any(host == domain or host.endswith('.' + domain) for domain in self.hosts)
+
+    def extract(self, url, keep_urls=False):
+        info = self.extractor.get_video_info_fast(url, self.timeout, self.max_endpoints)
+        if not info or not any(fmt.get('url') for fmt in info.get('formats') or ()):
+            return None
+        return VideoMetadata.from_tikwm(info, keep_urls)
+
+    def choose_format(self, metadata, format_id=None):
+        """The requested format when the backend offers it, else the preferred one"""
+        formats = {fmt.format_id: fmt for fmt in metadata.formats if fmt.url}
+        for candidate in (format_id,) + self.preferred_formats:
+            if candidate in formats:
+                return formats[candidate]
+        return None
+
+
+BACKENDS = {
+    TikWMBackend.name: TikWMBackend(),
+}
+
+
+def enabled_backends():
+    configured = os.environ.get('EXTRACTOR_BACKENDS', 'tikwm')
+    return [BACKENDS[name.strip()] for name in configured.split(',') if name.strip() in BACKENDS]
+
+
+def extract(url, keep_urls=False):
+    """(backend, VideoMetadata) from the first fast path that handles and answers
+    the URL, or (None, None) to fall back to yt-dlp"""
+    for backend in enabled_backends():
+        if not backend.handles(url):
+            continue
+        if not deadline.allows(deadline.MIN_ATTEMPT_SECONDS):
+            break
+        started = time.perf_counter()
+        try:
+            with timing.phase('extract'):
+                metadata = backend.extract(url, keep_urls)
+        except deadline.DeadlineExceeded:
+            raise
+        except Exception as e:
+            logger.warning("Extractor backend %s failed for %s: %s", backend.name, url, e)
+            metadata = None
+        logger.info('extractor_backend', extra={'fields': {
+            'event': 'extractor_backend', 'backend': backend.name, 'hit': metadata is not None,
+            'ms': round((time.perf_counter() - started) * 1000, 1),
+        }})
+        if metadata is not None:
+            return backend, metadata
+    return None, None
+
+
+def select(url, format_id=None):
+    """Download target from a fast path: the chosen format's fields (direct URL
+    included) plus the video's, like a yt-dlp selection; None to fall back"""
+    backend, metadata = extract(url, keep_urls=True)
+    if metadata is None:
+        return None
+    fmt = backend.choose_format(metadata, format_id)
+    if fmt is None:
+        return None
+    return {**metadata.to_dict(SELECTION_FIELDS), **fmt.to_dict(), 'extractor_backend': backend.name}
@@ -0,0 +1,176 @@
+"""
+Serving finished download files
+How a file that is complete on disk reaches the client (FILE_SERVING):
+    python            send_file; the worker reads and writes every byte (default)
+    sendfile          the WSGI server's wsgi.file_wrapper is handed the file
+                      untouched, so servers that support it (gunicorn) send it
+                      with os.sendfile() without copying it through Python
+    x-accel-redirect  nginx serves the file from an internal location mapped to
+                      FILE_SERVING_ROOT; the worker only sends headers
+    x-sendfile        the same for Apache mod_xsendfile and lighttpd, by path
+                      (both proxy modes assume the proxy opens the file within
+                      FILE_SERVING_CLEANUP_DELAY seconds of the hand-off, see below)
+The download's temp dir is released once nothing needs the file any more:
+when the WSGI server closes the body for python and sendfile, and
+FILE_SERVING_CLEANUP_DELAY seconds after the hand-off for the front proxy
+modes. The proxy opens the file as soon as it reads the response headers,
+and an open file keeps being served after it is deleted; the app can't see
+when that happens, so the delay must exceed the longest the proxy may take
+to read the response (a proxy queueing responses under load needs more).
+
+Files being downloaded, files outside FILE_SERVING_ROOT and (for sendfile)
+egress-capped deployments, where the bandwidth scheduler has to pace the
+bytes, are served by Python.
+
+Environment variables:
+    FILE_SERVING                python, sendfile, x-accel-redirect or x-sendfile (default python)
+    FILE_SERVING_ROOT           Directory the proxy's internal location maps to (default system temp dir)
+    FILE_SERVING_ACCEL_PREFIX   nginx internal location for FILE_SERVING_ROOT (default /protected-downloads/)
+    FILE_SERVING_CLEANUP_DELAY  Seconds files handed to the proxy are kept before removal (default 60)
+"""
+import logging
+import os
+import tempfile
+import threading
+from urllib.parse import quote
+from flask import Response, request, send_file
+from werkzeug.wsgi import ClosingIterator
+import bandwidth
+import delivery
+
+logger = logging.getLogger(__name__)
+
+PYTHON = 'python'
+SENDFILE = 'sendfile'
+X_ACCEL_REDIRECT = 'x-accel-redirect'
+X_SENDFILE = 'x-sendfile'
+MODES = (PYTHON, SENDFILE, X_ACCEL_REDIRECT, X_SENDFILE)
+# Modes where the front proxy reads the file itself
+PROXY_MODES = {X_ACCEL_REDIRECT: 'X-Accel-Redirect', X_SENDFILE: 'X-Sendfile'}
+
+
+def mode():
+    configured = os.environ.get('FILE_SERVING', PYTHON).strip().lower()
+    if configured not in MODES:
+        logger.warning("Unknown FILE_SERVING %r, serving files from Python", configured)
+        return PYTHON
+    return configured
+
+
+def serving_root():
+    return os.path.realpath(os.environ.get('FILE_SERVING_ROOT') or tempfile.gettempdir())
+
+
+def accel_prefix():
+    return '/' + os.environ.get('FILE_SERVING_ACCEL_PREFIX', '/protected-downloads/').strip('/') + '/'
+
+
+def cleanup_delay():
+    return float(os.environ.get('FILE_SERVING_CLEANUP_DELAY', 60))
+
+
+def proxy_location(path, serving):
+    """Header value telling the proxy which file to send, or None when it can't reach it"""
+    path = os.path.realpath(path)
+    relative = os.path.relpath(path, serving_root())
+    if relative.startswith(os.pardir + os.sep) or relative == os.pardir:
+        return None
+    # Header values must be latin-1; titles with emojis are percent-encoded
+    # (nginx and mod_xsendfile unescape them)
+    if serving == X_ACCEL_REDIRECT:
+        return accel_prefix() + quote(relative.replace(os.sep, '/'))
+    return quote(path)
+
+
+class ReleasingFile:
+    """File object that runs release() once when it is closed. It is what the
+    server's own wsgi.file_wrapper wraps, so the server still recognises the
+    body and sends it with sendfile() through fileno(), and closing the
+    body releases the download, whatever the wrapper class looks like"""
+
+    def __init__(self, file, release):
+        self._file = file
+        self._release = release
+        self._released = False
+
+    def fileno(self):
+        return self._file.fileno()
+
+    def read(self, size=-1):
+        return self._file.read(size)
+
+    def __getattr__(self, name):
+        # seek, tell, readinto, ... of the underlying file
+        return getattr(self._file, name)
+
+    def close(self):
+        try:
+            self._file.close()
+        finally:
+            if not self._released:
+                self._released = True
+                self._release()
+
+
+def send_releasing_file(path, download_name, release):
+    """send_file whose body is built by the server's wsgi.file_wrapper around
+    a ReleasingFile, instead of around the bare file"""
+    environ = request.environ
+    server_wrapper = environ['wsgi.file_wrapper']
+    environ['wsgi.file_wrapper'] = lambda file, *args: server_wrapper(ReleasingFile(file, release), *args)
+    try:
+        return send_file(path, as_attachment=True, download_name=download_name,
+                         mimetype='application/octet-stream')
+    finally:
+        environ['wsgi.file_wrapper'] = server_wrapper
+
+
+def is_server_file_wrapper(body):
+    file_wrapper = request.environ.get('wsgi.file_wrapper')
+    return isinstance(file_wrapper, type) and isinstance(body, file_wrapper)
+
+
+def send(path, download_name, release, label=None):
+    """
+    Response for a finished file at `path`, served the configured way;
+    release() runs exactly once, when the file is no longer needed
+    """
+    serving = mode()
+    size = os.path.getsize(path)
+
+    if serving in PROXY_MODES:
+        location = proxy_location(path, serving)
+        if location is not None:
+            response = Response(mimetype='application/octet-stream')
+            response.headers[PROXY_MODES[serving]] = location
+            response.headers.set('Content-Disposition', 'attachment', **delivery.attachment_header(download_name))
+            response.headers['X-File-Serving'] = serving
+            timer = threading.Timer(cleanup_delay(), release)
+            timer.daemon = True
+            timer.start()
+            logger.info('file_handoff', extra={'fields': {
+                'event': 'file_handoff', 'mode': serving, 'bytes': size,
+            }})
+            return response
+        logger.warning("%s is outside FILE_SERVING_ROOT, serving it from Python", path)
+        serving = PYTHON
+
+    if (serving == SENDFILE and bandwidth.scheduler.limits['egress'] is None
+            and isinstance(request.environ.get('wsgi.file_wrapper'), type)):
+        response = send_releasing_file(path, download_name, release)
+        if is_server_file_wrapper(response.response):
+            response.headers['X-File-Serving'] = SENDFILE
+            return response
+        # e.g. a Range request: werkzeug wrapped the body, and closing that
+        # still closes the ReleasingFile
+        response.headers['X-File-Serving'] = PYTHON
+        return response
+
+    response = send_file(path, as_attachment=True, download_name=download_name,
+                         mimetype='application/octet-stream')
+
+    # ClosingIterator also runs when the body is never iterated (call_on_close
+    # callbacks don't run for send_file's direct-passthrough bodies)
+    response.response = ClosingIterator(response.response, release)
+    response.headers['X-File-Serving'] = PYTHON
+    return bandwidth.scheduler.throttle_response(response, label=label, size=size)
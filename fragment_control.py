@@ -0,0 +1,194 @@
+"""
+Adaptive fragment concurrency for DASH/HLS downloads
+yt-dlp downloads the fragments of a DASH/HLS format with a fixed number of
+threads (concurrent_fragment_downloads, default 1). The controller picks that
+number per download: it hill-climbs per CDN host, doubling while the
+measured aggregate throughput keeps improving and falling back to the last
+level that helped when it doesn't. It halves after fragment errors, steps
+down while the host CPU is saturated, and splits a global thread budget
+across the downloads that are active at the same time.
+
+Environment variables:
+    FRAGMENT_CONCURRENCY_MAX  Upper bound per download (default 16)
+    FRAGMENT_THREAD_BUDGET    Fragment threads shared by all active downloads (default 32)
+"""
+import os
+import threading
+import time
+from urllib.parse import urlparse
+
+START_LEVEL = 2
+# Relative throughput gain a level must show over the one below it to be kept
+RAMP_GAIN = 1.10
+# Downloads shorter or smaller than this are too noisy to learn from
+MIN_SAMPLE_SECONDS = 0.5
+MIN_SAMPLE_BYTES = 512 * 1024
+# 1-minute load average per CPU above which the host counts as saturated
+SATURATED_LOAD = 0.9
+EWMA_ALPHA = 0.3
+
+
+def cpu_load():
+    """1-minute load average per CPU, or 0 where it isn't available"""
+    try:
+        return os.getloadavg()[0] / (os.cpu_count() or 1)
+    except (AttributeError, OSError):
+        return 0.0
+
+
+def download_host(info):
+    """CDN host a selected format is fetched from"""
+    formats = info.get('requested_formats') or [info]
+    for fmt in formats:
+        url = fmt.get('fragment_base_url') or fmt.get('manifest_url') or fmt.get('url')
+        if url:
+            return urlparse(url).netloc
+    return 'unknown'
+
+
+class FragmentController:
+    """Choose per-download fragment concurrency from observed throughput"""
+
+    def __init__(self, max_level=None, thread_budget=None, load=cpu_load):
+        self.max_level = max_level or int(os.environ.get('FRAGMENT_CONCURRENCY_MAX', 16))
+        self.thread_budget = thread_budget or int(os.environ.get('FRAGMENT_THREAD_BUDGET', 32))
+        self.load = load
+        self.active_downloads = 0
+        self.active_threads = 0
+        self._hosts = {}
+        self._totals = {'downloads': 0, 'fragmented': 0, 'bytes': 0, 'seconds': 0.0, 'errors': 0}
+        self._last = None
+        self._lock = threading.Lock()
+
+    def _host_state(self, host):
+        return self._hosts.setdefault(host, {'level': START_LEVEL, 'throughput': {}})
+
+    def acquire(self, host):
+        """Reserve fragment threads for a download; returns a FragmentLease"""
+        with self._lock:
+            level = self._host_state(host)['level']
+            if self.load() >= SATURATED_LOAD:
+                level = max(1, level // 2)
+            share = max(1, self.thread_budget // (self.active_downloads + 1))
+            concurrency = max(1, min(level, share, self.max_level))
+            self.active_downloads += 1
+            self.active_threads += concurrency
+        return FragmentLease(self, host, concurrency)
+
+    def release(self, lease):
+        """Return a lease's threads and learn from what it observed"""
+        throughput = lease.bytes / lease.seconds if lease.seconds else 0.0
+        with self._lock:
+            self.active_downloads -= 1
+            self.active_threads -= lease.concurrency
+            self._totals['downloads'] += 1
+            self._totals['bytes'] += lease.bytes
+            self._totals['seconds'] += lease.seconds
+            self._totals['errors'] += lease.errors
+            self._last = {
+                'host': lease.host,
+                'concurrency': lease.concurrency,
+                'fragmented': lease.fragmented,
+                'throughput_bps': round(throughput),
+                'errors': lease.errors,
+            }
+            if not lease.fragmented:
+                return
+            self._totals['fragmented'] += 1
+            state = self._host_state(lease.host)
+            if lease.errors:
+                state['level'] = max(1, lease.concurrency // 2)
+                return
+            if lease.seconds < MIN_SAMPLE_SECONDS or lease.bytes < MIN_SAMPLE_BYTES:
+                return
+            if self.load() >= SATURATED_LOAD:
+                state['level'] = max(1, lease.concurrency - 1)
+                return
+
+            samples = state['throughput']
+            level = lease.concurrency
+            previous = samples.get(level)
+            samples[level] = throughput if previous is None else EWMA_ALPHA * throughput + (1 - EWMA_ALPHA) * previous
+            lower = max((k for k in samples if k < level), default=None)
+            higher = min((k for k in samples if k > level), default=None)
+            # Don't climb again to a level that already measured no better
+            tried_higher = higher is not None and samples[higher] <= samples[level] * RAMP_GAIN
+            if (lower is None or samples[level] > samples[lower] * RAMP_GAIN) and not tried_higher:
+                state['level'] = min(self.max_level, level * 2)
+            elif lower is not None and samples[level] <= samples[lower] * RAMP_GAIN:
+                # The extra threads didn't pay for themselves
+                state['level'] = lower
+            else:
+                state['level'] = level
+
+    def stats(self):
+        """Snapshot for /api/metrics"""
+        with self._lock:
+            totals = dict(self._totals)
+            return {
+                'active_downloads': self.active_downloads,
+                'active_fragment_threads': self.active_threads,
+                'thread_budget': self.thread_budget,
+                'cpu_load': round(self.load(), 2),
+                'downloads': totals['downloads'],
+                'fragmented_downloads': totals['fragmented'],
+                'fragment_errors': totals['errors'],
+                'throughput_bps': round(totals['bytes'] / totals['seconds']) if totals['seconds'] else 0,
+                'last': self._last,
+                'hosts': {host: {
+                    'level': state['level'],
+                    'throughput_bps': {level: round(value) for level, value in sorted(state['throughput'].items())},
+                } for host, state in self._hosts.items()},
+            }
+
+
+class FragmentLease:
+    """Concurrency chosen for one download, plus what the download observed"""
+
+    def __init__(self, controller, host, concurrency):
+        self.controller = controller
+        self.host = host
+        self.concurrency = concurrency
+        self.bytes = 0
+        self.seconds = 0.0
+        self.errors = 0
+        self.fragmented = False
+        self._started = time.monotonic()
+        self._released = False
+
+    def progress_hook(self, status):
+        if status.get('fragment_count') is not None or status.get('fragment_index') is not None:
+            self.fragmented = True
+        if status.get('status') == 'finished':
+            self.bytes += status.get('total_bytes') or status.get('downloaded_bytes') or 0
+            self.seconds += status.get('elapsed') or 0.0
+
+    def instrument(self, ydl):
+        """Apply the chosen concurrency to a YoutubeDL and observe its downloads"""
+        ydl.params['concurrent_fragment_downloads'] = self.concurrency
+        ydl.add_progress_hook(self.progress_hook)
+        original_to_screen = ydl.to_screen
+
+        def to_screen(message, *args, **kwargs):
+            # Fragment retries are only reported as "[download] Got error: ..." lines
+            if isinstance(message, str) and 'Got error' in message:
+                self.errors += 1
+            return original_to_screen(message, *args, **kwargs)
+
+        ydl.to_screen = to_screen
+        return ydl
+
+    def release(self):
+        if self._released:
+            return
+        self._released = True
+        if not self.seconds:
+            self.seconds = time.monotonic() - self._started
+        self.controller.release(self)
+
+
+controller = FragmentController()
+
+
+def stats():
+    return controller.stats()
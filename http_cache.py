@@ -0,0 +1,110 @@
+"""
+HTTP caching semantics and compression for API responses
+Routes declare a Cache-Control policy with @cache_control(...). For GET
+requests every buffered response gets an ETag computed from its content, and
+If-None-Match is answered with 304. Text responses above a size threshold
+are compressed with brotli (when the brotli package is installed) or gzip,
+depending on the client's Accept-Encoding.
+
+Environment variables:
+    COMPRESS_MIN_BYTES  Smallest body worth compressing (default 1024)
+"""
+import gzip
+import hashlib
+import os
+from flask import current_app, request
+
+# Lists that only change with a deploy
+STATIC = 'public, max-age=86400, stale-while-revalidate=604800'
+# Per-URL video metadata: fine to reuse briefly, signed media URLs expire
+METADATA = 'public, max-age=300, stale-while-revalidate=60'
+# Live status and per-request results
+NO_STORE = 'no-store'
+
+COMPRESSIBLE_TYPES = ('text/', 'application/json', 'application/javascript', 'application/xml',
+                      'image/svg+xml')
+
+
+def cache_control(policy):
+    """Declare the Cache-Control policy of a view"""
+    def decorator(view):
+        view.cache_control = policy
+        return view
+    return decorator
+
+
+def min_compress_bytes():
+    return int(os.environ.get('COMPRESS_MIN_BYTES', 1024))
+
+
+def negotiate_encoding(size):
+    """Pick 'br', 'gzip' or None for a body of `size` bytes"""
+    if size < min_compress_bytes():
+        return None
+    accepted = request.accept_encodings
+    candidates = []
+    if _brotli() is not None and accepted['br']:
+        candidates.append((accepted['br'], 1, 'br'))
+    if accepted['gzip']:
+        candidates.append((accepted['gzip'], 0, 'gzip'))
+    if not candidates:
+        return None
+    return max(candidates)[2]
+
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return _brotli().compress(data, quality=5)
+    return gzip.compress(data, compresslevel=6)
+
+
+def _brotli():
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+
+def _route_policy():
+    view = current_app.view_functions.get(request.endpoint)
+    return getattr(view, 'cache_control', None)
+
+
+def _is_compressible(response):
+    return (response.mimetype or '').startswith(COMPRESSIBLE_TYPES)
+
+
+def finalize_response(response):
+    """Apply the route's cache policy, ETag/304 handling and compression"""
+    policy = _route_policy()
+    if policy and response.status_code == 200 and 'Cache-Control' not in response.headers:
+        response.headers['Cache-Control'] = policy
+
+    if (response.direct_passthrough or response.is_streamed or 'Content-Encoding' in response.headers
+            or not _is_compressible(response)):
+        return response
+
+    body = response.get_data()
+    encoding = negotiate_encoding(len(body))
+    response.vary.add('Accept-Encoding')
+
+    if request.method in ('GET', 'HEAD') and response.status_code == 200 and response.get_etag()[0] is None:
+        # Each encoding is a different representation, so it gets its own tag
+        etag = hashlib.sha256(body).hexdigest()[:32]
+        response.set_etag(f'{etag}-{encoding}' if encoding else etag)
+        response.make_conditional(request)
+        if response.status_code == 304:
+            return response
+
+    if encoding:
+        response.set_data(compress(body, encoding))
+        response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def init_app(app):
+    """Register the caching/compression pass; call before other after_request hooks
+    that rewrite bodies, since Flask runs after_request hooks in reverse order"""
+    app.after_request(finalize_response)
+    return app
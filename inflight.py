@@ -0,0 +1,276 @@
+"""
+Shared in-flight downloads
+A download is registered under a canonical key (the video, format selector
+and audio options) while anyone is still reading it. A request for the same
+key attaches to the running download instead of starting another one: for
+plain single-file HTTP downloads it reads the growing .part file through its
+own file handle, at its own pace; downloads that get merged or
+post-processed are served once the final file exists. The temp directory is
+removed when the last reader is done, however it went away.
+
+Attached requests never wait on the download indefinitely: waiting for it
+to become readable is bounded by the request's deadline, and a download that
+reports no progress for INFLIGHT_STALL_SECONDS fails its waiting requests
+and readers, so a hung download doesn't hold their workers forever.
+
+Environment variables:
+    INFLIGHT_STALL_SECONDS  Seconds without progress before attached requests give up (default 120)
+"""
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import metadata_store
+
+# Protocols whose .part file grows in order and becomes the final file unchanged
+STREAMABLE_PROTOCOLS = ('http', 'https')
+CHUNK_SIZE = 256 * 1024
+# How long a reader at the end of the growing file waits between checks
+POLL_SECONDS = 0.5
+
+
+def stall_seconds():
+    return float(os.environ.get('INFLIGHT_STALL_SECONDS', 120))
+
+
+class DownloadStalled(OSError):
+    """A shared download made no progress for too long, or a wait for it ran out"""
+
+
+def download_key(url, format_selector, audio_only=False, audio_format=None):
+    """Key two requests must share to be served by the same download"""
+    video = None
+    if metadata_store.enabled():
+        try:
+            video = metadata_store.lookup_key(url)
+        except sqlite3.Error:
+            pass
+    return (video or metadata_store.normalize_url(url), format_selector, bool(audio_only),
+            audio_format if audio_only else None)
+
+
+def is_streamable(info, postprocessed=False):
+    """Whether readers can follow the download file while it is written"""
+    if postprocessed or info.get('requested_formats'):
+        return False
+    if (info.get('container') or '').endswith('_dash'):
+        return False  # gets rewritten by the m4a/mp4 fixup afterwards
+    return info.get('protocol') in STREAMABLE_PROTOCOLS
+
+
+class InflightDownload:
+    """One download and the requests reading it"""
+
+    def __init__(self, registry, key):
+        self.registry = registry
+        self.key = key
+        self.temp_dir = tempfile.mkdtemp()
+        self.readers = 1
+        self.info = None
+        self.streamable = False
+        self.growing_path = None
+        self.total_bytes = None
+        # Bytes complete from the start of a file written out of order
+        # (segmented downloads); None when it grows in order
+        self.contiguous_bytes = None
+        self.path = None
+        self.error = None
+        self.done = False
+        # Extra yt-dlp progress hooks of whoever runs the download
+        self.progress_hooks = []
+        # The prefetch.PrefetchJob when the download was started speculatively
+        self.prefetch = None
+        # time.monotonic() of the last sign of life from the download
+        self.updated = time.monotonic()
+        self._cond = threading.Condition()
+
+    def stalled(self, now=None):
+        """Whether the download has shown no progress for INFLIGHT_STALL_SECONDS"""
+        now = time.monotonic() if now is None else now
+        return not self.done and now - self.updated > stall_seconds()
+
+    def wait(self, predicate, timeout=None):
+        """Wait (holding _cond) until predicate() holds; raises DownloadStalled
+        when `timeout` runs out or the download stops making progress"""
+        ends = None if timeout is None else time.monotonic() + timeout
+        while not predicate():
+            now = time.monotonic()
+            if ends is not None and now >= ends:
+                raise DownloadStalled(f'Shared download not ready after {timeout:.0f}s')
+            if self.stalled(now):
+                raise DownloadStalled(f'Shared download made no progress for {stall_seconds():.0f}s')
+            self._cond.wait(POLL_SECONDS if ends is None else min(POLL_SECONDS, ends - now))
+
+    def publish(self, info, postprocessed=False):
+        """Announce what is downloaded; progress_hook() then publishes the growing file"""
+        with self._cond:
+            self.info = info
+            self.streamable = is_streamable(info, postprocessed)
+            self.updated = time.monotonic()
+
+    def instrument(self, ydl, info, postprocessed=False):
+        """Publish the growing file of a YoutubeDL download to attached readers"""
+        self.publish(info, postprocessed)
+        ydl.add_progress_hook(self.progress_hook)
+        return ydl
+
+    def progress_hook(self, status):
+        with self._cond:
+            if self.growing_path is None and status.get('status') == 'downloading':
+                self.growing_path = status.get('tmpfilename') or status.get('filename')
+            self.total_bytes = status.get('total_bytes') or self.total_bytes
+            if 'contiguous_bytes' in status:
+                self.contiguous_bytes = status['contiguous_bytes']
+            self.updated = time.monotonic()
+            self._cond.notify_all()
+        for hook in self.progress_hooks:
+            hook(status)
+
+    def finish(self, path, info):
+        with self._cond:
+            self.path, self.info, self.done = path, info, True
+            self._cond.notify_all()
+
+    def fail(self, error):
+        with self._cond:
+            self.error, self.done = error, True
+            self._cond.notify_all()
+        # Later requests start over instead of inheriting the failure
+        self.registry.forget(self)
+
+    def wait_ready(self, timeout=None):
+        """Block until readers can start, at most `timeout` seconds (and never
+        past a stall); returns 'growing', 'done', 'failed' or 'timeout'"""
+        with self._cond:
+            try:
+                self.wait(lambda: self.done or (self.streamable and self.growing_path), timeout)
+            except DownloadStalled:
+                return 'timeout'
+            if self.error is not None:
+                return 'failed'
+            if self.done:
+                return 'done' if self.path else 'failed'
+            return 'growing'
+
+    def open_reader(self):
+        return GrowingReader(self)
+
+    def release(self):
+        """Drop one reader; the last one removes the files"""
+        self.registry.release(self)
+
+    def cleanup(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+
+class GrowingReader:
+    """File object over a download that is still being written"""
+
+    def __init__(self, download):
+        self.download = download
+        try:
+            self._file = open(download.growing_path, 'rb', buffering=0)
+        except FileNotFoundError:
+            # The .part file was renamed to the final one after wait_ready() returned
+            with download._cond:
+                download.wait(lambda: download.done)
+            if not download.path:
+                raise
+            self._file = open(download.path, 'rb', buffering=0)
+        self._closed = False
+
+    def read(self, size=CHUNK_SIZE):
+        if size is None or size < 0:
+            size = CHUNK_SIZE
+        download = self.download
+        while True:
+            # A preallocated file is only readable up to its contiguous prefix
+            limit = None if download.done else download.contiguous_bytes
+            wanted = size if limit is None else min(size, max(0, limit - self._file.tell()))
+            data = self._file.read(wanted) if wanted else b''
+            if data:
+                return data
+            with download._cond:
+                if download.error is not None:
+                    raise OSError(f'Shared download failed: {download.error}')
+                if download.done:
+                    # The handle still points at the file after the .part rename
+                    return self._file.read(size)
+                if download.stalled():
+                    raise DownloadStalled(f'Shared download made no progress for {stall_seconds():.0f}s')
+                download._cond.wait(POLL_SECONDS)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._file.close()
+        self.download.release()
+
+
+class InflightRegistry:
+    """Downloads in progress (or still being read), by key"""
+
+    def __init__(self):
+        self._downloads = {}
+        self._lock = threading.RLock()
+        self.shared_requests = 0
+
+    def attach(self, key):
+        """Join the download running under `key` as a reader, or return None"""
+        with self._lock:
+            download = self._downloads.get(key)
+            if download is not None:
+                download.readers += 1
+                self.shared_requests += 1
+            return download
+
+    def acquire(self, key):
+        """Return (download, is_leader); the leader runs the download, others attach to it"""
+        with self._lock:
+            download = self.attach(key)
+            if download is not None:
+                return download, False
+            download = InflightDownload(self, key)
+            self._downloads[key] = download
+            return download, True
+
+    def detach_if_unused(self, download):
+        """Forget a download nobody but its runner reads; returns whether it was"""
+        with self._lock:
+            if download.readers > 1:
+                return False
+            if self._downloads.get(download.key) is download:
+                del self._downloads[download.key]
+            return True
+
+    def forget(self, download):
+        with self._lock:
+            if self._downloads.get(download.key) is download:
+                del self._downloads[download.key]
+
+    def release(self, download):
+        with self._lock:
+            download.readers -= 1
+            if download.readers > 0:
+                return
+            if self._downloads.get(download.key) is download:
+                del self._downloads[download.key]
+        download.cleanup()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'downloads': len(self._downloads),
+                'readers': sum(download.readers for download in self._downloads.values()),
+                'shared_requests': self.shared_requests,
+            }
+
+
+registry = InflightRegistry()
+
+
+def stats():
+    return registry.stats()
@@ -0,0 +1,217 @@
+"""
+Non-blocking, sampled, structured logging pipeline
+Request threads only put LogRecords on a queue; a background listener
+formats them (JSON by default) and writes them to stdout. Repetitive
+messages are rate limited per logger and message template before they are
+queued, so dropped records are never formatted.
+
+On Vercel and Netlify (VERCEL or NETLIFY set) the queue is flushed at the
+end of every request: a frozen function never runs atexit, and records
+still queued at the freeze would be lost.
+
+Environment variables:
+    LOG_LEVEL          Root level (default INFO)
+    LOG_LEVELS         Per-module levels, e.g. "tikwm_extractor=WARNING,timing=INFO"
+    LOG_FORMAT         "json" (default) or "text"
+    LOG_ASYNC          "0" to write synchronously (no background thread)
+    LOG_SAMPLE_LIMIT   Records allowed per template and window (default 20, 0 disables)
+    LOG_SAMPLE_WINDOW  Sampling window in seconds (default 60)
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+_listener = None
+_queue_handler = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Render a record as one JSON object per line"""
+
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        if getattr(record, 'suppressed', 0):
+            entry['suppressed'] = record.suppressed
+        fields = getattr(record, 'fields', None)
+        if fields:
+            entry.update(fields)
+        if record.exc_text:
+            entry['exc_info'] = record.exc_text
+        elif record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    """Classic text format with structured fields appended as JSON"""
+
+    def format(self, record):
+        line = super().format(record)
+        if getattr(record, 'suppressed', 0):
+            line += f' [{record.suppressed} similar messages suppressed]'
+        fields = getattr(record, 'fields', None)
+        if fields:
+            line += ' ' + json.dumps(fields, default=str, ensure_ascii=False)
+        return line
+
+
+class RateLimitFilter(logging.Filter):
+    """Let through at most `limit` records per (logger, template, level) per window
+
+    The key uses the unformatted message template, so "%s failed" messages
+    from a retry loop are treated as one kind of message. The first record
+    after a suppressed stretch carries a `suppressed` count. Structured
+    events (records with `fields`) are never sampled.
+
+    Counters whose window has expired (and that have nothing suppressed to
+    report) are dropped once per window, and at
+    most `max_keys` are kept (least recently used go first), so messages
+    with ever-changing templates can't grow memory on a long-running server.
+    """
+
+    def __init__(self, limit=20, window=60.0, max_keys=10000):
+        super().__init__()
+        self.limit = limit
+        self.window = window
+        self.max_keys = max_keys
+        self._counters = OrderedDict()
+        self._next_prune = time.monotonic() + window
+        self._lock = threading.Lock()
+
+    def _prune(self, now):
+        # Counters with suppressed records are kept to report the count on
+        # the template's next record (the max_keys cap still bounds them)
+        expired = [key for key, (window_start, _, suppressed) in self._counters.items()
+                   if now - window_start >= self.window and not suppressed]
+        for key in expired:
+            del self._counters[key]
+        self._next_prune = now + self.window
+
+    def filter(self, record):
+        if not self.limit or record.levelno >= logging.CRITICAL or hasattr(record, 'fields'):
+            return True
+        key = (record.name, record.msg, record.levelno)
+        now = time.monotonic()
+        with self._lock:
+            if now >= self._next_prune:
+                self._prune(now)
+            window_start, passed, suppressed = self._counters.get(key, (now, 0, 0))
+            if now - window_start >= self.window:
+                window_start, passed = now, 0
+            if passed < self.limit:
+                if suppressed:
+                    record.suppressed = suppressed
+                self._counters[key] = (window_start, passed + 1, 0)
+                allowed = True
+            else:
+                self._counters[key] = (window_start, passed, suppressed + 1)
+                allowed = False
+            self._counters.move_to_end(key)
+            while len(self._counters) > self.max_keys:
+                self._counters.popitem(last=False)
+            return allowed
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """Queue records without formatting them, dropping instead of blocking when full"""
+
+    dropped = 0
+
+    def prepare(self, record):
+        # Formatting happens on the listener thread; only materialise the
+        # traceback text here because exc_info can't outlive the except block
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            NonBlockingQueueHandler.dropped += 1
+
+
+def serverless():
+    return bool(os.environ.get('VERCEL') or os.environ.get('NETLIFY'))
+
+
+def flush(timeout=1.0):
+    """Wait (up to `timeout` seconds) until the listener has written every queued record"""
+    if _listener is None:
+        return True
+    records = _listener.queue
+    with records.all_tasks_done:
+        return records.all_tasks_done.wait_for(lambda: not records.unfinished_tasks, timeout)
+
+
+def init_app(app):
+    """Flush queued records at the end of every request on serverless platforms"""
+    if serverless():
+        app.teardown_request(lambda error: flush())
+    return app
+
+
+def parse_module_levels(spec):
+    """Parse "module=LEVEL,other=LEVEL" into a dict"""
+    levels = {}
+    for item in (spec or '').split(','):
+        if '=' not in item:
+            continue
+        name, level = item.split('=', 1)
+        levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def configure_logging(level=None, module_levels=None, fmt=None):
+    """Install the logging pipeline on the root logger (safe to call more than once)"""
+    global _listener, _queue_handler
+
+    level = (level or os.environ.get('LOG_LEVEL', 'INFO')).upper()
+    module_levels = module_levels if module_levels is not None else parse_module_levels(os.environ.get('LOG_LEVELS'))
+    fmt = fmt or os.environ.get('LOG_FORMAT', 'json')
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    for name, module_level in module_levels.items():
+        logging.getLogger(name).setLevel(module_level)
+
+    if _queue_handler is not None:
+        return root
+
+    writer = logging.StreamHandler(sys.stdout)
+    writer.setFormatter(TextFormatter(TEXT_FORMAT) if fmt == 'text' else JsonFormatter())
+
+    sampler = RateLimitFilter(
+        limit=int(os.environ.get('LOG_SAMPLE_LIMIT', 20)),
+        window=float(os.environ.get('LOG_SAMPLE_WINDOW', 60)),
+    )
+
+    if os.environ.get('LOG_ASYNC', '1') == '0':
+        handler = writer
+    else:
+        handler = NonBlockingQueueHandler(queue.Queue(maxsize=10000))
+        _listener = logging.handlers.QueueListener(handler.queue, writer)
+        _listener.start()
+        atexit.register(_listener.stop)
+    handler.addFilter(sampler)
+    _queue_handler = handler
+
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    return root
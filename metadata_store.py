@@ -0,0 +1,266 @@
+"""
+Persistent metadata store shared by every worker on the host
+Normalized extraction results are kept in a local SQLite database (WAL mode,
+so gunicorn workers read concurrently), keyed by canonical video id
+("<extractor>:<id>") with request URLs recorded as aliases. Volatile fields
+such as view and like counts expire quickly and stable ones slowly; expired
+entries are still served immediately while one worker refreshes them in the
+background. Old entries are removed by compact(), which also runs
+periodically on writes.
+
+Environment variables:
+    METADATA_STORE           "0" to disable the store
+    METADATA_DB              Database path (default <tmp>/metadata-store.sqlite3)
+    METADATA_VOLATILE_TTL    Seconds view/like counts stay fresh (default 600)
+    METADATA_STABLE_TTL      Seconds titles, formats etc. stay fresh (default 7 days)
+    METADATA_MAX_AGE         Entries older than this are never served and get compacted (default 30 days)
+"""
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+from models import STABLE_FIELDS, VOLATILE_FIELDS, VideoMetadata
+
+logger = logging.getLogger(__name__)
+
+# Volatile fields older than this are blanked rather than served stale
+VOLATILE_MAX_STALE = 3600
+# How long a worker may hold the refresh lease of an entry
+REFRESH_LEASE = 120
+COMPACT_INTERVAL = 3600
+
+# Query parameters that never change which video a URL points to
+TRACKING_PARAMS = ('si', 'feature', 'is_from_webapp', 'sender_device', 'igshid', 'fbclid')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS videos (
+    key TEXT PRIMARY KEY,
+    stable TEXT NOT NULL,
+    volatile TEXT NOT NULL,
+    stored_at REAL NOT NULL,
+    stable_expires REAL NOT NULL,
+    volatile_expires REAL NOT NULL,
+    refresh_lease REAL NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS aliases (
+    url TEXT PRIMARY KEY,
+    key TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS aliases_key ON aliases (key);
+CREATE TABLE IF NOT EXISTS failures (
+    key TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    error TEXT NOT NULL,
+    failures INTEGER NOT NULL,
+    expires REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS store_meta (
+    name TEXT PRIMARY KEY,
+    value REAL NOT NULL
+);
+"""
+
+_local = threading.local()
+_refresher = None
+_refresher_lock = threading.Lock()
+
+
+def enabled():
+    return os.environ.get('METADATA_STORE', '1') != '0'
+
+
+def db_path():
+    return os.environ.get('METADATA_DB', os.path.join(tempfile.gettempdir(), 'metadata-store.sqlite3'))
+
+
+def _ttl(name, default):
+    return float(os.environ.get(name, default))
+
+
+def connection():
+    """One connection per thread (and per database path)"""
+    path = db_path()
+    conn = getattr(_local, 'conn', None)
+    if conn is None or getattr(_local, 'path', None) != path:
+        conn = sqlite3.connect(path, timeout=5, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.executescript(SCHEMA)
+        _local.conn, _local.path = conn, path
+    return conn
+
+
+@contextmanager
+def transaction(conn):
+    """Group statements atomically (the connection is in autocommit mode)"""
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        yield conn
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+    conn.execute('COMMIT')
+
+
+def normalize_url(url):
+    """Canonical form of a request URL for alias lookups"""
+    parts = urlsplit(url.strip())
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+             if k not in TRACKING_PARAMS and not k.startswith('utm_')]
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path.rstrip('/') or '/',
+                       urlencode(sorted(query)), ''))
+
+
+def canonical_key(info):
+    extractor = info.get('extractor_key') or info.get('extractor') or 'generic'
+    return f"{extractor}:{info.get('id') or info.get('webpage_url')}"
+
+
+def normalize(info):
+    """Split an extraction result (or VideoMetadata) into (stable, volatile) field dicts"""
+    metadata = VideoMetadata.from_info(info)
+    # Media URLs are left out because they expire
+    stable = metadata.to_dict(STABLE_FIELDS + ('formats',), keep_urls=False)
+    volatile = metadata.to_dict(VOLATILE_FIELDS)
+    return stable, volatile
+
+
+def put(url, info, now=None):
+    """Store an extraction result and alias the request URL to it; returns the stored document"""
+    now = time.time() if now is None else now
+    key = canonical_key(info)
+    stable, volatile = normalize(info)
+    with transaction(connection()) as conn:
+        conn.execute(
+            'INSERT INTO videos (key, stable, volatile, stored_at, stable_expires, volatile_expires, refresh_lease) '
+            'VALUES (?, ?, ?, ?, ?, ?, 0) ON CONFLICT (key) DO UPDATE SET stable = excluded.stable, '
+            'volatile = excluded.volatile, stored_at = excluded.stored_at, stable_expires = excluded.stable_expires, '
+            'volatile_expires = excluded.volatile_expires, refresh_lease = 0',
+            (key, json.dumps(stable, ensure_ascii=False), json.dumps(volatile), now,
+             now + _ttl('METADATA_STABLE_TTL', 7 * 86400), now + _ttl('METADATA_VOLATILE_TTL', 600)))
+        for alias in {normalize_url(url), normalize_url(info.get('webpage_url') or url)}:
+            conn.execute('INSERT OR REPLACE INTO aliases (url, key) VALUES (?, ?)', (alias, key))
+    maybe_compact(now)
+    return {**stable, **volatile}
+
+
+def get(url, now=None):
+    """Return (document, state, key) for a URL; state is 'fresh', 'stale' or None for a miss"""
+    now = time.time() if now is None else now
+    row = connection().execute(
+        'SELECT v.key, v.stable, v.volatile, v.stored_at, v.stable_expires, v.volatile_expires '
+        'FROM aliases a JOIN videos v ON v.key = a.key WHERE a.url = ?', (normalize_url(url),)).fetchone()
+    if row is None:
+        return None, None, None
+    key, stable, volatile, stored_at, stable_expires, volatile_expires = row
+    if now - stored_at > _ttl('METADATA_MAX_AGE', 30 * 86400):
+        return None, None, key
+
+    document = json.loads(stable)
+    if now - volatile_expires < VOLATILE_MAX_STALE:
+        document.update(json.loads(volatile))
+    state = 'fresh' if now < volatile_expires and now < stable_expires else 'stale'
+    return document, state, key
+
+
+def lookup_key(url):
+    """Canonical key a URL has been stored under, or None"""
+    row = connection().execute('SELECT key FROM aliases WHERE url = ?', (normalize_url(url),)).fetchone()
+    return row[0] if row else None
+
+
+def claim_refresh(key, now=None):
+    """Take the refresh lease of an entry; only one worker on the host wins it"""
+    now = time.time() if now is None else now
+    cursor = connection().execute('UPDATE videos SET refresh_lease = ? WHERE key = ? AND refresh_lease < ?',
+                                  (now + REFRESH_LEASE, key, now))
+    return cursor.rowcount == 1
+
+
+def _get_refresher():
+    global _refresher
+    with _refresher_lock:
+        if _refresher is None:
+            _refresher = ThreadPoolExecutor(max_workers=2, thread_name_prefix='metadata-refresh')
+        return _refresher
+
+
+def _refresh(url, extract):
+    try:
+        put(url, extract())
+    except Exception as e:
+        logger.warning("Background metadata refresh failed for %s: %s", url, e)
+
+
+def get_or_extract(url, extract):
+    """
+    Return (VideoMetadata, state) for a URL, calling extract() on a miss.
+    Stale entries are returned as-is while extract() runs in the background.
+    state is 'hit', 'stale', 'miss' or 'off' (store disabled or unusable).
+    """
+    if not enabled():
+        return VideoMetadata.from_info(extract()), 'off'
+    try:
+        document, state, key = get(url)
+    except sqlite3.Error as e:
+        logger.warning("Metadata store unavailable: %s", e)
+        return VideoMetadata.from_info(extract()), 'off'
+
+    if state == 'fresh':
+        return VideoMetadata.from_dict(document), 'hit'
+    if state == 'stale':
+        if claim_refresh(key):
+            _get_refresher().submit(_refresh, url, extract)
+        return VideoMetadata.from_dict(document), 'stale'
+
+    metadata = VideoMetadata.from_info(extract())
+    try:
+        put(url, metadata)
+    except sqlite3.Error as e:
+        logger.warning("Could not store metadata for %s: %s", url, e)
+    return metadata, 'miss'
+
+
+def compact(now=None):
+    """Delete entries past METADATA_MAX_AGE, orphaned aliases and expired failures, then shrink the database files"""
+    now = time.time() if now is None else now
+    conn = connection()
+    with transaction(conn):
+        removed = conn.execute('DELETE FROM videos WHERE stored_at < ?',
+                               (now - _ttl('METADATA_MAX_AGE', 30 * 86400),)).rowcount
+        conn.execute('DELETE FROM aliases WHERE key NOT IN (SELECT key FROM videos)')
+        # Expired negative-cache entries (see negative_cache.py)
+        conn.execute('DELETE FROM failures WHERE expires < ?', (now,))
+    page_count = conn.execute('PRAGMA page_count').fetchone()[0]
+    free_pages = conn.execute('PRAGMA freelist_count').fetchone()[0]
+    if page_count and free_pages > page_count // 4:
+        conn.execute('VACUUM')
+    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    logger.info('metadata_compaction', extra={'fields': {
+        'event': 'metadata_compaction', 'removed': removed, 'free_pages': free_pages,
+    }})
+    return removed
+
+
+def maybe_compact(now=None):
+    """Run compact() if no worker has done so within COMPACT_INTERVAL"""
+    now = time.time() if now is None else now
+    conn = connection()
+    conn.execute("INSERT OR IGNORE INTO store_meta (name, value) VALUES ('last_compaction', ?)", (now,))
+    claimed = conn.execute("UPDATE store_meta SET value = ? WHERE name = 'last_compaction' AND value < ?",
+                           (now, now - COMPACT_INTERVAL)).rowcount
+    if claimed:
+        compact(now)
+
+
+if __name__ == '__main__':
+    import sys
+    if sys.argv[1:] != ['compact']:
+        sys.exit('usage: python metadata_store.py compact')
+    print(f"Removed {compact()} expired entries from {db_path()}")
@@ -0,0 +1,154 @@
+"""
+Compact metadata model
+yt-dlp info dicts carry hundreds of keys (per-format http_headers, fragment
+lists, requested_formats...), and the TikTok API extractors return shapes of
+their own. Every extraction is normalized once into a VideoMetadata with a
+tuple of FormatRecords; both use __slots__, and the low-cardinality strings
+(codecs, containers, protocols) are interned so thousands of formats share
+one copy. Endpoints read them like info dicts (get, [], in) and caches
+store them through to_dict()/from_dict().
+"""
+import sys
+from datetime import datetime, timezone
+
+# Fields that change while a video is live; everything else in STABLE_FIELDS
+# only changes when the uploader edits the video
+VOLATILE_FIELDS = ('view_count', 'like_count', 'comment_count', 'repost_count', 'concurrent_view_count')
+STABLE_FIELDS = ('id', 'title', 'duration', 'uploader', 'uploader_id', 'channel', 'upload_date', 'timestamp',
+                 'description', 'thumbnail', 'extractor', 'extractor_key', 'webpage_url', 'live_status',
+                 'ext', 'width', 'height')
+# Format fields worth keeping (url only when asked for, see FormatRecord)
+FORMAT_FIELDS = ('format_id', 'ext', 'resolution', 'height', 'width', 'filesize', 'filesize_approx', 'fps',
+                 'vcodec', 'acodec', 'abr', 'tbr', 'format_note', 'protocol')
+# Strings repeated across formats and videos
+INTERNED_FIELDS = frozenset(('ext', 'resolution', 'vcodec', 'acodec', 'format_note', 'protocol',
+                             'extractor', 'extractor_key', 'live_status'))
+
+
+def _intern(field, value):
+    if field in INTERNED_FIELDS and type(value) is str:
+        return sys.intern(value)
+    return value
+
+
+class _Record:
+    """Read-only dict-style access to a slotted record; None means absent"""
+    __slots__ = ()
+
+    def get(self, name, default=None):
+        value = getattr(self, name, None)
+        return default if value is None else value
+
+    def __getitem__(self, name):
+        value = getattr(self, name, None)
+        if value is None:
+            raise KeyError(name)
+        return value
+
+    def __contains__(self, name):
+        return getattr(self, name, None) is not None
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.to_dict()!r})'
+
+
+class FormatRecord(_Record):
+    """One downloadable format; `url` is kept only for callers that redirect or proxy"""
+    __slots__ = FORMAT_FIELDS + ('url',)
+
+    def __init__(self, **fields):
+        for field in self.__slots__:
+            setattr(self, field, _intern(field, fields.get(field)))
+
+    @classmethod
+    def from_info(cls, fmt, keep_url=False):
+        record = cls.__new__(cls)
+        for field in FORMAT_FIELDS:
+            setattr(record, field, _intern(field, fmt.get(field)))
+        record.url = fmt.get('url') if keep_url else None
+        return record
+
+    @classmethod
+    def from_tikwm(cls, fmt, keep_url=False):
+        """Formats of the TikWM/SnapTik/TikMate/SaveTT extractors ({'format_id', 'quality', 'ext', 'url', 'filesize'})"""
+        audio = fmt.get('format_id') == 'audio' or fmt.get('quality') == 'Audio'
+        return cls(format_id=fmt.get('format_id'), ext=fmt.get('ext'), format_note=fmt.get('quality'),
+                   filesize=fmt.get('filesize') or None,
+                   vcodec='none' if audio else None, acodec=fmt.get('ext') if audio else None,
+                   resolution='audio only' if audio else None, protocol='https',
+                   url=(fmt.get('url') or None) if keep_url else None)
+
+    def to_dict(self, keep_url=True):
+        result = {}
+        for field in self.__slots__ if keep_url else FORMAT_FIELDS:
+            value = getattr(self, field)
+            if value is not None:
+                result[field] = value
+        return result
+
+    @classmethod
+    def from_dict(cls, document):
+        return cls(**document)
+
+
+class VideoMetadata(_Record):
+    """Normalized result of one extraction, whichever extractor produced it"""
+    __slots__ = STABLE_FIELDS + VOLATILE_FIELDS + ('formats',)
+
+    def __init__(self, formats=(), **fields):
+        for field in STABLE_FIELDS + VOLATILE_FIELDS:
+            setattr(self, field, _intern(field, fields.get(field)))
+        self.formats = tuple(formats)
+
+    @classmethod
+    def from_info(cls, info, keep_urls=False):
+        """Build from any extractor's result (yt-dlp info dict, TikTok API dict or a VideoMetadata)"""
+        if isinstance(info, VideoMetadata):
+            return info
+        if info.get('platform') and not info.get('extractor_key'):
+            return cls.from_tikwm(info, keep_urls)
+        metadata = cls.__new__(cls)
+        for field in STABLE_FIELDS + VOLATILE_FIELDS:
+            setattr(metadata, field, _intern(field, info.get(field)))
+        metadata.formats = tuple(FormatRecord.from_info(fmt, keep_urls) for fmt in info.get('formats') or ())
+        return metadata
+
+    @classmethod
+    def from_tikwm(cls, info, keep_urls=False):
+        """Build from the dicts tikwm_extractor returns"""
+        created = info.get('upload_date')
+        timestamp = created if isinstance(created, (int, float)) else None
+        upload_date = (datetime.fromtimestamp(timestamp, timezone.utc).strftime('%Y%m%d')
+                       if timestamp is not None else created)
+        platform = info.get('platform') or 'TikTok'
+        return cls(
+            formats=[FormatRecord.from_tikwm(fmt, keep_urls) for fmt in info.get('formats') or ()],
+            id=info.get('id'), title=info.get('title'), duration=info.get('duration'),
+            uploader=info.get('uploader'), upload_date=upload_date, timestamp=timestamp,
+            description=info.get('description'), thumbnail=info.get('thumbnail'),
+            extractor=platform.lower(), extractor_key=platform, webpage_url=info.get('webpage_url'),
+            view_count=info.get('view_count'), like_count=info.get('like_count'),
+            comment_count=info.get('comment_count'), repost_count=info.get('share_count'),
+        )
+
+    def to_dict(self, fields=None, keep_urls=True):
+        """Plain dict for JSON; `fields` limits it to those names (formats included when listed)"""
+        result = {}
+        for field in fields or self.__slots__:
+            if field == 'formats':
+                result['formats'] = [fmt.to_dict(keep_urls) for fmt in self.formats]
+                continue
+            value = getattr(self, field)
+            if value is not None:
+                result[field] = value
+        return result
+
+    @classmethod
+    def from_dict(cls, document):
+        """Inverse of to_dict(); documents come from our own caches, so no normalization"""
+        fields = dict(document)
+        formats = [FormatRecord.from_dict(fmt) for fmt in fields.pop('formats', None) or ()]
+        return cls(formats, **fields)
@@ -0,0 +1,201 @@
+"""
+Negative cache for failing extractions
+Extraction failures are classified as permanent (private, deleted,
+geo-blocked or age-restricted videos, unsupported URLs), rate-limited (HTTP
+429 from the platform) or transient (timeouts, 5xx and other yt-dlp or
+network errors). Only yt-dlp errors and network errors (OSError, which
+includes requests' and urllib's) are classified; anything else is a bug on
+our side, never cached, and re-raised untouched. Permanent failures are
+remembered per URL for a long TTL and answered immediately with the original
+error; transient ones get a short backoff window per URL that doubles while
+they keep failing. Rate limits are keyed by host, not URL: a 429 throttles
+this server's IP for the whole platform, so one rate-limited URL holds off
+every URL of that site. Entries live in the metadata store's SQLite
+database, so all workers on the host share them; a success clears them.
+
+Environment variables:
+    NEGATIVE_CACHE                   "0" to disable
+    NEGATIVE_CACHE_PERMANENT_TTL     Seconds a permanent failure is remembered (default 3600)
+    NEGATIVE_CACHE_TRANSIENT_BACKOFF First backoff after a transient failure (default 5 s, doubling up to 300 s)
+    NEGATIVE_CACHE_RATE_LIMIT_TTL    First hold-off after a rate limit (default 60 s, doubling up to 900 s)
+"""
+import logging
+import math
+import os
+import sqlite3
+import time
+from urllib.parse import urlsplit
+from flask import jsonify
+import metadata_store
+
+logger = logging.getLogger(__name__)
+
+PERMANENT = 'permanent'
+RATE_LIMITED = 'rate_limited'
+TRANSIENT = 'transient'
+# Least to most severe, for picking one failure out of several
+SEVERITY = (TRANSIENT, RATE_LIMITED, PERMANENT)
+
+PERMANENT_PATTERNS = (
+    'private video', 'video is private', 'this account is private', 'video unavailable',
+    'this video is unavailable', 'video is not available', 'has been removed', 'was deleted',
+    'been terminated', 'does not exist', 'in your country', 'geo restrict', 'geo-restrict',
+    'confirm your age', 'age-restricted', 'age restricted', 'inappropriate for some users',
+    'members-only', 'join this channel', 'unsupported url', 'http error 404', 'http error 410',
+)
+PERMANENT_ERRORS = ('GeoRestrictedError', 'UnsupportedError')
+# Base class of yt-dlp's errors (DownloadError, ExtractorError, ...), matched
+# by name so yt_dlp isn't imported here; network errors are OSErrors
+PLATFORM_ERRORS = ('YoutubeDLError',)
+RATE_LIMIT_PATTERNS = ('http error 429', 'too many requests', 'rate limit', 'rate-limit')
+# Failures caused by the request rather than the URL; never cached
+REQUEST_PATTERNS = ('requested format', 'format is not available')
+REQUEST_ERRORS = ('DeadlineExceeded',)
+
+TRANSIENT_MAX_SECONDS = 300
+RATE_LIMIT_MAX_SECONDS = 900
+
+STATUS_CODES = {PERMANENT: 400, RATE_LIMITED: 429, TRANSIENT: 503}
+
+
+class CachedFailure(Exception):
+    """A URL (or its host) failed recently; `str()` is the original error"""
+
+    def __init__(self, kind, error, retry_after):
+        super().__init__(error)
+        self.kind = kind
+        self.error = error
+        self.retry_after = retry_after
+
+
+def enabled():
+    return os.environ.get('NEGATIVE_CACHE', '1') != '0'
+
+
+def _ttl(kind, failures):
+    if kind == PERMANENT:
+        return float(os.environ.get('NEGATIVE_CACHE_PERMANENT_TTL', 3600))
+    if kind == RATE_LIMITED:
+        base, cap = float(os.environ.get('NEGATIVE_CACHE_RATE_LIMIT_TTL', 60)), RATE_LIMIT_MAX_SECONDS
+    else:
+        base, cap = float(os.environ.get('NEGATIVE_CACHE_TRANSIENT_BACKOFF', 5)), TRANSIENT_MAX_SECONDS
+    return min(cap, base * 2 ** (failures - 1))
+
+
+def is_platform_error(error):
+    """Whether `error` came from the platform or the network rather than our code"""
+    return isinstance(error, OSError) or any(cls.__name__ in PLATFORM_ERRORS for cls in type(error).__mro__)
+
+
+def classify(error):
+    """PERMANENT, RATE_LIMITED, TRANSIENT, or None for failures the URL isn't to blame for"""
+    if not is_platform_error(error):
+        return None
+    inner = (getattr(error, 'exc_info', None) or (None, None))[1] or error.__cause__
+    names = {type(error).__name__, type(inner).__name__}
+    message = str(error).lower()
+    if names.intersection(REQUEST_ERRORS) or any(pattern in message for pattern in REQUEST_PATTERNS):
+        return None
+    if names.intersection(PERMANENT_ERRORS) or any(pattern in message for pattern in PERMANENT_PATTERNS):
+        return PERMANENT
+    if any(pattern in message for pattern in RATE_LIMIT_PATTERNS):
+        return RATE_LIMITED
+    return TRANSIENT
+
+
+def severity(error):
+    kind = classify(error)
+    return SEVERITY.index(kind) if kind else -1
+
+
+def url_key(url):
+    return 'url:' + metadata_store.normalize_url(url)
+
+
+def host_key(url):
+    host = urlsplit(url.strip()).netloc.lower()
+    for prefix in ('www.', 'm.'):
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+    return 'host:' + host
+
+
+def check(url, now=None):
+    """Raise CachedFailure while the URL (or its host) is held off"""
+    now = time.time() if now is None else now
+    row = metadata_store.connection().execute(
+        'SELECT kind, error, expires FROM failures WHERE key IN (?, ?) AND expires > ? '
+        'ORDER BY expires DESC LIMIT 1', (url_key(url), host_key(url), now)).fetchone()
+    if row is not None:
+        kind, error, expires = row
+        raise CachedFailure(kind, error, math.ceil(expires - now))
+
+
+def record(url, error, now=None):
+    """Remember a failed extraction; returns its classification"""
+    kind = classify(error)
+    if kind is None:
+        return None
+    now = time.time() if now is None else now
+    key = host_key(url) if kind == RATE_LIMITED else url_key(url)
+    with metadata_store.transaction(metadata_store.connection()) as conn:
+        row = conn.execute('SELECT kind, failures FROM failures WHERE key = ?', (key,)).fetchone()
+        failures = row[1] + 1 if row is not None and row[0] == kind else 1
+        ttl = _ttl(kind, failures)
+        conn.execute('INSERT OR REPLACE INTO failures (key, kind, error, failures, expires) VALUES (?, ?, ?, ?, ?)',
+                     (key, kind, str(error), failures, now + ttl))
+    logger.info('negative_cache', extra={'fields': {
+        'event': 'negative_cache', 'key': key, 'kind': kind, 'failures': failures, 'ttl': ttl,
+    }})
+    return kind
+
+
+def clear(url):
+    """Forget the failures of a URL (and its host) after a success"""
+    metadata_store.connection().execute('DELETE FROM failures WHERE key IN (?, ?)', (url_key(url), host_key(url)))
+
+
+def hold_off(url):
+    """check() when the cache is enabled, tolerating an unavailable database;
+    for callers that reach the platform outside guard()"""
+    if not enabled():
+        return
+    try:
+        check(url)
+    except sqlite3.Error as e:
+        logger.warning("Negative cache unavailable: %s", e)
+
+
+def guard(url, extract):
+    """Run extract() unless the URL is held off; platform failures are
+    recorded, successes clear them, other exceptions pass through untouched"""
+    if not enabled():
+        return extract()
+    hold_off(url)
+    try:
+        result = extract()
+    except CachedFailure:
+        raise
+    except Exception as e:
+        if classify(e) is None:
+            raise
+        try:
+            record(url, e)
+        except sqlite3.Error as db_error:
+            logger.warning("Could not record failure for %s: %s", url, db_error)
+        raise
+    try:
+        clear(url)
+    except sqlite3.Error as e:
+        logger.warning("Could not clear failures for %s: %s", url, e)
+    return result
+
+
+def failure_response(failure, prefix):
+    """Answer a held-off request like the original failure, plus when to retry"""
+    response = jsonify({'error': f'{prefix}: {failure.error}', 'failure': failure.kind,
+                        'retry_after': failure.retry_after})
+    response.status_code = STATUS_CODES[failure.kind]
+    response.headers['Retry-After'] = str(failure.retry_after)
+    response.headers['X-Negative-Cache'] = 'hit'
+    return response
@@ -1,80 +1,185 @@
 """
 Netlify serverless function for the video downloader API
+Translates Netlify (Lambda-style) events to WSGI and back. The Flask app is
+loaded once per warm container and reused across invocations; request and
+response bodies are passed through as bytes, base64-encoded when binary.
 """
+import base64
+import io
 import json
 import os
 import sys
+from urllib.parse import urlencode
 
 # Add the root directory to the Python path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
 
+# Netlify's synchronous response payload limit, counted after binary bodies
+# are base64-encoded (4 bytes out for every 3 in)
+MAX_BUFFERED_BODY = int(os.environ.get('NETLIFY_MAX_BODY', 6 * 1024 * 1024))
+CHUNK_SIZE = 64 * 1024
+
+TEXT_CONTENT_TYPES = ('text/', 'application/json', 'application/javascript', 'application/xml',
+                      'image/svg+xml')
+
+_app = None
+
+
+def get_app():
+    """Import the Flask app on first use and keep it for warm invocations"""
+    global _app
+    if _app is None:
+        from app_vercel import app
+        _app = app
+    return _app
+
+
+def event_to_environ(event):
+    """Build a WSGI environ from a Netlify function event"""
+    headers = {k.lower(): v for k, v in (event.get('headers') or {}).items()}
+    for key, values in (event.get('multiValueHeaders') or {}).items():
+        if values:
+            # Cookie pairs are separated by "; ", every other header by ", "
+            headers[key.lower()] = ('; ' if key.lower() == 'cookie' else ', ').join(values)
+
+    body = event.get('body') or b''
+    if isinstance(body, str):
+        body = base64.b64decode(body) if event.get('isBase64Encoded') else body.encode('utf-8')
+
+    query = event.get('rawQuery')
+    if query is None:
+        multi = event.get('multiValueQueryStringParameters')
+        if multi:
+            query = urlencode([(k, v) for k, values in multi.items() for v in values])
+        else:
+            query = urlencode(event.get('queryStringParameters') or {})
+
+    host = headers.get('host', 'localhost')
+    environ = {
+        'REQUEST_METHOD': event.get('httpMethod', 'GET'),
+        'SCRIPT_NAME': '',
+        'PATH_INFO': event.get('path', '/'),
+        'QUERY_STRING': query,
+        'CONTENT_TYPE': headers.get('content-type', ''),
+        'CONTENT_LENGTH': str(len(body)),
+        'SERVER_NAME': host.split(':')[0],
+        'SERVER_PORT': headers.get('x-forwarded-port', '443'),
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'REMOTE_ADDR': headers.get('x-nf-client-connection-ip', headers.get('client-ip', '')),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': headers.get('x-forwarded-proto', 'https'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': False,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for key, value in headers.items():
+        name = key.upper().replace('-', '_')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            environ[f'HTTP_{name}'] = value
+    return environ
+
+
+def run_wsgi(app, environ):
+    """Call a WSGI app, returning (status code, header list, body iterable)"""
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        response['status'] = int(status.split(' ', 1)[0])
+        response['headers'] = headers
+        return lambda data: None
+
+    body = app(environ, start_response)
+    return response['status'], response['headers'], body
+
+
+def is_text(headers):
+    # Compressed bodies are binary whatever their content type
+    if any(k.lower() == 'content-encoding' for k, _ in headers):
+        return False
+    content_type = next((v for k, v in headers if k.lower() == 'content-type'), '')
+    return content_type.startswith(TEXT_CONTENT_TYPES)
+
+
+def iter_chunks(body, chunk_size=CHUNK_SIZE):
+    """Re-chunk a WSGI body iterable and close it when done"""
+    try:
+        buffer = bytearray()
+        for data in body:
+            buffer.extend(data)
+            while len(buffer) >= chunk_size:
+                yield bytes(buffer[:chunk_size])
+                del buffer[:chunk_size]
+        if buffer:
+            yield bytes(buffer)
+    finally:
+        if hasattr(body, 'close'):
+            body.close()
+
+
+def max_body_bytes(text):
+    """Largest body that still fits the payload limit once encoded"""
+    return MAX_BUFFERED_BODY if text else MAX_BUFFERED_BODY * 3 // 4
+
+
+def build_headers(header_list):
+    """Split WSGI headers into Netlify's headers / multiValueHeaders"""
+    headers, multi = {}, {}
+    for key, value in header_list:
+        multi.setdefault(key, []).append(value)
+        headers[key] = value
+    return headers, {k: v for k, v in multi.items() if len(v) > 1}
+
+
+def error_response(status, message):
+    return {
+        'statusCode': status,
+        'headers': {'Content-Type': 'application/json'},
+        'body': json.dumps({'error': message}),
+    }
+
+
 def handler(event, context):
     """
     Netlify function handler
     """
     try:
-        # Import the Flask app
-        from app_vercel import app
-        
-        # Extract request data
-        method = event.get('httpMethod', 'GET')
-        path = event.get('path', '/')
-        query_string = event.get('queryStringParameters') or {}
-        headers = event.get('headers', {})
-        body = event.get('body', '')
-        
-        # Convert query parameters to proper format
-        query_string_list = []
-        for key, value in query_string.items():
-            if value:
-                query_string_list.append(f"{key}={value}")
-        query_string_formatted = '&'.join(query_string_list)
-        
-        # Create a mock request environment
-        environ = {
-            'REQUEST_METHOD': method,
-            'PATH_INFO': path,
-            'QUERY_STRING': query_string_formatted,
-            'CONTENT_TYPE': headers.get('content-type', ''),
-            'CONTENT_LENGTH': str(len(body)) if body else '0',
-            'wsgi.input': body,
-            'SERVER_NAME': 'localhost',
-            'SERVER_PORT': '443',
-            'wsgi.url_scheme': 'https'
-        }
-        
-        # Add headers to environ
-        for key, value in headers.items():
-            key = key.upper().replace('-', '_')
-            if key not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
-                key = f'HTTP_{key}'
-            environ[key] = value
-        
-        # Process the request
-        with app.test_client() as client:
-            if method == 'GET':
-                response = client.get(path, query_string=query_string_formatted)
-            elif method == 'POST':
-                response = client.post(path, data=body, 
-                                     content_type=headers.get('content-type', 'application/json'))
-            elif method == 'PUT':
-                response = client.put(path, data=body,
-                                    content_type=headers.get('content-type', 'application/json'))
-            elif method == 'DELETE':
-                response = client.delete(path)
-            else:
-                response = client.open(path, method=method, data=body,
-                                     content_type=headers.get('content-type', 'application/json'))
-        
-        return {
-            'statusCode': response.status_code,
-            'headers': dict(response.headers),
-            'body': response.get_data(as_text=True)
-        }
-        
+        status, header_list, body = run_wsgi(get_app(), event_to_environ(event))
+        text = is_text(header_list)
+        limit = max_body_bytes(text)
+
+        data = bytearray()
+        chunks = iter_chunks(body)
+        for chunk in chunks:
+            data.extend(chunk)
+            if len(data) > limit:
+                # Closing the generator closes the WSGI body so temp files are cleaned up
+                chunks.close()
+                return error_response(502, 'Response too large for a serverless function; '
+                                           'use the direct_url from /api/download instead')
+
+        headers, multi = build_headers(header_list)
+        result = {'statusCode': status, 'headers': headers}
+        if multi:
+            result['multiValueHeaders'] = multi
+        if text:
+            result['body'] = data.decode('utf-8', errors='replace')
+            result['isBase64Encoded'] = False
+        else:
+            result['body'] = base64.b64encode(bytes(data)).decode('ascii')
+            result['isBase64Encoded'] = True
+        return result
+
     except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {'Content-Type': 'application/json'},
-            'body': json.dumps({'error': f'Internal server error: {str(e)}'})
-        }
+        return error_response(500, f'Internal server error: {str(e)}')
+    finally:
+        # Records logged while the body was read, before the container freezes
+        flush_logs()
+
+
+def flush_logs():
+    if _app is not None:
+        from log_config import flush
+        flush()
+
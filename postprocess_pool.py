@@ -0,0 +1,214 @@
+"""
+Dedicated worker pool for ffmpeg post-processing
+yt-dlp normally runs merging and audio conversion inline in the request
+thread. schedule(ydl) routes the ffmpeg postprocessors of a YoutubeDL
+instance to a separate, fixed-size process pool whose workers run at a
+lower CPU priority (ffmpeg children inherit it), so request threads only
+wait on a future and a burst of conversions can't starve request handling.
+Jobs get a JSON-safe copy of the info dict (sanitize_info); only the keys
+the worker changed, added or removed are applied back to the original, so
+values that don't survive sanitizing reach later postprocessors intact.
+
+Environment variables:
+    POSTPROCESS_POOL     "0" to run postprocessors inline (default: pooled)
+    POSTPROCESS_WORKERS  Concurrent ffmpeg jobs (default: half the CPUs, at least 1)
+    POSTPROCESS_NICE     Niceness added in worker processes (default 10)
+"""
+import atexit
+import importlib
+import logging
+import multiprocessing
+import os
+import resource
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Postprocessors that shell out to ffmpeg and are worth moving off the request thread
+POOLED_POSTPROCESSORS = {
+    'FFmpegMergerPP', 'FFmpegExtractAudioPP', 'FFmpegVideoConvertorPP',
+    'FFmpegVideoRemuxerPP', 'FFmpegFixupM3u8PP', 'FFmpegFixupM4aPP',
+}
+
+# YoutubeDL params the postprocessors read, forwarded to the worker's YoutubeDL
+FORWARDED_PARAMS = ('ffmpeg_location', 'postprocessor_args', 'keepvideo', 'nopostoverwrites',
+                    'quiet', 'no_warnings', 'verbose')
+
+_pool = None
+_pool_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_stats = {
+    'submitted': 0,
+    'completed': 0,
+    'failed': 0,
+    'in_flight': 0,
+    'wait_seconds': 0.0,
+    'run_seconds': 0.0,
+    'cpu_seconds': 0.0,
+}
+
+
+def enabled():
+    return os.environ.get('POSTPROCESS_POOL', '1') != '0'
+
+
+def max_workers():
+    default = max(1, (os.cpu_count() or 2) // 2)
+    return int(os.environ.get('POSTPROCESS_WORKERS', default))
+
+
+def get_pool():
+    """Create the process pool on first use"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn: forking a threaded web worker (logging listener, request
+            # threads) can deadlock the child
+            _pool = ProcessPoolExecutor(
+                max_workers=max_workers(),
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+                initargs=(int(os.environ.get('POSTPROCESS_NICE', 10)),),
+            )
+            atexit.register(_pool.shutdown, wait=False, cancel_futures=True)
+        return _pool
+
+
+def stats():
+    """Snapshot of pool metrics for /api/metrics"""
+    with _stats_lock:
+        snapshot = dict(_stats)
+    workers = max_workers()
+    snapshot['workers'] = workers
+    snapshot['queue_depth'] = max(0, snapshot['in_flight'] - workers)
+    snapshot['enabled'] = enabled()
+    for key in ('wait_seconds', 'run_seconds', 'cpu_seconds'):
+        snapshot[key] = round(snapshot[key], 3)
+    return snapshot
+
+
+# ---------------------------------------------------------------------------
+# Worker process side
+# ---------------------------------------------------------------------------
+
+_worker_ydls = {}
+
+
+def _init_worker(niceness):
+    if niceness:
+        try:
+            os.nice(niceness)
+        except OSError:
+            pass
+
+
+def _worker_ydl(params):
+    key = repr(sorted(params.items()))
+    if key not in _worker_ydls:
+        import yt_dlp
+        _worker_ydls[key] = yt_dlp.YoutubeDL(params)
+    return _worker_ydls[key]
+
+
+def _cpu_seconds():
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+def _run_job(pp_class, pp_state, params, info):
+    """Rebuild a postprocessor in the worker and run it on info"""
+    started = time.time()
+    cpu_before = _cpu_seconds()
+
+    module_name, class_name = pp_class.rsplit('.', 1)
+    cls = getattr(importlib.import_module(module_name), class_name)
+    pp = cls.__new__(cls)
+    pp.__dict__.update(pp_state)
+    pp._progress_hooks = []
+    pp.set_downloader(_worker_ydl(params))
+
+    files_to_delete, info = pp.run(info)
+    return files_to_delete, info, {
+        'started': started,
+        'run_seconds': time.time() - started,
+        'cpu_seconds': _cpu_seconds() - cpu_before,
+    }
+
+
+# ---------------------------------------------------------------------------
+# Request thread side
+# ---------------------------------------------------------------------------
+
+class PooledPostProcessor:
+    """Stand-in handed to YoutubeDL.run_pp that runs the real one in the pool"""
+
+    def __init__(self, pp, ydl):
+        self.pp = pp
+        self.ydl = ydl
+
+    def run(self, info):
+        pp_class = f'{type(self.pp).__module__}.{type(self.pp).__name__}'
+        pp_state = {k: v for k, v in self.pp.__dict__.items() if k not in ('_downloader', '_progress_hooks')}
+        params = {k: self.ydl.params[k] for k in FORWARDED_PARAMS if k in self.ydl.params}
+        # The postprocessor chain itself can't be pickled and isn't needed by the job
+        job_info = self.ydl.sanitize_info({k: v for k, v in info.items() if k != '__postprocessors'})
+
+        self.pp._hook_progress({'status': 'started'}, info)
+        submitted = time.time()
+        with _stats_lock:
+            _stats['submitted'] += 1
+            _stats['in_flight'] += 1
+        try:
+            files_to_delete, new_info, job = get_pool().submit(_run_job, pp_class, pp_state, params, job_info).result()
+        except Exception:
+            with _stats_lock:
+                _stats['failed'] += 1
+            raise
+        finally:
+            with _stats_lock:
+                _stats['in_flight'] -= 1
+        self.pp._hook_progress({'status': 'finished'}, info)
+
+        wait = max(0.0, job['started'] - submitted)
+        with _stats_lock:
+            _stats['completed'] += 1
+            _stats['wait_seconds'] += wait
+            _stats['run_seconds'] += job['run_seconds']
+            _stats['cpu_seconds'] += job['cpu_seconds']
+        logger.info('postprocess_job', extra={'fields': {
+            'event': 'postprocess_job',
+            'postprocessor': type(self.pp).__name__,
+            'wait_s': round(wait, 3),
+            'run_s': round(job['run_seconds'], 3),
+            'cpu_s': round(job['cpu_seconds'], 3),
+        }})
+
+        return files_to_delete, merge_changes(info, job_info, new_info)
+
+
+def merge_changes(info, sent, returned):
+    """Apply to `info` the keys a job changed in `sent`, its sanitized copy"""
+    for key, value in returned.items():
+        if key not in sent or sent[key] != value:
+            info[key] = value
+    for key in sent.keys() - returned.keys():
+        info.pop(key, None)
+    return info
+
+
+def schedule(ydl, pooled=POOLED_POSTPROCESSORS):
+    """Route a YoutubeDL instance's ffmpeg postprocessors through the pool"""
+    if not enabled():
+        return ydl
+    original_run_pp = ydl.run_pp
+
+    def run_pp(pp, infodict):
+        if type(pp).__name__ in pooled:
+            pp = PooledPostProcessor(pp, ydl)
+        return original_run_pp(pp, infodict)
+
+    ydl.run_pp = run_pp
+    return ydl
@@ -0,0 +1,240 @@
+"""
+Speculative prefetch after /api/info
+Most info lookups are followed by a download of the default format, so when
+enabled the info route starts that download in the background as a shared
+in-flight download (see inflight.py). A /api/download for the same key then
+attaches to it, mid-download or finished, instead of starting over. Formats
+the delivery planner would redirect or proxy are not prefetched.
+Prefetches are bounded by a concurrency cap and a global byte budget and are
+cancelled (and their files removed) if nobody asks for them in time.
+
+Environment variables:
+    PREFETCH                "1" to enable (default off)
+    PREFETCH_CONCURRENCY    Prefetches downloading at once (default 2)
+    PREFETCH_BUDGET_BYTES   Bytes all held prefetches may take up (default 500 MB)
+    PREFETCH_UNUSED_SECONDS Cancel a prefetch nobody attached to within this time (default 60)
+"""
+import logging
+import os
+import threading
+import inflight
+
+logger = logging.getLogger(__name__)
+
+SKIP_LIVE_STATUS = ('is_live', 'is_upcoming', 'post_live')
+
+
+class PrefetchCancelled(Exception):
+    """Raised from a progress hook to abort a prefetch download"""
+
+
+def is_cancellation(error):
+    """Whether a download failed because its prefetch was cancelled; yt-dlp
+    wraps exceptions from progress hooks in a DownloadError (exc_info)"""
+    seen = set()
+    while error is not None and id(error) not in seen:
+        if isinstance(error, PrefetchCancelled):
+            return True
+        seen.add(id(error))
+        error = (getattr(error, 'exc_info', None) or (None, None))[1] or error.__cause__ or error.__context__
+    return False
+
+
+def enabled():
+    return os.environ.get('PREFETCH', '0') == '1'
+
+
+class PrefetchJob:
+    """A background download waiting for the request that will use it"""
+
+    def __init__(self, prefetcher, url, download):
+        self.prefetcher = prefetcher
+        self.url = url
+        self.download = download
+        self.reserved = 0
+        self.downloaded = 0
+        self.running = True
+        self.used = False
+        self.expired = False
+        self.cancelled = None
+        self._held = True
+        self._lock = threading.Lock()
+
+    def progress_hook(self, status):
+        if self.cancelled:
+            raise PrefetchCancelled(self.cancelled)
+        if self.used:
+            return  # a request is waiting for it, so it's no longer speculative
+        self.downloaded = max(self.downloaded, status.get('downloaded_bytes') or 0)
+        expected = status.get('total_bytes') or status.get('total_bytes_estimate') or self.downloaded
+        if not self.prefetcher.reserve(self, int(expected)):
+            self.cancelled = 'budget'
+            raise PrefetchCancelled('Prefetch byte budget exhausted')
+
+    def finished(self):
+        with self._lock:
+            self.running = False
+            drop = self.used or self.expired or self.download.error is not None
+        if drop:
+            self.drop()
+
+    def mark_used(self):
+        with self._lock:
+            first = not self.used
+            self.used = True
+        if first:
+            self.prefetcher.count('hits')
+            self.prefetcher.unreserve(self)
+        self.drop()
+
+    def expire(self):
+        """Unused-timeout: cancel a prefetch nobody attached to"""
+        with self._lock:
+            if self.used or not self._held:
+                return
+        if not self.download.registry.detach_if_unused(self.download):
+            # A request attached just now
+            self.mark_used()
+            return
+        with self._lock:
+            self.expired = True
+            self.cancelled = self.cancelled or 'unused'
+        self.prefetcher.count('unused')
+        self.drop()
+
+    def drop(self):
+        """Give up the prefetch's own hold on the download once it has stopped"""
+        with self._lock:
+            if not self._held or self.running:
+                return
+            self._held = False
+        self.prefetcher.unreserve(self)
+        if not self.used:
+            self.prefetcher.count('wasted_bytes', self.downloaded)
+        self.download.release()
+
+
+class Prefetcher:
+    """Start, bound and account for speculative downloads"""
+
+    def __init__(self, registry=None, concurrency=None, budget_bytes=None, unused_seconds=None):
+        self.registry = registry or inflight.registry
+        self.concurrency = concurrency or int(os.environ.get('PREFETCH_CONCURRENCY', 2))
+        self.budget_bytes = budget_bytes or int(os.environ.get('PREFETCH_BUDGET_BYTES', 500 * 1024 * 1024))
+        self.unused_seconds = unused_seconds or float(os.environ.get('PREFETCH_UNUSED_SECONDS', 60))
+        self._slots = threading.BoundedSemaphore(self.concurrency)
+        self._reserved = 0
+        self._counts = {'started': 0, 'hits': 0, 'unused': 0, 'cancelled_budget': 0,
+                        'skipped_busy': 0, 'skipped_budget': 0, 'not_needed': 0, 'failed': 0,
+                        'wasted_bytes': 0}
+        self._lock = threading.Lock()
+
+    def count(self, name, value=1):
+        with self._lock:
+            self._counts[name] += value
+
+    def reserve(self, job, nbytes):
+        """Grow a job's share of the byte budget; False when it doesn't fit"""
+        with self._lock:
+            delta = nbytes - job.reserved
+            if delta > 0 and self._reserved + delta > self.budget_bytes:
+                return False
+            if delta > 0:
+                self._reserved += delta
+                job.reserved = nbytes
+            return True
+
+    def unreserve(self, job):
+        with self._lock:
+            self._reserved -= job.reserved
+            job.reserved = 0
+
+    def start(self, key, url, info, run):
+        """
+        Prefetch `key` in the background with run(download), which performs
+        the download into download.temp_dir and returns (path, info). Returns
+        the job, or None when skipped.
+        """
+        if info.get('live_status') in SKIP_LIVE_STATUS or info.get('is_live'):
+            return None
+        with self._lock:
+            if self._reserved >= self.budget_bytes:
+                self._counts['skipped_budget'] += 1
+                return None
+        if not self._slots.acquire(blocking=False):
+            self.count('skipped_busy')
+            return None
+
+        download, leader = self.registry.acquire(key)
+        if not leader:
+            # Already downloading (or prefetched) for someone else
+            download.release()
+            self._slots.release()
+            return None
+
+        job = PrefetchJob(self, url, download)
+        download.prefetch = job
+        download.progress_hooks.append(job.progress_hook)
+        self.count('started')
+        timer = threading.Timer(self.unused_seconds, job.expire)
+        timer.daemon = True
+        timer.start()
+        threading.Thread(target=self._run, args=(job, run), name='prefetch', daemon=True).start()
+        return job
+
+    def _run(self, job, run):
+        download = job.download
+        try:
+            try:
+                result = run(download)
+                if result is None:
+                    job.cancelled = 'not-needed'
+                    raise PrefetchCancelled('Delivered without a server-side download')
+            except BaseException as e:
+                download.fail(e)
+                raise
+            download.finish(*result)
+        except Exception as e:
+            # yt-dlp may wrap PrefetchCancelled in a DownloadError
+            if job.cancelled == 'budget':
+                self.count('cancelled_budget')
+            elif job.cancelled == 'not-needed':
+                self.count('not_needed')
+            if job.cancelled:
+                logger.info("Prefetch of %s cancelled: %s", job.url, e)
+            else:
+                self.count('failed')
+                logger.warning("Prefetch of %s failed: %s", job.url, e)
+        finally:
+            self._slots.release()
+            job.finished()
+            logger.info('prefetch', extra={'fields': {
+                'event': 'prefetch', 'url': job.url, 'bytes': job.downloaded,
+                'used': job.used, 'cancelled': job.cancelled,
+            }})
+
+    def note_attach(self, download):
+        """Called when a request attached to an in-flight download"""
+        job = download.prefetch
+        if job is not None:
+            job.mark_used()
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self._counts)
+            reserved = self._reserved
+        settled = counts['hits'] + counts['unused'] + counts['cancelled_budget'] + counts['failed']
+        return {
+            'enabled': enabled(),
+            **counts,
+            'hit_rate': round(counts['hits'] / settled, 3) if settled else None,
+            'reserved_bytes': reserved,
+            'budget_bytes': self.budget_bytes,
+        }
+
+
+prefetcher = Prefetcher()
+
+
+def stats():
+    return prefetcher.stats()
@@ -0,0 +1,246 @@
+"""
+Segmented downloads of direct media URLs
+CDNs often throttle each connection, so a single stream rarely fills the
+link. A one-byte range request tells whether the server honours ranges and
+how big the file is; a large enough file is then preallocated and split into
+segments, which N pooled connections fetch and write at their offsets. A
+segment that fails is retried from the byte where it stopped, and finished
+segments are kept; files too small to split are fetched as one range, so
+they resume the same way. Servers without ranges, or files of unknown size,
+get one stream (the probe's own response, when the server ignored the
+range). The prefix that is complete from the start is reported as contiguous
+bytes, so readers can follow the file while the rest fills in.
+
+Environment variables:
+    SEGMENTED_CONNECTIONS    Connections per download (default 4; 1 for single streams)
+    SEGMENTED_MIN_BYTES      Smallest file worth splitting (default 2 MB)
+    SEGMENTED_SEGMENT_BYTES  Largest segment (default 4 MB)
+    SEGMENTED_RETRIES        Attempts per segment (default 3)
+"""
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 256 * 1024
+# Segments are never made smaller than this, however many connections there are
+MIN_SEGMENT_BYTES = 512 * 1024
+# First retry delay of a segment, doubling per attempt
+RETRY_DELAY = 0.25
+
+
+def connections():
+    return max(1, int(os.environ.get('SEGMENTED_CONNECTIONS', 4)))
+
+
+def enabled():
+    return connections() > 1
+
+
+def min_bytes():
+    return int(os.environ.get('SEGMENTED_MIN_BYTES', 2 * 1024 * 1024))
+
+
+def segment_bytes():
+    return max(MIN_SEGMENT_BYTES, int(os.environ.get('SEGMENTED_SEGMENT_BYTES', 4 * 1024 * 1024)))
+
+
+def retries():
+    return max(1, int(os.environ.get('SEGMENTED_RETRIES', 3)))
+
+
+def plan_segments(total, connection_count, max_segment=None):
+    """[(start, end)) ranges covering `total` bytes: one per connection, or more
+    when they would be larger than max_segment, so fast connections take more"""
+    if connection_count <= 1:
+        return [(0, total)]
+    max_segment = max_segment or segment_bytes()
+    size = min(max_segment, -(-total // connection_count))
+    size = max(size, MIN_SEGMENT_BYTES)
+    return [(start, min(start + size, total)) for start in range(0, total, size)]
+
+
+def content_range_total(response):
+    match = re.match(r'bytes \d+-\d+/(\d+)', response.headers.get('Content-Range', ''))
+    return int(match.group(1)) if match else None
+
+
+class Progress:
+    """Bytes written per segment, and the contiguous prefix they add up to"""
+
+    def __init__(self, segments, total, callback=None, consume=None):
+        self.segments = segments
+        self.total = total
+        self.written = [0] * len(segments)
+        self.downloaded = 0
+        self.contiguous = 0
+        self.retries = 0
+        self.cancelled = False
+        self._first_open = 0
+        self._callback = callback
+        self._consume = consume
+        self._lock = threading.Lock()
+        self._consume_lock = threading.Lock()
+
+    def retried(self):
+        with self._lock:
+            self.retries += 1
+
+    def add(self, index, nbytes):
+        if self._consume is not None:
+            # Bandwidth shares pace the download as a whole, not each connection
+            with self._consume_lock:
+                self._consume(nbytes)
+        with self._lock:
+            self.written[index] += nbytes
+            self.downloaded += nbytes
+            while self._first_open < len(self.segments):
+                start, end = self.segments[self._first_open]
+                if self.written[self._first_open] < end - start:
+                    break
+                self._first_open += 1
+            if self._first_open < len(self.segments):
+                start, _ = self.segments[self._first_open]
+                self.contiguous = start + self.written[self._first_open]
+            else:
+                self.contiguous = self.total
+            downloaded, contiguous = self.downloaded, self.contiguous
+        if self._callback is not None:
+            self._callback(downloaded, self.total, contiguous)
+
+
+def _preallocate(fd, total):
+    try:
+        os.posix_fallocate(fd, 0, total)
+    except (AttributeError, OSError):
+        os.ftruncate(fd, total)
+
+
+def _fetch_segment(session, url, headers, timeout, fd, progress, index, attempts):
+    start, end = progress.segments[index]
+    error = None
+    for attempt in range(attempts):
+        position = start + progress.written[index]
+        if position >= end:
+            return
+        if progress.cancelled:
+            raise IOError('Download cancelled')
+        try:
+            response = session.get(url, headers={**headers, 'Range': f'bytes={position}-{end - 1}'},
+                                   stream=True, timeout=timeout)
+            with response:
+                if response.status_code != 206:
+                    raise IOError(f'Range request answered HTTP {response.status_code}')
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    if progress.cancelled:
+                        raise IOError('Download cancelled')
+                    chunk = chunk[:end - position]
+                    os.pwrite(fd, chunk, position)
+                    position += len(chunk)
+                    progress.add(index, len(chunk))
+                    if position >= end:
+                        break
+            if position < end:
+                raise IOError(f'Segment ended at byte {position} of {end}')
+            return
+        except OSError as e:  # requests' exceptions are IOErrors too
+            if progress.cancelled:
+                raise
+            error = e
+            progress.retried()
+            logger.warning("Segment %d-%d of %s failed (attempt %d): %s", start, end - 1, url, attempt + 1, e)
+            time.sleep(RETRY_DELAY * 2 ** attempt)
+    raise IOError(f'Segment {start}-{end - 1} failed after {attempts} attempts: {error}')
+
+
+def _download_segments(session, url, path, headers, timeout, total, connection_count, progress_callback,
+                       consume):
+    segments = plan_segments(total, connection_count)
+    progress = Progress(segments, total, progress_callback, consume)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        _preallocate(fd, total)
+        with ThreadPoolExecutor(max_workers=min(connection_count, len(segments)),
+                                thread_name_prefix='segment') as pool:
+            futures = [pool.submit(_fetch_segment, session, url, headers, timeout, fd, progress, index, retries())
+                       for index in range(len(segments))]
+            done, _ = wait(futures, return_when=FIRST_EXCEPTION)
+            failed = next((future for future in done if future.exception() is not None), None)
+            if failed is not None:
+                progress.cancelled = True
+                for future in futures:
+                    future.cancel()
+                raise failed.exception()
+    finally:
+        os.close(fd)
+    return progress
+
+
+def _download_stream(response, path, progress_callback, consume, total):
+    downloaded = 0
+    with response, open(path, 'wb') as f:
+        for chunk in response.iter_content(CHUNK_SIZE):
+            if consume is not None:
+                consume(len(chunk))
+            f.write(chunk)
+            # Readers of the growing file use their own handles
+            f.flush()
+            downloaded += len(chunk)
+            if progress_callback is not None:
+                progress_callback(downloaded, total, downloaded)
+    return downloaded
+
+
+def download(session, url, path, headers=None, progress_callback=None, consume=None, timeout=(10, 60),
+             connection_count=None):
+    """
+    Fetch `url` into `path` over up to `connection_count` connections of a
+    requests session. progress_callback(downloaded, total, contiguous) runs
+    per chunk, consume(nbytes) before bytes are written (bandwidth pacing).
+    Returns a summary dict: mode ('segmented' or 'single'), bytes, segments,
+    connections, retries.
+    """
+    headers = dict(headers or {})
+    connection_count = connection_count or connections()
+    started = time.perf_counter()
+
+    response = session.get(url, headers={**headers, 'Range': 'bytes=0-0'}, stream=True, timeout=timeout)
+    if response.status_code >= 400:
+        response.close()
+        raise IOError(f'Upstream returned HTTP {response.status_code}')
+    ranged = response.status_code == 206
+    total = content_range_total(response) if ranged else None
+    if ranged:
+        response.close()
+
+    if total is not None:
+        count = connection_count if total >= min_bytes() else 1
+        progress = _download_segments(session, url, path, headers, timeout, total, count,
+                                      progress_callback, consume)
+        used = min(count, len(progress.segments))
+        summary = {'mode': 'segmented' if used > 1 else 'single', 'bytes': progress.downloaded,
+                   'segments': len(progress.segments), 'connections': used, 'retries': progress.retries}
+    else:
+        if ranged:
+            # A range without the total size: fetch the file whole
+            response = session.get(url, headers=headers, stream=True, timeout=timeout)
+            if response.status_code >= 400:
+                response.close()
+                raise IOError(f'Upstream returned HTTP {response.status_code}')
+        # Otherwise the server ignored the probe's range and is sending the whole file
+        size = int(response.headers.get('Content-Length') or 0) or None
+        downloaded = _download_stream(response, path, progress_callback, consume, size)
+        if size is not None and downloaded < size:
+            raise IOError(f'Download ended at byte {downloaded} of {size}')
+        summary = {'mode': 'single', 'bytes': downloaded, 'segments': 1, 'connections': 1, 'retries': 0}
+
+    elapsed = time.perf_counter() - started
+    logger.info('segmented_download', extra={'fields': {
+        'event': 'segmented_download', **summary, 'ms': round(elapsed * 1000, 1),
+        'mbps': round(summary['bytes'] * 8 / elapsed / 1e6, 2) if elapsed > 0 else None,
+    }})
+    return summary
@@ -70,6 +70,32 @@ function showSuccess(title, content) {
     `;
 }
 
+// Fields the info and formats views render; one /inspect call serves both
+const INSPECT_FIELDS = 'title,uploader,upload_date,duration,view_count,platform,formats_available,' +
+    'description,thumbnail,thumbnail_url,formats[format_id,ext,resolution,filesize,fps,format_note]';
+
+// In-flight and completed /inspect requests, keyed by video URL
+const inspectCache = new Map();
+
+// Inspect a video once per URL, reusing the result for every view
+function inspectVideo(url) {
+    if (!inspectCache.has(url)) {
+        // GET so the browser and the edge can cache and revalidate the result
+        const query = new URLSearchParams({ url, fields: INSPECT_FIELDS });
+        const request = fetch(`${API_BASE}/inspect?${query}`).then(async response => {
+            const data = await response.json();
+            if (!response.ok) {
+                throw new Error(data.error || 'Failed to inspect video');
+            }
+            return data;
+        });
+        // Don't keep failures around, so a retry hits the server again
+        request.catch(() => inspectCache.delete(url));
+        inspectCache.set(url, request);
+    }
+    return inspectCache.get(url);
+}
+
 // Get video info
 async function handleGetInfo() {
     const url = videoUrlInput.value.trim();
@@ -81,21 +107,7 @@ async function handleGetInfo() {
     showLoading();
 
     try {
-        const response = await fetch(`${API_BASE}/info`, {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-            },
-            body: JSON.stringify({ url })
-        });
-
-        const data = await response.json();
-
-        if (!response.ok) {
-            throw new Error(data.error || 'Failed to get video info');
-        }
-
-        const metadata = data.metadata;
+        const metadata = await inspectVideo(url);
         const duration = metadata.duration ? formatDuration(metadata.duration) : 'Unknown';
         const viewCount = metadata.view_count ? formatNumber(metadata.view_count) : 'Unknown';
         const uploadDate = metadata.upload_date ? formatDate(metadata.upload_date) : 'Unknown';
@@ -103,7 +115,8 @@ async function handleGetInfo() {
         const content = `
             <div class="row">
                 <div class="col-md-4">
-                    ${metadata.thumbnail ? `<img src="${metadata.thumbnail}" class="img-fluid rounded" alt="Thumbnail">` : ''}
+                    ${metadata.thumbnail_url ? `<img src="${metadata.thumbnail_url}?w=480" srcset="${metadata.thumbnail_url}?w=320 320w, ${metadata.thumbnail_url}?w=480 480w, ${metadata.thumbnail_url}?w=720 720w" sizes="(min-width: 768px) 33vw, 100vw" class="img-fluid rounded" alt="Thumbnail" loading="lazy">`
+                        : metadata.thumbnail ? `<img src="${metadata.thumbnail}" class="img-fluid rounded" alt="Thumbnail" loading="lazy" referrerpolicy="no-referrer">` : ''}
                 </div>
                 <div class="col-md-8">
                     <h5>${metadata.title}</h5>
@@ -136,19 +149,7 @@ async function handleGetFormats() {
     showLoading();
 
     try {
-        const response = await fetch(`${API_BASE}/formats`, {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-            },
-            body: JSON.stringify({ url })
-        });
-
-        const data = await response.json();
-
-        if (!response.ok) {
-            throw new Error(data.error || 'Failed to get formats');
-        }
+        const data = await inspectVideo(url);
 
         let tableRows = '';
         data.formats.forEach(format => {
@@ -210,7 +211,9 @@ async function handleDownload(event) {
         const requestBody = {
             url: url,
             format: formatSelect.value,
-            audio_only: audioOnlyCheckbox.checked
+            audio_only: audioOnlyCheckbox.checked,
+            // Get redirect decisions as JSON; fetch can't follow them to another origin
+            redirect: false
         };
 
         const response = await fetch(`${API_BASE}/download`, {
@@ -226,6 +229,25 @@ async function handleDownload(event) {
             throw new Error(errorData.error || 'Download failed');
         }
 
+        // The server chose to send the browser to the platform's own URL
+        if ((response.headers.get('Content-Type') || '').includes('application/json')) {
+            const data = await response.json();
+            const a = document.createElement('a');
+            a.href = data.direct_url;
+            a.download = data.filename;
+            a.target = '_blank';
+            a.rel = 'noopener';
+            document.body.appendChild(a);
+            a.click();
+            document.body.removeChild(a);
+
+            showSuccess('Download Started', `
+                <p>Your download is served directly by the platform.</p>
+                <p><strong>Filename:</strong> ${data.filename}</p>
+            `);
+            return;
+        }
+
         // Handle file download
         const blob = await response.blob();
         const contentDisposition = response.headers.get('Content-Disposition');
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Test the streaming ZIP archive writer
+"""
+import io
+import os
+import threading
+import zipfile
+from archive import stream_archive, unique_name
+
+def fake_download(url, temp_dir):
+    if 'fail' in url:
+        raise ValueError('unavailable')
+    path = os.path.join(temp_dir, 'clip.mp4')
+    with open(path, 'wb') as f:
+        f.write(url.encode() * 1000)
+    return path, 'Clip 🎬.mp4'
+
+def test_streamed_archive_is_valid():
+    """Members are stored uncompressed, names de-duplicated and failures reported"""
+    print("Testing streamed ZIP archive...")
+    urls = ['https://a.example/1', 'https://a.example/2', 'https://a.example/fail']
+    chunks = list(stream_archive(urls, fake_download, workers=2))
+    assert all(chunks)
+
+    archive = zipfile.ZipFile(io.BytesIO(b''.join(chunks)))
+    assert archive.testzip() is None
+    names = sorted(info.filename for info in archive.infolist())
+    assert names == ['Clip 🎬 (2).mp4', 'Clip 🎬.mp4', 'errors.txt']
+    assert all(info.compress_type == zipfile.ZIP_STORED for info in archive.infolist())
+    assert b'https://a.example/fail: unavailable' in archive.read('errors.txt')
+    contents = {archive.read(name) for name in names if name.endswith('.mp4')}
+    assert contents == {b'https://a.example/1' * 1000, b'https://a.example/2' * 1000}
+    print("✅ Streamed ZIP archive verified")
+
+def test_early_close_cleans_up():
+    """Closing the stream cancels queued downloads and removes temp files"""
+    print("Testing early close...")
+    release = threading.Event()
+    temp_dirs = []
+
+    def slow_download(url, temp_dir):
+        temp_dirs.append(temp_dir)
+        if url.endswith('/1'):
+            return fake_download(url, temp_dir)
+        release.wait(5)
+        return fake_download(url, temp_dir)
+
+    stream = stream_archive([f'https://a.example/{i}' for i in range(1, 6)], slow_download, workers=2)
+    next(stream)
+    stream.close()
+    release.set()
+
+    for _ in range(100):
+        if not any(os.path.exists(d) for d in temp_dirs):
+            break
+        threading.Event().wait(0.05)
+    # Only downloads already running when the stream closed were started
+    assert len(temp_dirs) <= 3
+    assert not any(os.path.exists(d) for d in temp_dirs)
+    print("✅ Early close verified")
+
+def test_unique_name():
+    used = set()
+    assert unique_name('a.mp4', used) == 'a.mp4'
+    assert unique_name('A.mp4', used) == 'A (2).mp4'
+    assert unique_name('a.mp4', used) == 'a (3).mp4'
+
+if __name__ == '__main__':
+    test_streamed_archive_is_valid()
+    test_early_close_cleans_up()
+    test_unique_name()
@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+"""
+Test the transcode-free audio delivery planning
+"""
+from app import app  # noqa: F401  (api.py imports the limiter from app)
+from api import plan_audio_extraction, audio_codec_family
+
+def test_native_audio_is_never_transcoded():
+    print("Testing native audio delivery...")
+    m4a = {'vcodec': 'none', 'acodec': 'mp4a.40.2', 'ext': 'm4a'}
+    opus = {'vcodec': 'none', 'acodec': 'opus', 'ext': 'webm'}
+    muxed = {'vcodec': 'avc1.64001F', 'acodec': 'mp4a.40.2', 'ext': 'mp4'}
+
+    assert plan_audio_extraction(m4a) == ('copy', None)
+    assert plan_audio_extraction(opus) == ('copy', None)
+    assert plan_audio_extraction(muxed) == ('remux', 'best')
+    print("✅ Native audio delivery verified")
+
+def test_explicit_codecs():
+    print("Testing explicit audio codecs...")
+    m4a = {'vcodec': 'none', 'acodec': 'mp4a.40.2', 'ext': 'm4a'}
+    opus = {'vcodec': 'none', 'acodec': 'opus', 'ext': 'webm'}
+
+    assert plan_audio_extraction(m4a, 'm4a') == ('copy', None)
+    assert plan_audio_extraction(opus, 'opus') == ('remux', 'opus')
+    assert plan_audio_extraction(m4a, 'mp3') == ('transcode', 'mp3')
+    assert plan_audio_extraction(opus, 'm4a') == ('transcode', 'm4a')
+    assert audio_codec_family('mp4a.40.5') == 'aac'
+    assert audio_codec_family(None) is None
+    print("✅ Explicit audio codecs verified")
+
+if __name__ == '__main__':
+    test_native_audio_is_never_transcoded()
+    test_explicit_codecs()
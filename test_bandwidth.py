@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Test the global bandwidth scheduler
+"""
+import time
+import yt_dlp
+from bandwidth import BandwidthScheduler, fair_shares, MIN_RATE
+
+MB = 1024 * 1024
+
+def test_fair_shares():
+    """Weighted max-min fairness hands unused capacity to the others"""
+    print("Testing weighted fair sharing...")
+    assert fair_shares(100, {'a': (1, None), 'b': (1, None)}) == {'a': 50, 'b': 50}
+    assert fair_shares(100, {'a': (1, None), 'b': (4, None)}) == {'a': 20, 'b': 80}
+    shares = fair_shares(100, {'slow': (1, 10), 'a': (1, None), 'b': (1, None)})
+    assert shares == {'slow': 10, 'a': 45, 'b': 45}
+    print("✅ Weighted fair sharing verified")
+
+def test_interactive_priority_and_ratelimit():
+    """Small transfers get the bigger share and running yt-dlp downloads follow changes"""
+    print("Testing dynamic rate limits...")
+    scheduler = BandwidthScheduler(ingress_limit=10 * MB, egress_limit=0, small_bytes=25 * MB)
+    with yt_dlp.YoutubeDL({'quiet': True}) as big_ydl, yt_dlp.YoutubeDL({'quiet': True}) as clip_ydl:
+        big = scheduler.register('ingress', label='4k', size=2000 * MB)
+        big.instrument(big_ydl)
+        assert big_ydl.params['ratelimit'] == 10 * MB
+
+        clip_ydl.params['concurrent_fragment_downloads'] = 4
+        clip = scheduler.register('ingress', label='clip', size=5 * MB)
+        clip.instrument(clip_ydl)
+        assert clip.interactive and not big.interactive
+        assert big_ydl.params['ratelimit'] == 2 * MB
+        # The clip's share is split across its fragment threads
+        assert clip_ydl.params['ratelimit'] == 2 * MB
+
+        clip.release()
+        assert big_ydl.params['ratelimit'] == 10 * MB
+        big.release()
+
+    stats = scheduler.stats()
+    assert stats['ingress']['active'] == 0 and stats['egress']['limit_bps'] is None
+    print("✅ Dynamic rate limits verified")
+
+def test_progress_hook_records_bytes():
+    """yt-dlp progress (cumulative per file) is turned into transferred bytes"""
+    print("Testing download accounting...")
+    scheduler = BandwidthScheduler(ingress_limit=0, egress_limit=0)
+    transfer = scheduler.register('ingress')
+    for downloaded in (100, 300, 300, 1000):
+        transfer.progress_hook({'status': 'downloading', 'filename': 'a.mp4', 'downloaded_bytes': downloaded})
+    transfer.progress_hook({'status': 'downloading', 'filename': 'a.m4a', 'downloaded_bytes': 50})
+    assert transfer.bytes == 1050 and transfer.rate is None
+    transfer.release()
+    assert scheduler.stats()['ingress']['bytes_total'] == 1050
+    print("✅ Download accounting verified")
+
+def test_throttled_stream():
+    """Streamed responses are paced to the egress share and release it on close"""
+    print("Testing egress pacing...")
+    scheduler = BandwidthScheduler(ingress_limit=0, egress_limit=MIN_RATE * 8)
+    chunks = [b'x' * MIN_RATE] * 6
+    stream = scheduler.throttle(chunks, label='file')
+    started = time.monotonic()
+    assert b''.join(stream) == b'x' * MIN_RATE * 6
+    elapsed = time.monotonic() - started
+    # 6 chunks at 8 chunks/s, minus the burst allowance
+    assert 0.4 < elapsed < 1.5, elapsed
+    assert scheduler.stats()['egress']['active'] == 1
+    stream.close()
+    assert scheduler.stats()['egress']['active'] == 0
+    print("✅ Egress pacing verified")
+
+if __name__ == '__main__':
+    test_fair_shares()
+    test_interactive_priority_and_ratelimit()
+    test_progress_hook_records_bytes()
+    test_throttled_stream()
@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+"""
+Cold-start regression check for the entry points
+"""
+import json
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+import import_profile
+
+def test_heavy_modules_stay_lazy():
+    """No entry point imports yt_dlp, requests or the other lazy modules to serve /api/health"""
+    print("Checking lazy imports at cold start...")
+    with open(import_profile.BUDGET_FILE) as f:
+        lazy_modules = json.load(f)['lazy_modules']
+    assert {'yt_dlp', 'requests'} <= set(lazy_modules)
+
+    failures = []
+    for entry in import_profile.ENTRY_POINTS:
+        result = import_profile.run_child(entry, import_profile.entry_env(entry))
+        assert 'flask' in result['modules'], entry
+        failures.extend(import_profile.lazy_failures(entry, result['modules'], lazy_modules))
+    assert not failures, failures
+    print("✅ Lazy imports at cold start verified")
+
+if __name__ == '__main__':
+    test_heavy_modules_stay_lazy()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Test end-to-end request deadlines
+"""
+import os
+import socket
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+from flask import Flask, g
+import deadline
+
+def test_budget():
+    print("Testing deadline budget...")
+    budget = deadline.Deadline(10)
+    assert 9 < budget.remaining() <= 10
+    assert budget.timeout(30) <= 10 and budget.timeout(2) == 2
+    assert budget.allows(5) and not budget.allows(11)
+
+    spent = deadline.Deadline(0.5)
+    time.sleep(0.6)
+    for call in (spent.check, lambda: spent.timeout(5)):
+        try:
+            call()
+            assert False, 'expected DeadlineExceeded'
+        except deadline.DeadlineExceeded:
+            pass
+
+    app = Flask(__name__)
+    with app.test_request_context(headers={'X-Request-Timeout': '5'}):
+        assert deadline.request_seconds() == 3
+        assert deadline.request_seconds(platform_limit=4) == 2
+    with app.test_request_context(headers={'X-Request-Timeout': '500'}):
+        assert deadline.request_seconds(platform_limit=55) == 53
+    print("✅ Deadline budget verified")
+
+def test_client_disconnect():
+    """A closed client connection cancels the deadline"""
+    print("Testing client disconnect detection...")
+    server_side, client_side = socket.socketpair()
+    budget = deadline.Deadline(60, client_socket=server_side)
+    budget.check()
+    client_side.sendall(b'pipelined')
+    budget.check()  # readable, but not closed
+    server_side.recv(100)
+    client_side.close()
+    try:
+        budget.check()
+        assert False, 'expected DeadlineExceeded'
+    except deadline.DeadlineExceeded as e:
+        assert 'client disconnected' in str(e)
+    assert not budget.allows(1)
+    server_side.close()
+    print("✅ Client disconnect detection verified")
+
+def test_fallbacks_skipped():
+    """The TikTok fallback chain doesn't start methods it has no time for"""
+    print("Testing fallback skipping...")
+    from tikwm_extractor import TikWMExtractor
+    app = Flask(__name__)
+    with app.test_request_context():
+        g.request_deadline = deadline.Deadline(1)
+        started = time.monotonic()
+        assert TikWMExtractor().get_video_info('https://www.tiktok.com/@someone/video/1') is None
+        assert time.monotonic() - started < 1
+    print("✅ Fallback skipping verified")
+
+def test_endpoint_deadline():
+    """/api/info gives up with 504 when the client's budget runs out"""
+    print("Testing /api/info deadline...")
+
+    class SlowHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(8)
+            try:
+                self.send_response(200)
+                self.end_headers()
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), SlowHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://localhost:{server.server_address[1]}/slow.mp4'
+    with mock.patch.dict(os.environ, {'METADATA_DB': os.path.join(tempfile.mkdtemp(), 'metadata.sqlite3')}):
+        try:
+            from app import app
+            import negative_cache
+            with app.test_client() as client:
+                started = time.monotonic()
+                response = client.post('/api/info', json={'url': url}, headers={'X-Request-Timeout': '4'})
+                elapsed = time.monotonic() - started
+                assert response.status_code == 504, response.get_json()
+                assert 'deadline' in response.get_json()['error']
+                assert elapsed < 6, elapsed
+            # Running out of time is not the URL's fault
+            negative_cache.check(url)
+        finally:
+            server.shutdown()
+    print("✅ /api/info deadline verified")
+
+if __name__ == '__main__':
+    test_budget()
+    test_client_disconnect()
+    test_fallbacks_skipped()
+    test_endpoint_deadline()
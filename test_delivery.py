@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Test the size-aware delivery planner
+"""
+import functools
+import os
+import shutil
+import tempfile
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+import api_vercel
+import delivery
+from delivery import plan, estimate_bytes, best_progressive, REDIRECT, PROXY, DOWNLOAD
+
+MB = 1024 * 1024
+
+def single(**fields):
+    return {'url': 'https://cdn.example.com/v.mp4', 'protocol': 'https', 'vcodec': 'avc1', 'acodec': 'mp4a',
+            **fields}
+
+def test_size_estimates():
+    print("Testing output size estimates...")
+    assert estimate_bytes(single(filesize=10)) == (10, 'filesize')
+    assert estimate_bytes(single(filesize=None, filesize_approx=20)) == (20, 'filesize_approx')
+    assert estimate_bytes(single(tbr=800, duration=10)) == (1_000_000, 'bitrate')
+    assert estimate_bytes(single()) == (None, None)
+    merged = {'duration': 10, 'requested_formats': [single(filesize=5 * MB), single(tbr=128)]}
+    assert estimate_bytes(merged) == (5 * MB + 160_000, 'bitrate')
+    print("✅ Output size estimates verified")
+
+def test_strategies():
+    """Processing forces a download, size and load choose between proxy and redirect"""
+    print("Testing delivery strategies...")
+    merged = {'requested_formats': [single(filesize=MB), single(filesize=MB)]}
+    assert plan(merged, load=0).strategy == DOWNLOAD
+    assert plan(single(filesize=MB), postprocessed=True, load=0).strategy == DOWNLOAD
+    assert plan(single(protocol='m3u8_native'), load=0).strategy == DOWNLOAD
+    assert plan(single(filesize=MB, cookies='sid=1'), load=0).strategy == PROXY
+
+    assert plan(single(filesize=MB), load=0).strategy == PROXY
+    assert plan(single(filesize=500 * MB), load=0).strategy == REDIRECT
+    assert plan(single(), load=0).strategy == REDIRECT
+    busy = plan(single(filesize=MB), load=100)
+    assert busy.strategy == REDIRECT and 'busy' in busy.reason
+
+    forced = plan(single(filesize=500 * MB), prefer=DOWNLOAD, load=0)
+    assert forced.strategy == DOWNLOAD and forced.reason.startswith('requested by client')
+    assert plan(merged, prefer=REDIRECT, load=0).reason.startswith('redirect not possible')
+
+    only_redirect = plan(single(filesize=MB), allowed=(REDIRECT,), load=0)
+    assert only_redirect.strategy == REDIRECT and 'proxy disabled here' in only_redirect.reason
+    assert plan(merged, allowed=(REDIRECT,), load=0).strategy is None
+    assert plan(single(filesize=MB), load=0).as_dict()['estimated_bytes'] == MB
+
+    # Signed for the server's IP: a redirected client would get 403
+    bound = single(url='https://rr1.googlevideo.com/videoplayback?expire=1&ip=203.0.113.7&sig=x')
+    assert plan(bound, load=0).strategy == PROXY
+    assert plan(bound, load=100).strategy == PROXY
+    assert plan(bound, allowed=(REDIRECT, DOWNLOAD), load=0).strategy == DOWNLOAD
+    assert plan(bound, allowed=(REDIRECT,), load=0).strategy == REDIRECT
+    print("✅ Delivery strategies verified")
+
+def test_best_progressive():
+    print("Testing progressive fallback...")
+    info = {'title': 'T', 'formats': [
+        {'format_id': '18', 'url': 'u18', 'protocol': 'https', 'vcodec': 'avc1', 'acodec': 'mp4a', 'height': 360},
+        {'format_id': '22', 'url': 'u22', 'protocol': 'https', 'vcodec': 'avc1', 'acodec': 'mp4a', 'height': 720},
+        {'format_id': '137', 'url': 'u137', 'protocol': 'https', 'vcodec': 'avc1', 'acodec': 'none', 'height': 1080},
+        {'format_id': 'hls', 'url': 'uh', 'protocol': 'm3u8_native', 'vcodec': 'avc1', 'acodec': 'mp4a', 'height': 1080},
+    ]}
+    assert best_progressive(info)['format_id'] == '22'
+    assert best_progressive(info, max_height=480)['format_id'] == '18'
+    assert best_progressive({'formats': []}) is None
+    print("✅ Progressive fallback verified")
+
+class RecordingHandler(SimpleHTTPRequestHandler):
+    """Static server that remembers the Range headers it was sent"""
+    ranges = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.ranges.append(self.headers.get('Range'))
+        super().do_GET()
+
+def test_download_endpoint_delivery():
+    """/api/download redirects, answers with JSON or proxies as planned"""
+    print("Testing /api/download delivery...")
+    directory = tempfile.mkdtemp()
+    payload = b'\x00\x00\x00\x18ftypmp42' + os.urandom(64 * 1024)
+    with open(os.path.join(directory, 'clip.mp4'), 'wb') as f:
+        f.write(payload)
+    handler = functools.partial(RecordingHandler, directory=directory)
+    RecordingHandler.ranges = []
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://localhost:{server.server_address[1]}/clip.mp4'
+    with mock.patch.dict(os.environ, {'METADATA_DB': os.path.join(directory, 'metadata.sqlite3')}):
+        try:
+            from app import app
+            with app.test_client() as client:
+                # A bare mp4 has no size information, so it is redirected
+                response = client.post('/api/download', json={'url': url, 'format': 'best'})
+                assert response.status_code == 302, response.data
+                assert response.headers['Location'] == url
+                assert response.headers['X-Delivery'] == REDIRECT
+                assert response.headers['X-Delivery-Reason'] == 'size unknown'
+
+                response = client.post('/api/download', json={'url': url, 'format': 'best', 'redirect': False})
+                data = response.get_json()
+                assert response.status_code == 200 and data['direct_url'] == url
+                assert data['delivery']['strategy'] == REDIRECT and data['filename'] == 'clip.mp4'
+
+                response = client.post('/api/download', json={'url': url, 'format': 'best', 'delivery': 'proxy'},
+                                       headers={'Range': 'bytes=0-99'})
+                assert response.status_code == 200
+                assert response.headers['X-Delivery'] == PROXY
+                assert response.data == payload
+                assert RecordingHandler.ranges[-1] == 'bytes=0-99'
+                assert 'attachment' in response.headers['Content-Disposition']
+                response.close()
+
+                response = client.post('/api/download', json={'url': url, 'delivery': 'teleport'})
+                assert response.status_code == 400
+
+            from app_vercel import app as vercel_app
+            with vercel_app.test_client() as client:
+                response = client.post('/api/download', json={'url': url, 'quality': 'best'})
+                data = response.get_json()
+                assert response.status_code == 200, data
+                assert data['direct_url'] == url and data['delivery']['strategy'] == REDIRECT
+
+                # Redirect is the only delivery here, so disabling it is an error, before any extraction
+                with mock.patch.dict(os.environ, {'DELIVERY_STRATEGIES': 'proxy,download'}), \
+                        mock.patch.object(api_vercel, 'select_redirect_target') as select:
+                    response = client.post('/api/download', json={'url': url, 'quality': 'best'})
+                assert response.status_code == 503
+                assert 'Redirect delivery disabled' in response.get_json()['error']
+                assert not select.called
+
+                # Extraction errors reach the client instead of a failure on a None result
+                created = []
+                real_mkdtemp = tempfile.mkdtemp
+                tempfile.mkdtemp = lambda *args, **kwargs: created.append(1) or real_mkdtemp(*args, **kwargs)
+                try:
+                    response = client.post('/api/download', json={'url': url.replace('clip.mp4', 'missing.mp4')})
+                finally:
+                    tempfile.mkdtemp = real_mkdtemp
+                data = response.get_json()
+                assert response.status_code == 400, data
+                assert '404' in data['error'] and 'NoneType' not in data['error'], data
+                assert created == []
+            assert delivery.current_load() == 0
+        finally:
+            server.shutdown()
+            shutil.rmtree(directory, ignore_errors=True)
+    print("✅ /api/download delivery verified")
+
+if __name__ == '__main__':
+    test_size_estimates()
+    test_strategies()
+    test_best_progressive()
+    test_download_endpoint_delivery()
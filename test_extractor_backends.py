@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Test the TikWM fast path of the extractor backends
+"""
+import json
+import os
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+import extractor_backends
+
+TIKTOK_URL = 'https://www.tiktok.com/@someone/video/7300000000000000001'
+MEDIA = {'/media/hd.mp4': b'H' * 300_000, '/media/sd.mp4': b'S' * 100_000, '/media/music.mp3': b'M' * 1000}
+
+def start_tikwm_stub():
+    """Local stand-in for the TikWM API and the media URLs it returns; returns (server, requests seen)"""
+    seen = []
+
+    class TikWMHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            seen.append(self.path)
+            base = f'http://127.0.0.1:{self.server.server_address[1]}'
+            if self.path.startswith('/api/'):
+                body = json.dumps({'code': 0, 'data': {
+                    'id': '7300000000000000001', 'title': 'Fast path 🚀', 'duration': 12,
+                    'author': {'unique_id': 'someone'}, 'play_count': 5, 'digg_count': 2,
+                    'create_time': 1700000000, 'cover': f'{base}/cover.jpg',
+                    'hdplay': f'{base}/media/hd.mp4', 'hd_size': len(MEDIA['/media/hd.mp4']),
+                    'play': f'{base}/media/sd.mp4', 'size': len(MEDIA['/media/sd.mp4']),
+                    'music': f'{base}/media/music.mp3',
+                }}).encode()
+                content_type = 'application/json'
+            elif self.path in MEDIA:
+                body, content_type = MEDIA[self.path], 'video/mp4'
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), TikWMHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    extractor_backends.BACKENDS['tikwm'].extractor.api_endpoints = [
+        f'http://127.0.0.1:{server.server_address[1]}/api/']
+    return server, seen
+
+def temp_db():
+    return mock.patch.dict(os.environ, {'METADATA_DB': os.path.join(tempfile.mkdtemp(), 'metadata.sqlite3')})
+
+def no_yt_dlp():
+    return mock.patch('yt_dlp.YoutubeDL', side_effect=AssertionError('yt-dlp should not run'))
+
+def test_backend_routing():
+    print("Testing extractor backend routing...")
+    backend = extractor_backends.BACKENDS['tikwm']
+    assert backend.handles(TIKTOK_URL) and backend.handles('https://vm.tiktok.com/ZM123/')
+    assert not backend.handles('https://www.youtube.com/watch?v=x')
+    assert not backend.handles('https://nottiktok.com/video/1')
+    assert extractor_backends.extract('https://vimeo.com/1') == (None, None)
+    with mock.patch.dict(os.environ, {'EXTRACTOR_BACKENDS': ''}):
+        assert extractor_backends.enabled_backends() == []
+        assert extractor_backends.extract(TIKTOK_URL) == (None, None)
+    print("✅ Extractor backend routing verified")
+
+def test_info_and_formats():
+    """/api/info and /api/formats answer TikTok URLs from TikWM in the usual schema"""
+    print("Testing TikWM metadata endpoints...")
+    server, seen = start_tikwm_stub()
+    with temp_db():
+        try:
+            from app import app
+            with app.test_client() as client, no_yt_dlp():
+                info = client.post('/api/info', json={'url': TIKTOK_URL})
+                assert info.status_code == 200, info.get_json()
+                assert info.headers['X-Extractor'] == 'tikwm'
+                metadata = info.get_json()['metadata']
+                assert metadata['title'] == 'Fast path 🚀' and metadata['platform'] == 'TikTok'
+                assert metadata['upload_date'] == '20231114' and metadata['formats_available'] == 3
+
+                formats = client.post('/api/formats', json={'url': TIKTOK_URL}).get_json()['formats']
+                assert [fmt['format_id'] for fmt in formats] == ['hd', 'sd', 'audio']
+                assert formats[0]['filesize'] == len(MEDIA['/media/hd.mp4'])
+            assert len([path for path in seen if path.startswith('/api/')]) == 1
+        finally:
+            server.shutdown()
+    print("✅ TikWM metadata endpoints verified")
+
+def test_download_without_yt_dlp():
+    """/api/download fetches the chosen TikWM URL itself, whatever the delivery"""
+    print("Testing TikWM downloads...")
+    server, seen = start_tikwm_stub()
+    with temp_db():
+        try:
+            from app import app
+            with app.test_client() as client, no_yt_dlp():
+                downloaded = client.post('/api/download', json={'url': TIKTOK_URL, 'delivery': 'download'})
+                assert downloaded.status_code == 200, downloaded.get_data()[:200]
+                assert downloaded.headers['X-Extractor'] == 'tikwm'
+                assert downloaded.headers['X-Delivery'] == 'download'
+                assert downloaded.get_data() == MEDIA['/media/hd.mp4']
+                downloaded.close()
+
+                proxied = client.post('/api/download', json={'url': TIKTOK_URL, 'format': 'sd', 'delivery': 'proxy'})
+                assert proxied.headers['X-Delivery'] == 'proxy'
+                assert proxied.get_data() == MEDIA['/media/sd.mp4']
+                proxied.close()
+
+                redirected = client.post('/api/download', json={'url': TIKTOK_URL, 'delivery': 'redirect'})
+                assert redirected.status_code == 302
+                assert redirected.headers['Location'].endswith('/media/hd.mp4')
+            assert seen.count('/media/hd.mp4') == 1 and seen.count('/media/sd.mp4') == 1
+        finally:
+            server.shutdown()
+    print("✅ TikWM downloads verified")
+
+def test_vercel_fast_path():
+    print("Testing TikWM on Vercel...")
+    server, _ = start_tikwm_stub()
+    with temp_db():
+        try:
+            from app_vercel import app
+            with app.test_client() as client, no_yt_dlp():
+                formats = client.post('/api/formats', json={'url': TIKTOK_URL}).get_json()['formats']
+                assert [fmt['quality'] for fmt in formats] == ['HD', 'SD']
+                download = client.post('/api/download', json={'url': TIKTOK_URL})
+                body = download.get_json()
+                assert download.status_code == 200, body
+                assert download.headers['X-Extractor'] == 'tikwm'
+                assert body['direct_url'].endswith('/media/hd.mp4') and body['filename'] == 'Fast path 🚀.mp4'
+        finally:
+            server.shutdown()
+    print("✅ TikWM on Vercel verified")
+
+if __name__ == '__main__':
+    test_backend_routing()
+    test_info_and_formats()
+    test_download_without_yt_dlp()
+    test_vercel_fast_path()
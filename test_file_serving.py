@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Test serving finished files from Python, with sendfile or through the front proxy
+"""
+import functools
+import os
+import tempfile
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+from urllib.parse import unquote
+from flask import Flask
+from werkzeug.wsgi import FileWrapper
+import file_serving
+
+def make_file(content=b'x' * 100_000, name='Clip 🚀.mp4'):
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, name)
+    with open(path, 'wb') as f:
+        f.write(content)
+    return path
+
+def run_wsgi(response, environ):
+    """Send a response like a WSGI server: iterate the body, then close it"""
+    body = response(environ, lambda status, headers: None)
+    try:
+        return b''.join(body)
+    finally:
+        if hasattr(body, 'close'):
+            body.close()
+
+def test_proxy_locations():
+    print("Testing front proxy locations...")
+    root = os.path.realpath(tempfile.gettempdir())
+    path = os.path.join(root, 'tmpabc', 'Clip 🚀.mp4')
+    with mock.patch.dict(os.environ, {'FILE_SERVING_ACCEL_PREFIX': 'internal'}):
+        assert file_serving.proxy_location(path, file_serving.X_ACCEL_REDIRECT) == \
+            '/internal/tmpabc/Clip%20%F0%9F%9A%80.mp4'
+    assert file_serving.proxy_location(path, file_serving.X_SENDFILE) == \
+        f"{root}/tmpabc/Clip%20%F0%9F%9A%80.mp4"
+    with mock.patch.dict(os.environ, {'FILE_SERVING_ROOT': os.path.join(root, 'elsewhere')}):
+        assert file_serving.proxy_location(path, file_serving.X_ACCEL_REDIRECT) is None
+    print("✅ Front proxy locations verified")
+
+def test_modes():
+    """Every mode delivers the file and releases it exactly once, when it is no longer needed"""
+    print("Testing file serving modes...")
+    app = Flask(__name__)
+    content = os.urandom(100_000)
+
+    # python: the worker streams it, release on close
+    path, released = make_file(content), []
+    with mock.patch.dict(os.environ, {'FILE_SERVING': 'python'}), app.test_request_context() as ctx:
+        response = file_serving.send(path, 'Clip 🚀.mp4', lambda: released.append(1))
+        assert response.headers['X-File-Serving'] == 'python' and not released
+        assert run_wsgi(response, ctx.request.environ) == content
+    assert released == [1]
+
+    # sendfile: the server's own file wrapper reaches it untouched
+    path, released = make_file(content), []
+    with mock.patch.dict(os.environ, {'FILE_SERVING': 'sendfile'}), \
+            app.test_request_context(environ_base={'wsgi.file_wrapper': FileWrapper}) as ctx:
+        response = file_serving.send(path, 'Clip 🚀.mp4', lambda: released.append(1))
+        assert response.headers['X-File-Serving'] == 'sendfile'
+        assert type(response.response) is FileWrapper
+        body = response(ctx.request.environ, lambda status, headers: None)
+        assert type(body) is FileWrapper
+        assert b''.join(body) == content and not released
+        body.close()
+    assert released == [1]
+
+    # A slotted wrapper class (nothing can be patched onto it) and a Range
+    # request (werkzeug wraps the body) both still release exactly once
+    class SlottedWrapper:
+        __slots__ = ('filelike', 'blksize')
+
+        def __init__(self, filelike, blksize=8192):
+            self.filelike, self.blksize = filelike, blksize
+
+        def __iter__(self):
+            return iter(lambda: self.filelike.read(self.blksize), b'')
+
+        def close(self):
+            self.filelike.close()
+
+    path, released = make_file(content), []
+    with mock.patch.dict(os.environ, {'FILE_SERVING': 'sendfile'}), \
+            app.test_request_context(environ_base={'wsgi.file_wrapper': SlottedWrapper}) as ctx:
+        response = file_serving.send(path, 'Clip 🚀.mp4', lambda: released.append(1))
+        assert response.headers['X-File-Serving'] == 'sendfile'
+        body = response(ctx.request.environ, lambda status, headers: None)
+        assert type(body) is SlottedWrapper
+        # What a server's sendfile path uses
+        assert os.fstat(body.filelike.fileno()).st_size == len(content) and not released
+        body.close()
+        body.close()
+    assert released == [1]
+
+    path, released = make_file(content), []
+    with mock.patch.dict(os.environ, {'FILE_SERVING': 'sendfile'}), \
+            app.test_request_context(environ_base={'wsgi.file_wrapper': FileWrapper},
+                                     headers={'Range': 'bytes=10-19'}) as ctx:
+        response = file_serving.send(path, 'Clip 🚀.mp4', lambda: released.append(1))
+        assert response.status_code == 206
+        assert run_wsgi(response, ctx.request.environ) == content[10:20]
+    assert released == [1]
+
+    # sendfile without a server file wrapper falls back to Python
+    path, released = make_file(content), []
+    with mock.patch.dict(os.environ, {'FILE_SERVING': 'sendfile'}), app.test_request_context() as ctx:
+        ctx.request.environ.pop('wsgi.file_wrapper', None)
+        response = file_serving.send(path, 'Clip 🚀.mp4', lambda: released.append(1))
+        assert response.headers['X-File-Serving'] == 'python'
+        assert run_wsgi(response, ctx.request.environ) == content
+    assert released == [1]
+
+    # x-accel-redirect: headers only, released after the grace period
+    path, released = make_file(content), []
+    env = {'FILE_SERVING': 'x-accel-redirect', 'FILE_SERVING_CLEANUP_DELAY': '0.2'}
+    with mock.patch.dict(os.environ, env), app.test_request_context() as ctx:
+        response = file_serving.send(path, 'Clip 🚀.mp4', lambda: released.append(1))
+        assert response.headers['X-Accel-Redirect'].startswith('/protected-downloads/')
+        assert "filename*=UTF-8''Clip%20%F0%9F%9A%80.mp4" in response.headers['Content-Disposition']
+        assert run_wsgi(response, ctx.request.environ) == b''
+    assert not released
+    time.sleep(0.4)
+    assert released == [1]
+    print("✅ File serving modes verified")
+
+def test_download_handoff():
+    """/api/download hands the finished file to nginx and still cleans its temp dir up"""
+    print("Testing /api/download with X-Accel-Redirect...")
+    directory = tempfile.mkdtemp()
+    with open(os.path.join(directory, 'clip.mp4'), 'wb') as f:
+        f.write(os.urandom(200_000))
+
+    class QuietHandler(SimpleHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), functools.partial(QuietHandler, directory=directory))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_address[1]}/clip.mp4'
+    env = {'FILE_SERVING': 'x-accel-redirect', 'FILE_SERVING_CLEANUP_DELAY': '0.2',
+           'METADATA_DB': os.path.join(tempfile.mkdtemp(), 'metadata.sqlite3')}
+
+    try:
+        from app import app
+        import inflight
+        with mock.patch.dict(os.environ, env), app.test_client() as client:
+            response = client.post('/api/download', json={'url': url, 'format': 'best', 'delivery': 'download'})
+            assert response.status_code == 200, response.get_data()[:300]
+            assert response.headers['X-Delivery'] == 'download'
+            location = response.headers['X-Accel-Redirect']
+            assert location.startswith('/protected-downloads/') and response.get_data() == b''
+            relative = unquote(location[len('/protected-downloads/'):])
+            path = os.path.join(file_serving.serving_root(), *relative.split('/'))
+            assert os.path.exists(path)
+            time.sleep(0.5)
+            assert not os.path.exists(os.path.dirname(path))
+            assert inflight.stats()['downloads'] == 0
+    finally:
+        server.shutdown()
+    print("✅ /api/download with X-Accel-Redirect verified")
+
+if __name__ == '__main__':
+    test_proxy_locations()
+    test_modes()
+    test_download_handoff()
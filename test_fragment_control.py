@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Test adaptive fragment concurrency
+"""
+import yt_dlp
+from fragment_control import FragmentController, download_host
+
+MB = 1024 * 1024
+
+def run(controller, host, throughput, errors=0, fragmented=True):
+    """Simulate one download of 10 seconds at `throughput` bytes/s"""
+    lease = controller.acquire(host)
+    lease.fragmented = fragmented
+    lease.bytes, lease.seconds, lease.errors = int(throughput * 10), 10.0, errors
+    level = lease.concurrency
+    lease.release()
+    return level
+
+def test_ramps_up_and_settles():
+    """Concurrency doubles while throughput improves and settles where it stops helping"""
+    print("Testing fragment concurrency ramp-up...")
+    controller = FragmentController(max_level=16, thread_budget=32, load=lambda: 0.0)
+    # Throughput scales up to 8 fragments, then flattens out
+    speed = {1: 1 * MB, 2: 2 * MB, 4: 4 * MB, 8: 6 * MB, 16: 6 * MB}
+    levels = [run(controller, 'cdn', speed[controller._host_state('cdn')['level']]) for _ in range(6)]
+    assert levels[:4] == [2, 4, 8, 16]
+    assert levels[4:] == [8, 8]
+    assert controller.stats()['hosts']['cdn']['level'] == 8
+    print("✅ Fragment concurrency ramp-up verified")
+
+def test_backs_off():
+    """Fragment errors halve the level, CPU saturation steps it down"""
+    print("Testing fragment concurrency back-off...")
+    load = [0.0]
+    controller = FragmentController(max_level=16, thread_budget=32, load=lambda: load[0])
+    controller._host_state('cdn')['level'] = 8
+    assert run(controller, 'cdn', 4 * MB, errors=3) == 8
+    assert controller._host_state('cdn')['level'] == 4
+
+    load[0] = 2.0
+    assert run(controller, 'cdn', 4 * MB) == 2  # halved at acquire while saturated
+    assert controller._host_state('cdn')['level'] == 1
+
+    # Plain (non-fragmented) downloads teach nothing
+    load[0] = 0.0
+    run(controller, 'cdn', 50 * MB, fragmented=False)
+    assert controller._host_state('cdn')['level'] == 1
+    print("✅ Fragment concurrency back-off verified")
+
+def test_budget_is_shared():
+    """Concurrent downloads split the global fragment thread budget"""
+    print("Testing fragment thread budget...")
+    controller = FragmentController(max_level=16, thread_budget=8, load=lambda: 0.0)
+    controller._host_state('cdn')['level'] = 16
+    leases = [controller.acquire('cdn') for _ in range(3)]
+    assert [lease.concurrency for lease in leases] == [8, 4, 2]
+    assert controller.stats()['active_fragment_threads'] == 14
+    for lease in leases:
+        lease.release()
+    stats = controller.stats()
+    assert stats['active_downloads'] == 0 and stats['active_fragment_threads'] == 0
+    print("✅ Fragment thread budget verified")
+
+def test_lease_instruments_ydl():
+    """The lease sets the concurrency, observes progress and counts fragment retries"""
+    print("Testing fragment lease instrumentation...")
+    controller = FragmentController(max_level=16, thread_budget=32, load=lambda: 0.0)
+    lease = controller.acquire('cdn')
+    with yt_dlp.YoutubeDL({'quiet': True}) as ydl:
+        lease.instrument(ydl)
+        assert ydl.params['concurrent_fragment_downloads'] == lease.concurrency
+        ydl.to_screen('[download] Got error: HTTP Error 503. Retrying fragment 3 (1/10)...')
+        for hook in ydl._progress_hooks:
+            hook({'status': 'downloading', 'fragment_index': 1, 'fragment_count': 4})
+            hook({'status': 'finished', 'total_bytes': 4 * MB, 'elapsed': 2.0})
+    assert lease.fragmented and lease.bytes == 4 * MB and lease.seconds == 2.0 and lease.errors == 1
+    lease.release()
+    lease.release()
+    assert controller.stats()['downloads'] == 1
+    assert controller.stats()['fragment_errors'] == 1
+
+    info = {'requested_formats': [{'manifest_url': 'https://cdn.example.com/a.mpd', 'url': 'https://x/1'}]}
+    assert download_host(info) == 'cdn.example.com'
+    assert download_host({}) == 'unknown'
+    print("✅ Fragment lease instrumentation verified")
+
+if __name__ == '__main__':
+    test_ramps_up_and_settles()
+    test_backs_off()
+    test_budget_is_shared()
+    test_lease_instruments_ydl()
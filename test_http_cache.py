@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Test ETag/304 handling, cache policies and compression of API responses
+"""
+import gzip
+import os
+
+def test_etag_and_cache_policies():
+    print("Testing ETags and cache policies...")
+    from app import app
+
+    with app.test_client() as client:
+        response = client.get('/api/supported-platforms')
+        assert response.status_code == 200
+        assert 'max-age=86400' in response.headers['Cache-Control']
+        etag = response.headers['ETag']
+        assert 'Accept-Encoding' in response.headers['Vary']
+
+        cached = client.get('/api/supported-platforms', headers={'If-None-Match': etag})
+        assert cached.status_code == 304
+        assert cached.data == b''
+
+        health = client.get('/api/health')
+        assert health.headers['Cache-Control'] == 'no-store'
+
+        # POST responses are not conditional
+        response = client.post('/api/info', json={})
+        assert response.status_code == 400
+        assert 'ETag' not in response.headers
+    print("✅ ETags and cache policies verified")
+
+def test_compression_negotiation():
+    print("Testing response compression...")
+    from app_vercel import app
+
+    os.environ['COMPRESS_MIN_BYTES'] = '10'
+    try:
+        with app.test_client() as client:
+            plain = client.get('/api/platforms')
+            assert 'Content-Encoding' not in plain.headers
+
+            compressed = client.get('/api/platforms', headers={'Accept-Encoding': 'gzip, deflate'})
+            assert compressed.headers['Content-Encoding'] == 'gzip'
+            assert gzip.decompress(compressed.data) == plain.data
+            assert compressed.headers['ETag'] != plain.headers['ETag']
+
+            revalidated = client.get('/api/platforms', headers={'Accept-Encoding': 'gzip',
+                                                                 'If-None-Match': compressed.headers['ETag']})
+            assert revalidated.status_code == 304
+    finally:
+        del os.environ['COMPRESS_MIN_BYTES']
+
+    with app.test_client() as client:
+        small = client.get('/api/platforms', headers={'Accept-Encoding': 'gzip'})
+        assert 'Content-Encoding' not in small.headers
+    print("✅ Response compression verified")
+
+if __name__ == '__main__':
+    test_etag_and_cache_policies()
+    test_compression_negotiation()
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Test sharing in-flight downloads between requests
+"""
+import functools
+import os
+import shutil
+import tempfile
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+from inflight import InflightRegistry, DownloadStalled
+
+def test_reader_follows_growing_file():
+    """A follower reads the .part file while it grows and the last reader cleans up"""
+    print("Testing growing-file readers...")
+    registry = InflightRegistry()
+    download, leader = registry.acquire('key')
+    assert leader
+    follower, leader = registry.acquire('key')
+    assert follower is download and not leader
+
+    download.info, download.streamable = {'title': 'clip', 'ext': 'mp4'}, True
+    part = os.path.join(download.temp_dir, 'clip.mp4.part')
+    chunks = [os.urandom(50_000) for _ in range(5)]
+
+    def write():
+        with open(part, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+                f.flush()
+                download.progress_hook({'status': 'downloading', 'tmpfilename': part, 'total_bytes': 250_000})
+                time.sleep(0.05)
+        final = part[:-len('.part')]
+        os.rename(part, final)
+        download.finish(final, download.info)
+
+    threading.Thread(target=write).start()
+    assert download.wait_ready(timeout=5) == 'growing'
+    reader = download.open_reader()
+    received = b''
+    while True:
+        data = reader.read(8192)
+        if not data:
+            break
+        received += data
+    assert received == b''.join(chunks)
+
+    reader.close()
+    assert os.path.isdir(download.temp_dir)
+    assert registry.stats()['readers'] == 1
+    download.release()
+    assert not os.path.exists(download.temp_dir)
+    assert registry.stats() == {'downloads': 0, 'readers': 0, 'shared_requests': 1}
+    print("✅ Growing-file readers verified")
+
+def test_failure_is_not_inherited():
+    """Waiting requests see the failure, later ones start a new download"""
+    print("Testing shared download failure...")
+    registry = InflightRegistry()
+    download, _ = registry.acquire('key')
+    follower, _ = registry.acquire('key')
+    download.fail(RuntimeError('boom'))
+    assert follower.wait_ready(timeout=1) == 'failed'
+    fresh, leader = registry.acquire('key')
+    assert leader and fresh is not download
+    download.release()
+    follower.release()
+    fresh.release()
+    assert registry.stats()['downloads'] == 0
+    print("✅ Shared download failure verified")
+
+def test_hung_leader_times_out():
+    """Followers of a download that stops making progress give up instead of hanging"""
+    print("Testing hung shared downloads...")
+    registry = InflightRegistry()
+    download, _ = registry.acquire('key')
+    follower, _ = registry.acquire('key')
+
+    # Bounded by the caller's timeout (the request deadline)
+    started = time.monotonic()
+    assert follower.wait_ready(timeout=0.2) == 'timeout'
+    assert time.monotonic() - started < 2
+
+    with mock.patch.dict(os.environ, {'INFLIGHT_STALL_SECONDS': '0.3'}):
+        # Without a timeout, by the stall ceiling
+        assert follower.wait_ready() == 'timeout'
+
+        # A reader of a growing file that stops growing fails instead of waiting forever
+        part = os.path.join(download.temp_dir, 'clip.mp4.part')
+        with open(part, 'wb') as f:
+            f.write(b'x' * 1000)
+        download.publish({'protocol': 'https'})
+        download.progress_hook({'status': 'downloading', 'tmpfilename': part, 'total_bytes': 5000})
+        assert follower.wait_ready() == 'growing'
+        reader = follower.open_reader()
+        assert reader.read(4096) == b'x' * 1000
+        try:
+            reader.read(4096)
+            assert False, 'expected the stalled download to fail the reader'
+        except DownloadStalled:
+            pass
+        reader.close()
+    download.release()
+    assert registry.stats()['downloads'] == 0
+
+    # /api/download gives up when its deadline runs out
+    import inflight
+    from app import app
+    url = 'https://vimeo.com/76979871'
+    hung, _ = inflight.registry.acquire(inflight.download_key(url, 'best'))
+    try:
+        with app.test_client() as client:
+            started = time.monotonic()
+            response = client.post('/api/download', json={'url': url, 'format': 'best'},
+                                   headers={'X-Request-Timeout': '2.5'})
+            assert response.status_code == 504, response.get_json()
+            assert time.monotonic() - started < 3
+        assert hung.readers == 1
+    finally:
+        hung.release()
+    print("✅ Hung shared downloads verified")
+
+class SlowHandler(SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def copyfile(self, source, outputfile):
+        while True:
+            chunk = source.read(64 * 1024)
+            if not chunk:
+                break
+            try:
+                outputfile.write(chunk)
+            except (BrokenPipeError, ConnectionResetError):
+                return  # the generic extractor only reads the start
+            time.sleep(0.05)
+
+def test_concurrent_requests_share_download():
+    """Two requests for the same URL and format run one download"""
+    print("Testing shared /api/download...")
+    directory = tempfile.mkdtemp()
+    payload = b'\x00\x00\x00\x18ftypmp42' + os.urandom(1024 * 1024)
+    with open(os.path.join(directory, 'clip.mp4'), 'wb') as f:
+        f.write(payload)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), functools.partial(SlowHandler, directory=directory))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://localhost:{server.server_address[1]}/clip.mp4'
+    # Only server-side downloads are shared
+    with mock.patch.dict(os.environ, {'METADATA_DB': os.path.join(directory, 'metadata.sqlite3'),
+                                      'DELIVERY_STRATEGIES': 'download'}):
+        try:
+            from app import app
+            import inflight
+            results = {}
+
+            def fetch(name):
+                with app.test_client() as client:
+                    response = client.post('/api/download', json={'url': url, 'format': 'best'})
+                    results[name] = (response.status_code, response.headers.get('X-Shared-Download'), response.data)
+                    response.close()
+
+            first = threading.Thread(target=fetch, args=('first',))
+            first.start()
+            deadline = time.time() + 30
+            while time.time() < deadline and not any(d.growing_path for d in inflight.registry._downloads.values()):
+                time.sleep(0.01)
+            second = threading.Thread(target=fetch, args=('second',))
+            second.start()
+            first.join(60)
+            second.join(60)
+
+            assert results['first'][0] == 200 and results['first'][1] is None
+            assert results['second'][0] == 200 and results['second'][1] == 'growing'
+            assert results['first'][2] == results['second'][2] == payload
+            stats = inflight.stats()
+            assert stats['downloads'] == 0 and stats['shared_requests'] >= 1
+        finally:
+            server.shutdown()
+            shutil.rmtree(directory, ignore_errors=True)
+    print("✅ Shared /api/download verified")
+
+if __name__ == '__main__':
+    test_reader_follows_growing_file()
+    test_failure_is_not_inherited()
+    test_hung_leader_times_out()
+    test_concurrent_requests_share_download()
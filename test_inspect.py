@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Test the combined /api/inspect endpoint and field projection
+"""
+import functools
+import os
+import tempfile
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+from utils import parse_fields, project_fields
+
+def test_field_projection():
+    print("Testing field projection...")
+    fields = parse_fields('title, duration,formats[height,ext]')
+    assert fields == {'title': None, 'duration': None, 'formats': ('height', 'ext')}
+    assert parse_fields(None) is None
+
+    document = {'title': 'T', 'duration': 3, 'description': 'long',
+                'formats': [{'height': 720, 'ext': 'mp4', 'filesize': 10}]}
+    assert project_fields(document, fields) == {'title': 'T', 'duration': 3,
+                                                'formats': [{'height': 720, 'ext': 'mp4'}]}
+    assert project_fields(document, None) is document
+
+    for bad in ('formats[ext', 'title duration'):
+        try:
+            parse_fields(bad)
+            assert False, bad
+        except ValueError:
+            pass
+    try:
+        project_fields(document, {'nope': None})
+        assert False
+    except ValueError:
+        pass
+    print("✅ Field projection verified")
+
+def test_inspect_endpoint():
+    """One extraction returns projected metadata and formats"""
+    print("Testing /api/inspect...")
+    directory = tempfile.mkdtemp()
+    with open(os.path.join(directory, 'clip.mp4'), 'wb') as f:
+        f.write(b'\x00\x00\x00\x18ftypmp42' + b'\x00' * 2048)
+
+    handler = functools.partial(SimpleHTTPRequestHandler, directory=directory)
+    handler.log_message = lambda *args: None
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://localhost:{server.server_address[1]}/clip.mp4'
+    with mock.patch.dict(os.environ, {'METADATA_DB': os.path.join(directory, 'metadata.sqlite3')}):
+        try:
+            from app import app
+            with app.test_client() as client:
+                response = client.post('/api/inspect', json={'url': url, 'fields': 'title,formats[ext,format_id]'},
+                                       headers={'X-Debug-Timing': '1'})
+                assert response.status_code == 200, response.get_json()
+                data = response.get_json()
+                assert set(data) == {'success', 'title', 'formats', 'timing'}
+                assert data['title'] == 'clip'
+                assert data['formats'][0]['ext'] == 'mp4'
+                assert set(data['formats'][0]) == {'ext', 'format_id'}
+                assert [p['name'] for p in data['timing']['phases']].count('extract') == 1
+
+                assert response.headers['X-Metadata-Cache'] == 'miss'
+
+                full = client.post('/api/inspect', json={'url': url})
+                assert full.headers['X-Metadata-Cache'] == 'hit'
+                assert 'description' in full.get_json() and 'formats_available' in full.get_json()
+
+                assert client.post('/api/inspect', json={'url': url, 'fields': 'bogus'}).status_code == 400
+                assert client.post('/api/inspect', json={'url': url, 'fields': 'formats['}).status_code == 400
+        finally:
+            server.shutdown()
+    print("✅ /api/inspect verified")
+
+if __name__ == '__main__':
+    test_field_projection()
+    test_inspect_endpoint()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Test the sampled, structured logging pipeline
+"""
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import time
+from unittest import mock
+import log_config
+from log_config import RateLimitFilter, JsonFormatter, NonBlockingQueueHandler, parse_module_levels
+
+def make_record(msg, *args, **extra):
+    record = logging.LogRecord('tikwm_extractor', logging.ERROR, __file__, 1, msg, args, None)
+    record.__dict__.update(extra)
+    return record
+
+def test_rate_limit_by_template():
+    """Repeated messages sharing a template are sampled, others pass"""
+    print("Testing rate-limited sampling...")
+
+    sampler = RateLimitFilter(limit=2, window=0.05)
+    template = "TikWM API request failed for endpoint %s: %s"
+    passed = [sampler.filter(make_record(template, f'https://mirror{i}/api/', 'timeout')) for i in range(5)]
+    assert passed == [True, True, False, False, False]
+    assert sampler.filter(make_record("Another message"))
+    assert sampler.filter(make_record('request_timing', fields={'path': '/api/info'}))
+
+    import time
+    time.sleep(0.06)
+    record = make_record(template, 'https://mirror9/api/', 'timeout')
+    assert sampler.filter(record)
+    assert record.suppressed == 3
+    print("✅ Rate-limited sampling verified")
+
+def test_counters_stay_bounded():
+    """Expired counters are dropped and the number kept is capped"""
+    print("Testing bounded sampling counters...")
+    sampler = RateLimitFilter(limit=2, window=0.05, max_keys=100)
+    for i in range(50):
+        sampler.filter(make_record(f"Unique message {i}"))
+    assert len(sampler._counters) == 50
+    time.sleep(0.06)
+    sampler.filter(make_record("After the window"))
+    assert len(sampler._counters) == 1
+
+    capped = RateLimitFilter(limit=2, window=60, max_keys=100)
+    for i in range(1000):
+        capped.filter(make_record(f"Unique message {i}"))
+    assert len(capped._counters) == 100
+    # The most recent templates are the ones kept
+    assert ('tikwm_extractor', 'Unique message 999', logging.ERROR) in capped._counters
+    print("✅ Bounded sampling counters verified")
+
+def test_flush_on_serverless():
+    """flush() waits for the listener to write every queued record; serverless apps flush per request"""
+    print("Testing serverless log flushing...")
+    written = []
+
+    class SlowHandler(logging.Handler):
+        def emit(self, record):
+            time.sleep(0.01)
+            written.append(record.getMessage())
+
+    records = queue.Queue()
+    listener = logging.handlers.QueueListener(records, SlowHandler())
+    listener.start()
+    try:
+        with mock.patch.object(log_config, '_listener', listener):
+            for i in range(20):
+                records.put(make_record(f"record {i}"))
+            assert log_config.flush(timeout=5)
+            assert len(written) == 20
+
+            from flask import Flask
+            app = Flask(__name__)
+            with mock.patch.dict(os.environ, {'VERCEL': '1'}):
+                log_config.init_app(app)
+
+            @app.route('/')
+            def index():
+                for i in range(10):
+                    records.put(make_record(f"request record {i}"))
+                return 'ok'
+
+            with app.test_client() as client:
+                assert client.get('/').status_code == 200
+            assert len(written) == 30
+    finally:
+        listener.stop()
+    print("✅ Serverless log flushing verified")
+
+def test_json_formatter_and_lazy_queueing():
+    """Records are queued unformatted and rendered as JSON with structured fields"""
+    print("Testing JSON formatting...")
+
+    import queue
+    handler = NonBlockingQueueHandler(queue.Queue(maxsize=1))
+    record = make_record("Resolved URL: %s -> %s", 'https://vm.tiktok.com/x', 'https://www.tiktok.com/@u/video/1')
+    handler.handle(record)
+    queued = handler.queue.get_nowait()
+    assert queued.msg == "Resolved URL: %s -> %s"
+    assert queued.args
+
+    handler.handle(make_record("first"))
+    handler.handle(make_record("second"))  # queue full: dropped, not blocking
+    assert NonBlockingQueueHandler.dropped >= 1
+
+    line = json.loads(JsonFormatter().format(make_record('request_timing', fields={'status': 200})))
+    assert line['message'] == 'request_timing'
+    assert line['status'] == 200
+    assert line['logger'] == 'tikwm_extractor'
+    print("✅ JSON formatting verified")
+
+def test_parse_module_levels():
+    assert parse_module_levels("tikwm_extractor=warning, timing=INFO") == {
+        'tikwm_extractor': 'WARNING', 'timing': 'INFO'}
+    assert parse_module_levels(None) == {}
+
+if __name__ == '__main__':
+    test_rate_limit_by_template()
+    test_counters_stay_bounded()
+    test_flush_on_serverless()
+    test_json_formatter_and_lazy_queueing()
+    test_parse_module_levels()
+    print("✅ Logging pipeline tests completed!")
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Test the SQLite metadata store
+"""
+import os
+import tempfile
+import time
+from unittest import mock
+import metadata_store
+
+INFO = {
+    'id': 'abc123', 'extractor_key': 'Youtube', 'title': 'Video 🎬', 'duration': 60,
+    'webpage_url': 'https://www.youtube.com/watch?v=abc123', 'view_count': 10, 'like_count': 2,
+    'formats': [{'format_id': '18', 'ext': 'mp4', 'height': 360, 'url': 'https://signed.example/expires'}],
+}
+
+def temp_db():
+    return mock.patch.dict(os.environ, {'METADATA_DB': os.path.join(tempfile.mkdtemp(), 'store.sqlite3')})
+
+def test_store_ttls_and_aliases():
+    """Entries are keyed by video id, and volatile fields expire before stable ones"""
+    print("Testing metadata store TTLs...")
+    with temp_db():
+        now = 1_000_000.0
+        metadata_store.put('https://youtu.be/abc123?si=tracking', INFO, now=now)
+
+        document, state, key = metadata_store.get('https://www.youtube.com/watch?v=abc123&utm_source=x', now=now + 1)
+        assert key == 'Youtube:abc123'
+        assert state == 'fresh'
+        assert document['title'] == 'Video 🎬' and document['view_count'] == 10
+        assert 'url' not in document['formats'][0]
+        assert metadata_store.get('https://youtu.be/abc123', now=now)[1] == 'fresh'
+
+        document, state, _ = metadata_store.get('https://youtu.be/abc123', now=now + 601)
+        assert state == 'stale' and document['view_count'] == 10
+        document, state, _ = metadata_store.get('https://youtu.be/abc123', now=now + 600 + 3601)
+        assert state == 'stale' and 'view_count' not in document and document['title'] == 'Video 🎬'
+        assert metadata_store.get('https://youtu.be/abc123', now=now + 31 * 86400)[1] is None
+
+        assert metadata_store.claim_refresh(key, now=now + 700)
+        assert not metadata_store.claim_refresh(key, now=now + 701)
+
+        assert metadata_store.compact(now=now + 31 * 86400) == 1
+        assert metadata_store.get('https://youtu.be/abc123', now=now)[0] is None
+    print("✅ Metadata store TTLs verified")
+
+def test_stale_while_revalidate():
+    """Stale entries are served immediately and refreshed in the background"""
+    print("Testing stale-while-revalidate...")
+    with temp_db():
+        calls = []
+
+        def extract():
+            calls.append(1)
+            return dict(INFO, view_count=10 * len(calls))
+
+        info, state = metadata_store.get_or_extract('https://youtu.be/abc123', extract)
+        assert state == 'miss' and len(calls) == 1
+        info, state = metadata_store.get_or_extract('https://youtu.be/abc123', extract)
+        assert state == 'hit' and len(calls) == 1
+
+        os.environ['METADATA_VOLATILE_TTL'] = '0'
+        try:
+            metadata_store.put('https://youtu.be/abc123', INFO)
+            info, state = metadata_store.get_or_extract('https://youtu.be/abc123', extract)
+            assert state == 'stale' and info['view_count'] == 10
+            deadline = time.time() + 5
+            while len(calls) < 2 and time.time() < deadline:
+                time.sleep(0.01)
+            assert len(calls) == 2
+        finally:
+            del os.environ['METADATA_VOLATILE_TTL']
+    print("✅ Stale-while-revalidate verified")
+
+if __name__ == '__main__':
+    test_store_ttls_and_aliases()
+    test_stale_while_revalidate()
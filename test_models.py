@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Test the slotted metadata model
+"""
+import json
+import sys
+from models import VideoMetadata, FormatRecord
+import metadata_store
+
+INFO = {
+    'id': 'abc123', 'extractor': 'youtube', 'extractor_key': 'Youtube', 'title': 'Video 🎬', 'duration': 60,
+    'webpage_url': 'https://www.youtube.com/watch?v=abc123', 'view_count': 10,
+    'automatic_captions': {'en': [{'url': 'https://captions.example'}]},
+    'requested_formats': [{'format_id': '137'}],
+    'formats': [
+        {'format_id': '18', 'ext': 'mp4', 'height': 360, 'vcodec': 'avc1.42001E', 'acodec': 'mp4a.40.2',
+         'protocol': 'https', 'url': 'https://signed.example/18', 'http_headers': {'User-Agent': 'x'},
+         'fragments': [{'url': 'sq/0'}]},
+        {'format_id': '140', 'ext': 'm4a', 'vcodec': 'none', 'acodec': 'mp4a.40.2', 'abr': 128,
+         'protocol': 'https', 'url': 'https://signed.example/140'},
+    ],
+}
+
+TIKWM_INFO = {
+    'id': '7300000000000000000', 'title': 'Dance 💃', 'uploader': 'someone', 'duration': 15,
+    'view_count': 1000, 'like_count': 100, 'comment_count': 5, 'share_count': 7,
+    'upload_date': 1700000000, 'thumbnail': 'https://www.tikwm.com/cover.jpg',
+    'webpage_url': 'https://www.tiktok.com/@someone/video/7300000000000000000', 'platform': 'TikTok',
+    'formats': [
+        {'format_id': 'hd', 'url': 'https://www.tikwm.com/hd.mp4', 'quality': 'HD', 'ext': 'mp4'},
+        {'format_id': 'audio', 'url': 'https://www.tikwm.com/music.mp3', 'quality': 'Audio', 'ext': 'mp3'},
+    ],
+}
+
+def test_from_info():
+    """yt-dlp info dicts keep only the modelled fields, with interned codecs"""
+    print("Testing VideoMetadata.from_info...")
+    metadata = VideoMetadata.from_info(INFO)
+    assert metadata['title'] == 'Video 🎬' and metadata.get('uploader', 'Unknown') == 'Unknown'
+    assert 'view_count' in metadata and 'like_count' not in metadata
+    assert not hasattr(metadata, '__dict__') and not hasattr(metadata.formats[0], '__dict__')
+    assert len(metadata.get('formats', [])) == 2
+    video, audio = metadata.formats
+    assert video.get('height') == 360 and video.url is None
+    assert audio.vcodec is sys.intern('none') and audio.acodec is video.acodec
+    document = metadata.to_dict()
+    assert 'automatic_captions' not in document and 'requested_formats' not in document
+    assert 'http_headers' not in document['formats'][0] and 'fragments' not in document['formats'][0]
+    assert VideoMetadata.from_info(INFO, keep_urls=True).formats[1].url == 'https://signed.example/140'
+    print("✅ VideoMetadata.from_info verified")
+
+def test_from_tikwm():
+    """TikTok API results get the same shape as yt-dlp ones"""
+    print("Testing VideoMetadata from TikWM results...")
+    metadata = VideoMetadata.from_info(TIKWM_INFO, keep_urls=True)
+    assert metadata.extractor_key == 'TikTok' and metadata.id == '7300000000000000000'
+    assert metadata.upload_date == '20231114' and metadata.timestamp == 1700000000
+    assert metadata.repost_count == 7
+    hd, audio = metadata.formats
+    assert hd.format_note == 'HD' and hd.url == 'https://www.tikwm.com/hd.mp4'
+    assert audio.vcodec == 'none' and audio.resolution == 'audio only'
+    print("✅ TikWM normalization verified")
+
+def test_json_round_trip():
+    """to_dict() output is plain JSON and from_dict() restores an equal model"""
+    print("Testing JSON round trip...")
+    metadata = VideoMetadata.from_info(INFO)
+    restored = VideoMetadata.from_dict(json.loads(json.dumps(metadata.to_dict(), ensure_ascii=False)))
+    assert restored == metadata
+    assert FormatRecord.from_dict(metadata.formats[0].to_dict()) == metadata.formats[0]
+    assert 'url' not in VideoMetadata.from_info(INFO, keep_urls=True).to_dict(keep_urls=False)['formats'][0]
+
+    stable, volatile = metadata_store.normalize(INFO)
+    assert stable['title'] == 'Video 🎬' and volatile == {'view_count': 10}
+    assert stable['formats'][0] == {'format_id': '18', 'ext': 'mp4', 'height': 360, 'vcodec': 'avc1.42001E',
+                                    'acodec': 'mp4a.40.2', 'protocol': 'https'}
+    print("✅ JSON round trip verified")
+
+if __name__ == '__main__':
+    test_from_info()
+    test_from_tikwm()
+    test_json_round_trip()
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Test the negative cache for failing extractions
+"""
+import functools
+import os
+import tempfile
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+from yt_dlp.utils import DownloadError
+import negative_cache
+
+def temp_db():
+    return mock.patch.dict(os.environ, {'METADATA_DB': os.path.join(tempfile.mkdtemp(), 'store.sqlite3')})
+
+def test_classify():
+    print("Testing failure classification...")
+    classify = negative_cache.classify
+    assert classify(DownloadError('ERROR: [youtube] abc: Private video. Sign in if you\'ve been granted access')) == 'permanent'
+    assert classify(DownloadError('ERROR: [youtube] abc: Video unavailable. This video has been removed')) == 'permanent'
+    assert classify(DownloadError('Sign in to confirm your age. This video may be inappropriate')) == 'permanent'
+    assert classify(DownloadError('The uploader has not made this video available in your country')) == 'permanent'
+    assert classify(DownloadError('HTTP Error 429: Too Many Requests')) == 'rate_limited'
+    assert classify(DownloadError('HTTP Error 503: Service Unavailable')) == 'transient'
+    assert classify(TimeoutError('The read operation timed out')) == 'transient'
+    assert classify(ConnectionResetError('Connection reset by peer')) == 'transient'
+    assert classify(DownloadError('Requested format is not available')) is None
+    # Our own bugs are not the platform's failures
+    assert classify(AttributeError("'NoneType' object has no attribute 'get'")) is None
+    assert classify(TypeError('Private video')) is None
+    print("✅ Failure classification verified")
+
+def test_ttls_and_backoff():
+    """Permanent failures stick, transient ones back off exponentially, rate limits cover the host"""
+    print("Testing negative cache TTLs...")
+    with temp_db():
+        now = 1_000_000.0
+        url = 'https://www.youtube.com/watch?v=gone&si=x'
+        assert negative_cache.record(url, DownloadError('Private video'), now=now) == 'permanent'
+        try:
+            negative_cache.check('https://www.youtube.com/watch?v=gone', now=now + 10)
+            assert False, 'expected a cached failure'
+        except negative_cache.CachedFailure as e:
+            assert e.kind == 'permanent' and str(e) == 'Private video' and e.retry_after == 3590
+        negative_cache.check(url, now=now + 3601)
+
+        flaky = 'https://vimeo.com/1'
+        for expected in (5, 10, 20):
+            negative_cache.record(flaky, TimeoutError('timed out'), now=now)
+            try:
+                negative_cache.check(flaky, now=now)
+                assert False
+            except negative_cache.CachedFailure as e:
+                assert e.kind == 'transient' and e.retry_after == expected
+        negative_cache.clear(flaky)
+        negative_cache.check(flaky, now=now)
+
+        negative_cache.record('https://www.tiktok.com/@a/video/1', DownloadError('HTTP Error 429: Too Many Requests'), now=now)
+        try:
+            negative_cache.check('https://tiktok.com/@b/video/2', now=now + 1)
+            assert False
+        except negative_cache.CachedFailure as e:
+            assert e.kind == 'rate_limited' and e.retry_after == 59
+    print("✅ Negative cache TTLs verified")
+
+def test_guard_passes_bugs_through():
+    """Exceptions that aren't platform failures are re-raised untouched and never cached"""
+    print("Testing guard with non-platform errors...")
+    with temp_db():
+        url = 'https://vimeo.com/bug'
+        bug = AttributeError("'NoneType' object has no attribute 'get'")
+
+        def extract():
+            raise bug
+
+        try:
+            negative_cache.guard(url, extract)
+            assert False, 'expected the AttributeError'
+        except AttributeError as e:
+            assert e is bug
+        negative_cache.check(url)
+        assert negative_cache.guard(url, lambda: 'ok') == 'ok'
+    print("✅ Guard with non-platform errors verified")
+
+def test_held_off_urls_skip_backends():
+    """Held-off URLs are answered before the fast-path backends are called, and
+    EnhancedExtractor lets the hold-off reach its caller"""
+    print("Testing hold-offs before extractor backends...")
+    with temp_db():
+        url = 'https://www.tiktok.com/@u/video/7'
+        negative_cache.record(url, DownloadError('HTTP Error 503: Service Unavailable'))
+        calls = []
+
+        from app import app
+        import extractor_backends
+        with mock.patch.object(extractor_backends, 'select', lambda *args, **kwargs: calls.append(args)), \
+                app.test_client() as client:
+            response = client.post('/api/download', json={'url': url})
+        assert response.status_code == 503 and response.headers['X-Negative-Cache'] == 'hit'
+        assert calls == []
+
+        from enhanced_extractor import EnhancedExtractor
+        try:
+            EnhancedExtractor().extract_info(url)
+            assert False, 'expected a CachedFailure'
+        except negative_cache.CachedFailure as e:
+            assert e.kind == 'transient' and e.retry_after > 0
+    print("✅ Hold-offs before extractor backends verified")
+
+def test_endpoint_answers_from_cache():
+    """A URL that failed permanently is answered without extracting again"""
+    print("Testing cached failures on /api/info...")
+    directory = tempfile.mkdtemp()
+    requests_seen = []
+
+    class CountingHandler(SimpleHTTPRequestHandler):
+        def do_GET(self):
+            requests_seen.append(self.path)
+            super().do_GET()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), functools.partial(CountingHandler, directory=directory))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://localhost:{server.server_address[1]}/missing.mp4'
+    with temp_db():
+        try:
+            from app import app
+            with app.test_client() as client:
+                first = client.post('/api/info', json={'url': url})
+                assert first.status_code == 400 and 'HTTP Error 404' in first.get_json()['error']
+                seen = len(requests_seen)
+                assert seen > 0
+
+                second = client.post('/api/info', json={'url': url})
+                assert second.status_code == 400
+                assert second.headers['X-Negative-Cache'] == 'hit'
+                assert int(second.headers['Retry-After']) > 0
+                body = second.get_json()
+                assert body['failure'] == 'permanent' and 'HTTP Error 404' in body['error']
+                assert len(requests_seen) == seen
+
+                download = client.post('/api/download', json={'url': url, 'format': 'best'})
+                assert download.status_code == 400 and download.headers['X-Negative-Cache'] == 'hit'
+                assert len(requests_seen) == seen
+        finally:
+            server.shutdown()
+    print("✅ Cached failures on /api/info verified")
+
+if __name__ == '__main__':
+    test_classify()
+    test_ttls_and_backoff()
+    test_guard_passes_bugs_through()
+    test_held_off_urls_skip_backends()
+    test_endpoint_answers_from_cache()
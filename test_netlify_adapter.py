@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Test the Netlify function WSGI adapter
+"""
+import base64
+import gzip
+import importlib.util
+import os
+from flask import Flask, Response, request
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+def load_netlify_function():
+    spec = importlib.util.spec_from_file_location('netlify_api', os.path.join(ROOT, 'netlify', 'functions', 'api.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def make_binary_app():
+    app = Flask('netlify_binary_test')
+
+    @app.route('/echo', methods=['POST'])
+    def echo():
+        return Response(request.get_data(), mimetype='application/octet-stream')
+
+    @app.route('/big')
+    def big():
+        return Response((b'\x00' * 1024 for _ in range(100)), mimetype='video/mp4')
+
+    @app.route('/forty')
+    def forty():
+        return Response(b'\x00' * 40 * 1024, mimetype='video/mp4')
+
+    return app
+
+def test_health_and_warm_app_reuse():
+    """The Flask app is imported once and reused across invocations"""
+    print("Testing Netlify adapter with the Vercel app...")
+    netlify = load_netlify_function()
+    event = {'httpMethod': 'GET', 'path': '/api/health', 'headers': {'host': 'example.netlify.app'}}
+
+    result = netlify.handler(event, None)
+    assert result['statusCode'] == 200
+    assert result['isBase64Encoded'] is False
+    assert '"status": "healthy"' in result['body'] or '"status":"healthy"' in result['body']
+    app = netlify._app
+    netlify.handler(event, None)
+    assert netlify._app is app
+    print("✅ Health check through the adapter passed")
+
+def test_binary_bodies_round_trip():
+    """Binary request and response bodies survive base64 in both directions"""
+    print("Testing binary bodies...")
+    netlify = load_netlify_function()
+    netlify._app = make_binary_app()
+
+    payload = bytes(range(256)) * 4
+    result = netlify.handler({
+        'httpMethod': 'POST',
+        'path': '/echo',
+        'headers': {'content-type': 'application/octet-stream'},
+        'body': base64.b64encode(payload).decode('ascii'),
+        'isBase64Encoded': True,
+    }, None)
+    assert result['statusCode'] == 200
+    assert result['isBase64Encoded'] is True
+    assert base64.b64decode(result['body']) == payload
+
+    netlify.MAX_BUFFERED_BODY = 50 * 1024
+    result = netlify.handler({'httpMethod': 'GET', 'path': '/big', 'headers': {}}, None)
+    assert result['statusCode'] == 502
+
+    # The limit counts the base64 payload: 40 KB of binary encodes to ~53 KB
+    result = netlify.handler({'httpMethod': 'GET', 'path': '/forty', 'headers': {}}, None)
+    assert result['statusCode'] == 502
+    netlify.MAX_BUFFERED_BODY = 60 * 1024
+    result = netlify.handler({'httpMethod': 'GET', 'path': '/forty', 'headers': {}}, None)
+    assert result['statusCode'] == 200 and len(result['body']) <= netlify.MAX_BUFFERED_BODY
+    print("✅ Binary bodies verified")
+
+def test_multi_value_headers():
+    """Repeated headers are joined with commas, except Cookie which uses semicolons"""
+    print("Testing multi-value headers...")
+    netlify = load_netlify_function()
+    environ = netlify.event_to_environ({
+        'httpMethod': 'GET',
+        'path': '/',
+        'headers': {'cookie': 'a=1'},
+        'multiValueHeaders': {'Cookie': ['a=1', 'b=2'], 'Accept': ['text/html', 'application/json']},
+    })
+    assert environ['HTTP_COOKIE'] == 'a=1; b=2'
+    assert environ['HTTP_ACCEPT'] == 'text/html, application/json'
+
+    from werkzeug.wrappers import Request
+    assert Request(environ).cookies.to_dict() == {'a': '1', 'b': '2'}
+    print("✅ Multi-value headers verified")
+
+def test_compressed_json_is_base64():
+    """Gzipped JSON goes back as base64, not as decoded text"""
+    print("Testing compressed JSON through the adapter...")
+    netlify = load_netlify_function()
+    os.environ['COMPRESS_MIN_BYTES'] = '10'
+    try:
+        result = netlify.handler({'httpMethod': 'GET', 'path': '/api/platforms',
+                                  'headers': {'accept-encoding': 'gzip'}}, None)
+    finally:
+        del os.environ['COMPRESS_MIN_BYTES']
+    assert result['headers']['Content-Encoding'] == 'gzip'
+    assert result['isBase64Encoded'] is True
+    assert b'YouTube' in gzip.decompress(base64.b64decode(result['body']))
+    print("✅ Compressed JSON verified")
+
+if __name__ == '__main__':
+    test_health_and_warm_app_reuse()
+    test_binary_bodies_round_trip()
+    test_multi_value_headers()
+    test_compressed_json_is_base64()
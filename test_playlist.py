@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Test NDJSON playlist streaming with lazy pagination
+"""
+import itertools
+import json
+import os
+from unittest import mock
+from app import app
+import api
+
+def endless_playlist(consumed):
+    for index in itertools.count():
+        consumed.append(index)
+        yield {'_type': 'url', 'id': f'v{index}', 'title': f'Video {index}',
+               'url': f'https://www.youtube.com/watch?v=v{index}'}
+
+def test_pages_are_lazy():
+    """Only the requested page (plus one look-ahead entry) is enumerated"""
+    print("Testing lazy playlist pages...")
+    consumed = []
+    original = api.resolve_playlist
+    api.resolve_playlist = lambda ydl, url: {'_type': 'playlist', 'id': 'PL', 'title': 'Endless',
+                                            'entries': endless_playlist(consumed)}
+    try:
+        with app.test_client() as client:
+            response = client.post('/api/playlist', json={'url': 'https://www.youtube.com/playlist?list=PL',
+                                                          'cursor': '10', 'page_size': 5})
+            lines = [json.loads(line) for line in response.data.decode().splitlines()]
+    finally:
+        api.resolve_playlist = original
+
+    assert response.mimetype == 'application/x-ndjson'
+    assert lines[0]['type'] == 'playlist' and lines[0]['title'] == 'Endless'
+    assert [line['index'] for line in lines[1:-1]] == [10, 11, 12, 13, 14]
+    assert lines[-1] == {'type': 'end', 'count': 5, 'next_cursor': '15'}
+    assert len(consumed) == 16
+    print("✅ Lazy playlist pages verified")
+
+def test_client_can_stop_early():
+    """Closing the stream stops the enumeration"""
+    print("Testing early stop...")
+    consumed = []
+    original = api.resolve_playlist
+    api.resolve_playlist = lambda ydl, url: {'_type': 'playlist', 'entries': endless_playlist(consumed)}
+    try:
+        with app.test_client() as client:
+            response = client.post('/api/playlist', json={'url': 'https://www.youtube.com/playlist?list=PL',
+                                                          'page_size': 500}, buffered=False)
+            stream = iter(response.response)
+            for _ in range(4):
+                next(stream)
+            response.close()
+    finally:
+        api.resolve_playlist = original
+
+    assert len(consumed) == 3
+    print("✅ Early stop verified")
+
+def test_expanded_entries():
+    """expand=true fully extracts entries on worker threads, in playlist order"""
+    print("Testing expanded playlist entries...")
+    entries = [
+        {'_type': 'url', 'id': 'v0', 'title': 'Video 0', 'url': 'https://www.youtube.com/watch?v=v0'},
+        {'id': 'v1', 'title': 'Video 1', 'webpage_url': 'https://www.youtube.com/watch?v=v1',
+         'formats': [{'format_id': '18'}], 'thumbnail': 'https://i.ytimg.com/vi/v1/hq.jpg'},
+        {'_type': 'url', 'id': 'v2', 'title': 'Video 2', 'url': 'https://www.youtube.com/watch?v=v2'},
+    ]
+
+    def get_or_extract(url, extract):
+        video_id = url.rsplit('=', 1)[1]
+        return {'id': video_id, 'title': f'Full {video_id}', 'webpage_url': url, 'extractor_key': 'Youtube',
+                'thumbnail': f'https://i.ytimg.com/vi/{video_id}/hq.jpg', 'formats': [{}, {}]}, 'miss'
+
+    with mock.patch.object(api, 'resolve_playlist', lambda ydl, url: {'_type': 'playlist', 'entries': entries}), \
+            mock.patch.object(api.metadata_store, 'get_or_extract', get_or_extract), \
+            mock.patch.dict(os.environ, {'THUMBNAIL_SECRET': 'test-secret'}), app.test_client() as client:
+        response = client.post('/api/playlist', json={'url': 'https://www.youtube.com/playlist?list=PL',
+                                                      'expand': True})
+        lines = [json.loads(line) for line in response.data.decode().splitlines()]
+
+    records = lines[1:-1]
+    assert [record['index'] for record in records] == [0, 1, 2]
+    assert all('error' not in record for record in records), records
+    assert [record['metadata']['title'] for record in records] == ['Full v0', 'Video 1', 'Full v2']
+    assert records[0]['metadata']['formats_available'] == 2
+    assert all(record['metadata']['thumbnail_url'].startswith('/api/thumbnail/') for record in records)
+    assert lines[-1] == {'type': 'end', 'count': 3, 'next_cursor': None}
+    print("✅ Expanded playlist entries verified")
+
+def test_invalid_cursor():
+    with app.test_client() as client:
+        response = client.post('/api/playlist', json={'url': 'https://www.youtube.com/playlist?list=PL',
+                                                      'cursor': 'abc'})
+        assert response.status_code == 400
+
+if __name__ == '__main__':
+    test_pages_are_lazy()
+    test_client_can_stop_early()
+    test_expanded_entries()
+    test_invalid_cursor()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Test the ffmpeg post-processing worker pool
+"""
+import datetime
+import os
+import tempfile
+import yt_dlp
+from yt_dlp.postprocessor.common import PostProcessor
+import postprocess_pool
+
+class UppercasePP(PostProcessor):
+    """Stand-in for an ffmpeg postprocessor: rewrites the file in the worker process"""
+
+    def run(self, info):
+        with open(info['filepath']) as f:
+            data = f.read()
+        new_path = info['filepath'] + '.upper'
+        with open(new_path, 'w') as f:
+            f.write(f"{data.upper()} pid={os.getpid()}")
+        info['filepath'] = new_path
+        info['ext'] = 'upper'
+        info.pop('obsolete', None)
+        return [], info
+
+def test_postprocessor_runs_in_pool():
+    """The postprocessor runs in a worker process and the request thread gets its result"""
+    print("Testing pooled postprocessing...")
+    source = os.path.join(tempfile.mkdtemp(), 'clip.txt')
+    with open(source, 'w') as f:
+        f.write('hello')
+
+    hook_events = []
+    with yt_dlp.YoutubeDL({'quiet': True, 'postprocessor_hooks': [lambda d: hook_events.append(d['status'])]}) as ydl:
+        postprocess_pool.schedule(ydl, pooled={'UppercasePP'})
+        pp = UppercasePP(ydl)
+        # Values sanitize_info can't keep (it turns them into repr strings)
+        marker, when = object(), datetime.datetime(2024, 1, 2, 3, 4, 5)
+        original = {'filepath': source, 'ext': 'txt', 'obsolete': 1, 'opaque': marker, 'when': when,
+                    'tags': {'a', 'b'}, '__postprocessors': [pp]}
+        info = ydl.run_pp(pp, original)
+
+    with open(info['filepath']) as f:
+        content = f.read()
+    assert content.startswith('HELLO pid=')
+    assert int(content.split('pid=')[1]) != os.getpid()
+    assert info['__postprocessors'] == [pp]
+    # Only what the worker changed comes back; everything else is the original object
+    assert info['ext'] == 'upper' and 'obsolete' not in info
+    assert info['opaque'] is marker and info['when'] is when and info['tags'] == {'a', 'b'}
+    assert hook_events == ['started', 'finished']
+
+    stats = postprocess_pool.stats()
+    assert stats['completed'] >= 1
+    assert stats['in_flight'] == 0
+    assert stats['queue_depth'] == 0
+    print("✅ Pooled postprocessing verified")
+
+if __name__ == '__main__':
+    test_postprocessor_runs_in_pool()
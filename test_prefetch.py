@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Test speculative prefetch after /api/info
+"""
+import functools
+import os
+import shutil
+import tempfile
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+from inflight import InflightRegistry
+from prefetch import Prefetcher
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+def fake_run(size, release=None):
+    """Stand-in for download_media: reports progress and writes `size` bytes"""
+    def run(download):
+        if release is not None:
+            release.wait(5)
+        path = os.path.join(download.temp_dir, 'clip.mp4')
+        download.progress_hook({'status': 'downloading', 'filename': path, 'downloaded_bytes': size // 2,
+                                'total_bytes': size})
+        with open(path, 'wb') as f:
+            f.write(b'x' * size)
+        download.progress_hook({'status': 'finished', 'filename': path, 'downloaded_bytes': size, 'total_bytes': size})
+        return path, {'title': 'clip', 'ext': 'mp4'}
+    return run
+
+def test_prefetch_hit():
+    """A download request attaches to the finished prefetch and the files go with it"""
+    print("Testing prefetch hits...")
+    registry = InflightRegistry()
+    prefetcher = Prefetcher(registry, concurrency=2, budget_bytes=10_000, unused_seconds=30)
+    job = prefetcher.start('key', 'https://example.com/v', {}, fake_run(1000))
+    assert wait_for(lambda: not job.running)
+    assert prefetcher.stats()['reserved_bytes'] == 1000
+
+    download, leader = registry.acquire('key')
+    assert not leader and download.wait_ready(1) == 'done'
+    prefetcher.note_attach(download)
+    stats = prefetcher.stats()
+    assert stats['hits'] == 1 and stats['hit_rate'] == 1.0 and stats['reserved_bytes'] == 0
+    assert os.path.exists(download.path)
+    download.release()
+    assert not os.path.exists(download.temp_dir)
+    assert registry.stats()['downloads'] == 0
+    print("✅ Prefetch hits verified")
+
+def test_unused_prefetch_expires():
+    """Prefetches nobody asked for are cancelled and counted as waste"""
+    print("Testing unused prefetch expiry...")
+    registry = InflightRegistry()
+    prefetcher = Prefetcher(registry, concurrency=2, budget_bytes=10_000, unused_seconds=0.2)
+    job = prefetcher.start('key', 'https://example.com/v', {}, fake_run(1000))
+    assert wait_for(lambda: prefetcher.stats()['unused'] == 1)
+    stats = prefetcher.stats()
+    assert stats['wasted_bytes'] == 1000 and stats['hit_rate'] == 0.0 and stats['reserved_bytes'] == 0
+    assert not os.path.exists(job.download.temp_dir)
+    assert registry.stats()['downloads'] == 0
+
+    # Live streams are never prefetched
+    assert prefetcher.start('live', 'https://example.com/l', {'live_status': 'is_live'}, fake_run(10)) is None
+    print("✅ Unused prefetch expiry verified")
+
+def test_limits():
+    """The byte budget cancels oversized prefetches; the concurrency cap skips new ones"""
+    print("Testing prefetch limits...")
+    registry = InflightRegistry()
+    prefetcher = Prefetcher(registry, concurrency=1, budget_bytes=1000, unused_seconds=30)
+    job = prefetcher.start('big', 'https://example.com/big', {}, fake_run(5000))
+    assert wait_for(lambda: not os.path.exists(job.download.temp_dir))
+    assert job.cancelled == 'budget'
+    stats = prefetcher.stats()
+    assert stats['cancelled_budget'] == 1 and stats['reserved_bytes'] == 0
+
+    release = threading.Event()
+    first = prefetcher.start('a', 'https://example.com/a', {}, fake_run(10, release))
+    assert prefetcher.start('b', 'https://example.com/b', {}, fake_run(10)) is None
+    assert prefetcher.stats()['skipped_busy'] == 1
+    release.set()
+    assert wait_for(lambda: not first.running)
+    print("✅ Prefetch limits verified")
+
+def test_info_then_download():
+    """/api/info prefetches the default format and /api/download reuses it"""
+    print("Testing /api/info prefetch...")
+    directory = tempfile.mkdtemp()
+    payload = b'\x00\x00\x00\x18ftypmp42' + os.urandom(256 * 1024)
+    with open(os.path.join(directory, 'clip.mp4'), 'wb') as f:
+        f.write(payload)
+    handler = functools.partial(SimpleHTTPRequestHandler, directory=directory)
+    handler.log_message = lambda *args: None
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://localhost:{server.server_address[1]}/clip.mp4'
+    # A small direct file would otherwise be proxied, and those aren't prefetched
+    with mock.patch.dict(os.environ, {'METADATA_DB': os.path.join(directory, 'metadata.sqlite3'),
+                                      'PREFETCH': '1', 'DELIVERY_STRATEGIES': 'download'}):
+        try:
+            from app import app
+            import api
+            import prefetch
+            # The 720p default needs height information a bare mp4 doesn't have
+            default_format, api.DEFAULT_FORMAT = api.DEFAULT_FORMAT, 'best'
+            hits = prefetch.stats()['hits']
+            with app.test_client() as client:
+                assert client.post('/api/info', json={'url': url}).status_code == 200
+                assert wait_for(lambda: prefetch.stats()['started'] >= 1)
+                response = client.post('/api/download', json={'url': url, 'format': 'best'})
+                assert response.status_code == 200, response.get_json()
+                assert response.headers.get('X-Shared-Download') in ('growing', 'done')
+                assert response.data == payload
+                response.close()
+            assert prefetch.stats()['hits'] == hits + 1
+        finally:
+            api.DEFAULT_FORMAT = default_format
+            server.shutdown()
+            shutil.rmtree(directory, ignore_errors=True)
+    print("✅ /api/info prefetch verified")
+
+def test_cancelled_prefetch_restarts():
+    """A request attached to a prefetch that gets cancelled downloads the file itself"""
+    print("Testing cancelled prefetches...")
+    import sys
+    import yt_dlp
+    import prefetch
+
+    try:
+        raise prefetch.PrefetchCancelled('Prefetch byte budget exhausted')
+    except prefetch.PrefetchCancelled:
+        wrapped = yt_dlp.DownloadError('ERROR: Prefetch byte budget exhausted', sys.exc_info())
+    assert prefetch.is_cancellation(wrapped)
+    assert not prefetch.is_cancellation(yt_dlp.DownloadError('HTTP Error 404: Not Found'))
+
+    directory = tempfile.mkdtemp()
+    payload = b'\x00\x00\x00\x18ftypmp42' + os.urandom(64 * 1024)
+    with open(os.path.join(directory, 'clip.mp4'), 'wb') as f:
+        f.write(payload)
+    handler = functools.partial(SimpleHTTPRequestHandler, directory=directory)
+    handler.log_message = lambda *args: None
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://localhost:{server.server_address[1]}/clip.mp4'
+    with mock.patch.dict(os.environ, {'METADATA_DB': os.path.join(directory, 'metadata.sqlite3'),
+                                      'DELIVERY_STRATEGIES': 'download'}):
+        try:
+            from app import app
+            import inflight
+            # A prefetch is running; it is cancelled while the request waits on it
+            cancelled, leader = inflight.registry.acquire(inflight.download_key(url, 'best'))
+            assert leader
+            threading.Timer(0.3, lambda: (cancelled.fail(wrapped), cancelled.release())).start()
+            with app.test_client() as client:
+                response = client.post('/api/download', json={'url': url, 'format': 'best'})
+                assert response.status_code == 200, response.get_json()
+                assert 'X-Shared-Download' not in response.headers
+                assert response.data == payload
+                response.close()
+        finally:
+            server.shutdown()
+            shutil.rmtree(directory, ignore_errors=True)
+    print("✅ Cancelled prefetches verified")
+
+if __name__ == '__main__':
+    test_prefetch_hit()
+    test_unused_prefetch_expires()
+    test_limits()
+    test_info_then_download()
+    test_cancelled_prefetch_restarts()
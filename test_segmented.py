@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Test segmented multi-connection downloads
+"""
+import os
+import re
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import requests
+import inflight
+import segmented
+
+BODY = os.urandom(3 * 1024 * 1024 + 123)
+
+def start_server(ranges=True, fail_once=()):
+    """Serve BODY at /video.mp4; ranges starting at an offset in `fail_once` are cut off
+    halfway the first time. Returns (server, stats)"""
+    stats = {'requests': 0, 'bytes': 0, 'active': 0, 'max_active': 0}
+    failed = set()
+    lock = threading.Lock()
+
+    class MediaHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            with lock:
+                stats['requests'] += 1
+                stats['active'] += 1
+                stats['max_active'] = max(stats['max_active'], stats['active'])
+            try:
+                self._serve()
+            finally:
+                with lock:
+                    stats['active'] -= 1
+
+        def _serve(self):
+            start, end, status = 0, len(BODY) - 1, 200
+            match = re.match(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+            if ranges and match:
+                start = int(match.group(1))
+                end = min(int(match.group(2)), end) if match.group(2) else end
+                status = 206
+            self.send_response(status)
+            self.send_header('Content-Length', str(end - start + 1))
+            if status == 206:
+                self.send_header('Content-Range', f'bytes {start}-{end}/{len(BODY)}')
+            self.end_headers()
+            data = BODY[start:end + 1]
+            if start in fail_once and start not in failed and len(data) > 1:
+                failed.add(start)
+                data = data[:len(data) // 2]
+                self.close_connection = True
+            for offset in range(0, len(data), 64 * 1024):
+                chunk = data[offset:offset + 64 * 1024]
+                try:
+                    self.wfile.write(chunk)
+                except (BrokenPipeError, ConnectionResetError):
+                    return
+                with lock:
+                    stats['bytes'] += len(chunk)
+                # Per-connection throttling, as CDNs do
+                time.sleep(0.005)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), MediaHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, stats
+
+def url_of(server):
+    return f'http://127.0.0.1:{server.server_address[1]}/video.mp4'
+
+def test_plan_segments():
+    print("Testing segment planning...")
+    mb = 1024 * 1024
+    quarter = 10 * mb // 4
+    assert segmented.plan_segments(10 * mb, 4, max_segment=4 * mb) == [
+        (0, quarter), (quarter, 2 * quarter), (2 * quarter, 3 * quarter), (3 * quarter, 10 * mb)]
+    many = segmented.plan_segments(100 * mb, 4, max_segment=4 * mb)
+    assert len(many) == 25 and many[-1][1] == 100 * mb
+    assert segmented.plan_segments(mb, 8) == [(0, 512 * 1024), (512 * 1024, mb)]
+    print("✅ Segment planning verified")
+
+def test_segmented_download():
+    print("Testing segmented download...")
+    server, stats = start_server()
+    path = os.path.join(tempfile.mkdtemp(), 'video.mp4')
+    progress = []
+    try:
+        summary = segmented.download(requests.Session(), url_of(server), path, connection_count=4,
+                                     progress_callback=lambda *args: progress.append(args))
+    finally:
+        server.shutdown()
+    assert summary['mode'] == 'segmented' and summary['connections'] == 4 and summary['retries'] == 0
+    with open(path, 'rb') as f:
+        assert f.read() == BODY
+    assert stats['max_active'] > 1
+    # The contiguous prefix never runs ahead of what was downloaded, and ends complete
+    assert all(contiguous <= downloaded <= total for downloaded, total, contiguous in progress)
+    assert progress[-1] == (len(BODY), len(BODY), len(BODY))
+    print("✅ Segmented download verified")
+
+def test_failed_segment_retried():
+    """Only the cut-off segment is fetched again, from where it stopped"""
+    print("Testing segment retries...")
+    segments = segmented.plan_segments(len(BODY), 4)
+    server, stats = start_server(fail_once={segments[2][0]})
+    path = os.path.join(tempfile.mkdtemp(), 'video.mp4')
+    try:
+        summary = segmented.download(requests.Session(), url_of(server), path, connection_count=4)
+    finally:
+        server.shutdown()
+    with open(path, 'rb') as f:
+        assert f.read() == BODY
+    assert summary['retries'] == 1
+    # Beyond the probe byte, less than the cut segment was fetched again: it
+    # resumed where it broke off (minus the chunk lost with the connection)
+    start, end = segments[2]
+    assert 0 < stats['bytes'] - len(BODY) - 1 < (end - start) // 2, stats
+
+    # One connection resumes the same way
+    server, _ = start_server(fail_once={0})
+    try:
+        summary = segmented.download(requests.Session(), url_of(server), path, connection_count=1)
+    finally:
+        server.shutdown()
+    with open(path, 'rb') as f:
+        assert f.read() == BODY
+    assert summary['mode'] == 'single' and summary['retries'] == 1
+    print("✅ Segment retries verified")
+
+def test_single_stream_fallback():
+    print("Testing single-stream fallback...")
+    server, stats = start_server(ranges=False)
+    path = os.path.join(tempfile.mkdtemp(), 'video.mp4')
+    try:
+        summary = segmented.download(requests.Session(), url_of(server), path, connection_count=4)
+    finally:
+        server.shutdown()
+    assert summary['mode'] == 'single'
+    # The probe's response was the download: one request
+    assert stats['requests'] == 1
+    with open(path, 'rb') as f:
+        assert f.read() == BODY
+    print("✅ Single-stream fallback verified")
+
+def test_reader_stops_at_contiguous_prefix():
+    """Readers of a preallocated file don't read past the bytes filled in from the start"""
+    print("Testing readers of segmented downloads...")
+    download, _ = inflight.InflightRegistry().acquire(('segmented-test',))
+    part = os.path.join(download.temp_dir, 'video.mp4.part')
+    with open(part, 'wb') as f:
+        f.write(b'a' * 1000 + b'\0' * 1000 + b'c' * 1000)
+    download.publish({'protocol': 'https'})
+    download.progress_hook({'status': 'downloading', 'tmpfilename': part, 'total_bytes': 3000,
+                            'downloaded_bytes': 2000, 'contiguous_bytes': 1000})
+    reader = download.open_reader()
+    assert reader.read(4096) == b'a' * 1000
+
+    def fill_in():
+        with open(part, 'r+b') as f:
+            f.seek(1000)
+            f.write(b'b' * 1000)
+        download.progress_hook({'status': 'downloading', 'tmpfilename': part, 'total_bytes': 3000,
+                                'downloaded_bytes': 3000, 'contiguous_bytes': 3000})
+
+    threading.Timer(0.2, fill_in).start()
+    assert reader.read(4096) == b'b' * 1000 + b'c' * 1000
+    download.finish(part, {})
+    assert reader.read(4096) == b''
+    reader.close()
+    print("✅ Readers of segmented downloads verified")
+
+if __name__ == '__main__':
+    test_plan_segments()
+    test_segmented_download()
+    test_failed_segment_retried()
+    test_single_stream_fallback()
+    test_reader_stops_at_contiguous_prefix()
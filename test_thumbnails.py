@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Test the thumbnail proxy and its on-disk cache
+"""
+import io
+import ipaddress
+import os
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from unittest import mock
+import thumbnails
+
+def make_image(width=1280, height=720):
+    try:
+        from PIL import Image
+    except ImportError:
+        return b'\xff\xd8' + b'\x00' * 1024
+    out = io.BytesIO()
+    Image.new('RGB', (width, height), (200, 30, 30)).save(out, format='JPEG')
+    return out.getvalue()
+
+def test_thumbnail_proxy():
+    """Thumbnails are fetched once, resized per bucket and revalidated with ETags"""
+    print("Testing thumbnail proxy...")
+    os.environ['THUMBNAIL_CACHE_DIR'] = tempfile.mkdtemp()
+    source = make_image()
+    fetched = []
+
+    def fake_fetch(url, referer=None):
+        fetched.append((url, referer))
+        return source
+
+    original_fetch = thumbnails.fetch
+    thumbnails.fetch = fake_fetch
+    try:
+        from app_vercel import app
+        # Keys are signed without an app context
+        with mock.patch.dict(os.environ, {'THUMBNAIL_SECRET': 'test-secret'}):
+            path = thumbnails.proxy_url('https://cdn.example.com/t.jpg', 'https://www.tiktok.com/@u/video/1')
+
+        with mock.patch.dict(os.environ, {'THUMBNAIL_SECRET': 'test-secret'}), app.test_client() as client:
+            response = client.get(path)
+            assert response.status_code == 200
+            assert response.headers['Content-Type'] == 'image/jpeg'
+            assert 'immutable' in response.headers['Cache-Control']
+            assert response.data == source
+
+            small = client.get(path + '?w=300')
+            assert small.status_code == 200
+            assert len(small.data) < len(source) or small.data == source
+
+            cached = client.get(path, headers={'If-None-Match': response.headers['ETag']})
+            assert cached.status_code == 304
+
+            assert client.get(path[:-1] + 'x').status_code == 404
+
+        assert fetched == [('https://cdn.example.com/t.jpg', 'https://www.tiktok.com/@u/video/1')]
+    finally:
+        thumbnails.fetch = original_fetch
+    print("✅ Thumbnail proxy verified")
+
+def test_keys_need_a_secret():
+    """The apps' fallback secret keys are public, so nothing is signed without a configured one"""
+    print("Testing thumbnail key secrets...")
+    with mock.patch.dict(os.environ, {'THUMBNAIL_SECRET': 'one'}):
+        path = thumbnails.proxy_url('https://cdn.example.com/t.jpg')
+        key = path.rsplit('/', 1)[1]
+        assert thumbnails.parse_key(key) == ('https://cdn.example.com/t.jpg', None)
+    with mock.patch.dict(os.environ, {'THUMBNAIL_SECRET': 'two'}):
+        assert thumbnails.parse_key(key) is None
+    with mock.patch.dict(os.environ):
+        os.environ.pop('THUMBNAIL_SECRET', None)
+        os.environ.pop('SESSION_SECRET', None)
+        assert thumbnails.proxy_url('https://cdn.example.com/t.jpg') is None
+        assert thumbnails.parse_key(key) is None
+        from app_vercel import app
+        with app.test_client() as client:
+            assert client.get(path).status_code == 404
+    print("✅ Thumbnail key secrets verified")
+
+def test_internal_hosts_refused():
+    """Hosts resolving to internal addresses are refused, including redirect targets"""
+    print("Testing thumbnail host checks...")
+    for url in ('http://127.0.0.1/t.jpg', 'http://10.1.2.3/t.jpg', 'http://169.254.169.254/latest/meta-data',
+                'http://[::1]/t.jpg', 'http://[::ffff:127.0.0.1]/t.jpg', 'http://localhost:8080/t.jpg',
+                'file:///etc/passwd'):
+        try:
+            thumbnails.fetch(url)
+        except ValueError:
+            continue
+        raise AssertionError(f'{url} was fetched')
+
+    # A local CDN; "cdn.example" only resolves through the patched
+    # host_addresses, and loopback counts as public for the test
+    seen = []
+
+    class CdnHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            seen.append((self.path, self.headers['Host']))
+            if self.path == '/moved.jpg':
+                self.send_response(302)
+                self.send_header('Location', 'http://169.254.169.254/latest/meta-data')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header('Content-Length', '4')
+            self.end_headers()
+            self.wfile.write(b'\xff\xd8ok')
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(('127.0.0.1', 0), CdnHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_address[1]
+    loopback = ipaddress.ip_address('127.0.0.1')
+    resolutions = []
+
+    def addresses(host, port):
+        resolutions.append(host)
+        if host == 'cdn.example':
+            return [loopback]
+        return [ipaddress.ip_address(host)]
+
+    real_is_public = thumbnails.is_public
+    try:
+        with mock.patch.object(thumbnails, '_session', None), \
+                mock.patch.object(thumbnails, 'host_addresses', addresses), \
+                mock.patch.object(thumbnails, 'is_public', lambda a: a == loopback or real_is_public(a)):
+            # One lookup, and the connection goes to the address it checked
+            # (a rebinding host gets no second lookup to answer differently)
+            assert thumbnails.fetch(f'http://cdn.example:{port}/t.jpg') == b'\xff\xd8ok'
+            assert seen == [('/t.jpg', f'cdn.example:{port}')]
+            assert resolutions == ['cdn.example']
+
+            try:
+                thumbnails.fetch(f'http://cdn.example:{port}/moved.jpg')
+            except ValueError as e:
+                assert 'internal address' in str(e)
+            else:
+                raise AssertionError('redirect to an internal address was followed')
+    finally:
+        server.shutdown()
+        server.server_close()
+    print("✅ Thumbnail host checks verified")
+
+def test_one_fetch_per_thumbnail():
+    """Concurrent requests for a thumbnail share one fetch, and its lock is dropped afterwards"""
+    print("Testing concurrent thumbnail fetches...")
+    os.environ['THUMBNAIL_CACHE_DIR'] = tempfile.mkdtemp()
+    fetched = []
+
+    def slow_fetch(url, referer=None):
+        fetched.append(url)
+        time.sleep(0.1)
+        return b'\xff\xd8' + b'\x00' * 1024
+
+    with mock.patch.object(thumbnails, 'fetch', slow_fetch):
+        threads = [threading.Thread(target=thumbnails.get_thumbnail, args=('https://cdn.example.com/c.jpg',))
+                   for _ in range(8)]
+        for i, thread in enumerate(threads):
+            thread.start()
+            if i == 2:
+                time.sleep(0.05)
+        for thread in threads:
+            thread.join()
+    assert fetched == ['https://cdn.example.com/c.jpg']
+    assert thumbnails._locks == {}
+    print("✅ Concurrent thumbnail fetches verified")
+
+def test_width_buckets_and_eviction():
+    print("Testing width buckets and cache eviction...")
+    assert thumbnails.width_bucket(100) == 160
+    assert thumbnails.width_bucket(480) == 480
+    assert thumbnails.width_bucket(4000) is None
+    assert thumbnails.width_bucket(None) is None
+
+    directory = tempfile.mkdtemp()
+    os.environ['THUMBNAIL_CACHE_DIR'] = directory
+    for i in range(5):
+        path = os.path.join(directory, f'entry{i}')
+        with open(path, 'wb') as f:
+            f.write(b'x' * 100)
+        os.utime(path, (i, i))
+    assert thumbnails.evict(limit=250) == 3
+    assert sorted(os.listdir(directory)) == ['entry3', 'entry4']
+    print("✅ Width buckets and eviction verified")
+
+if __name__ == '__main__':
+    test_thumbnail_proxy()
+    test_keys_need_a_secret()
+    test_internal_hosts_refused()
+    test_one_fetch_per_thumbnail()
+    test_width_buckets_and_eviction()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Test per-request phase timing and Server-Timing headers
+"""
+import time
+from timing import RequestTimer
+
+def test_nested_phases_are_exclusive():
+    """Inner phases pause the outer phase and upstream calls go to the innermost one"""
+    print("Testing nested phase spans...")
+
+    timer = RequestTimer()
+    with timer.phase('download'):
+        timer.record_upstream_call()
+        with timer.phase('postprocess'):
+            time.sleep(0.01)
+            timer.record_upstream_call()
+            timer.record_upstream_call()
+    timer.close()
+
+    phases = {p['name']: p for p in timer.as_dict()['phases']}
+    assert phases['download']['upstream_calls'] == 1
+    assert phases['postprocess']['upstream_calls'] == 2
+    assert phases['postprocess']['duration_ms'] >= 10
+    assert phases['download']['duration_ms'] < phases['postprocess']['duration_ms']
+    assert timer.as_dict()['upstream_calls'] == 3
+
+    header = timer.server_timing_header()
+    assert header.startswith('postprocess;dur=')
+    assert 'download;dur=' in header
+    assert 'desc="upstream=2"' in header
+    assert 'total;dur=' in header
+    print("✅ Nested phase spans verified")
+
+def test_server_timing_header():
+    """Every response carries Server-Timing, JSON echo only on request"""
+    print("Testing Server-Timing header...")
+
+    from app_vercel import app
+
+    with app.test_client() as client:
+        response = client.get('/api/health')
+        assert response.status_code == 200
+        assert 'total;dur=' in response.headers['Server-Timing']
+        assert 'timing' not in response.get_json()
+
+        response = client.get('/api/health', headers={'X-Debug-Timing': '1'})
+        data = response.get_json()
+        assert 'timing' in data
+        assert 'total_ms' in data['timing']
+
+        response = client.get('/api/health?debug=timing')
+        assert 'timing' in response.get_json()
+
+    print("✅ Server-Timing header verified")
+
+if __name__ == '__main__':
+    test_nested_phases_are_exclusive()
+    test_server_timing_header()
+    print("✅ Timing tests completed!")
@@ -0,0 +1,360 @@
+"""
+Thumbnail proxy with width buckets and a size-bounded on-disk cache
+/api/info hands out /api/thumbnail/<key> links instead of raw CDN URLs. The
+key is the signed thumbnail URL (plus the page it came from, sent as the
+Referer), so the proxy only fetches URLs this app issued. Keys are only
+issued with a configured secret; without one `thumbnail_url` is null and
+clients use the CDN URL in `thumbnail`. Hosts that resolve to loopback,
+private or link-local addresses are refused, on redirects too, and the
+connection goes to the address that was checked. Each thumbnail is fetched
+from the platform once, optionally downsized to a width bucket (requires
+Pillow; the original is served without it) and kept on disk until the
+cache grows past its size limit, oldest first.
+
+Environment variables:
+    THUMBNAIL_SECRET           Key signing secret (default SESSION_SECRET; no proxying without either)
+    THUMBNAIL_CACHE_DIR        Cache directory (default <tmp>/thumbnail-cache)
+    THUMBNAIL_CACHE_MAX_BYTES  Cache size limit (default 100 MB)
+"""
+import base64
+import hashlib
+import hmac
+import contextlib
+import io
+import ipaddress
+import logging
+import os
+import socket
+import tempfile
+import threading
+from urllib.parse import urljoin, urlparse
+from flask import Response, jsonify, request
+import timing
+import bandwidth
+
+logger = logging.getLogger(__name__)
+
+# Requested widths are rounded up to one of these so the cache holds a
+# handful of variants per thumbnail; wider requests get the original
+WIDTH_BUCKETS = (160, 320, 480, 720)
+
+# Upstream thumbnails larger than this are refused
+MAX_SOURCE_BYTES = 5 * 1024 * 1024
+
+# Redirects followed (and checked) per fetch
+MAX_REDIRECTS = 5
+
+# The key names the content, so responses can be cached for a long time
+CACHE_CONTROL = 'public, max-age=2592000, immutable'
+
+USER_AGENT = ('Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
+              '(KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36')
+
+_session = None
+# Cache path -> [lock, requests holding or waiting for it]
+_locks = {}
+_locks_guard = threading.Lock()
+
+
+def cache_dir():
+    return os.environ.get('THUMBNAIL_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'thumbnail-cache'))
+
+
+def cache_max_bytes():
+    return int(os.environ.get('THUMBNAIL_CACHE_MAX_BYTES', 100 * 1024 * 1024))
+
+
+def signing_secret():
+    """Secret keys are signed with, or None when none is configured. The apps'
+    built-in fallback secret keys are public, so they are never used here"""
+    return os.environ.get('THUMBNAIL_SECRET') or os.environ.get('SESSION_SECRET') or None
+
+
+def _signature(payload, secret):
+    return hmac.new(secret.encode('utf-8'), payload, hashlib.sha256).hexdigest()[:20]
+
+
+def make_key(url, referer=None, secret=None):
+    """Build the signed /api/thumbnail key for a thumbnail URL"""
+    secret = secret or signing_secret()
+    if not secret:
+        raise ValueError('No THUMBNAIL_SECRET or SESSION_SECRET configured')
+    payload = f'{url}\n{referer or ""}'.encode('utf-8')
+    encoded = base64.urlsafe_b64encode(payload).decode('ascii').rstrip('=')
+    return f'{encoded}.{_signature(payload, secret)}'
+
+
+def parse_key(key, secret=None):
+    """Return (url, referer) for a valid key, or None"""
+    secret = secret or signing_secret()
+    if not secret:
+        return None
+    encoded, _, signature = key.rpartition('.')
+    try:
+        payload = base64.urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4))
+    except ValueError:
+        return None
+    if not hmac.compare_digest(signature, _signature(payload, secret)):
+        return None
+    url, _, referer = payload.decode('utf-8', errors='replace').partition('\n')
+    if urlparse(url).scheme not in ('http', 'https'):
+        return None
+    return url, referer or None
+
+
+def proxy_url(url, referer=None, secret=None):
+    """Path of the proxied thumbnail, or None when there is no thumbnail or
+    keys can't be signed (clients fall back to the raw `thumbnail`)"""
+    secret = secret or signing_secret()
+    if not url or not secret:
+        return None
+    return f'/api/thumbnail/{make_key(url, referer, secret)}'
+
+
+def width_bucket(width):
+    """Round a requested width up to a bucket; None means the original size"""
+    if not width or width <= 0:
+        return None
+    for bucket in WIDTH_BUCKETS:
+        if width <= bucket:
+            return bucket
+    return None
+
+
+def sniff_content_type(data):
+    if data.startswith(b'\xff\xd8'):
+        return 'image/jpeg'
+    if data.startswith(b'\x89PNG'):
+        return 'image/png'
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'image/webp'
+    if data.startswith(b'GIF8'):
+        return 'image/gif'
+    return 'application/octet-stream'
+
+
+def resize(data, width):
+    """Downsize an image to `width` pixels wide; returns the input if that's not possible"""
+    try:
+        from PIL import Image
+    except ImportError:
+        return data
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            if image.width <= width:
+                return data
+            height = max(1, round(image.height * width / image.width))
+            resized = image.convert('RGB').resize((width, height), Image.LANCZOS)
+            out = io.BytesIO()
+            resized.save(out, format='JPEG', quality=82, optimize=True, progressive=True)
+            return out.getvalue()
+    except Exception as e:
+        logger.warning("Thumbnail resize failed: %s", e)
+        return data
+
+
+def _pinning_adapter():
+    """HTTPAdapter that checks each request's host and connects to the address
+    it checked, so the name can't resolve somewhere else in between (DNS
+    rebinding). TLS still verifies the certificate against the host name"""
+    from requests.adapters import HTTPAdapter
+
+    class PinningAdapter(HTTPAdapter):
+        def get_connection_with_tls_context(self, request, verify, proxies=None, cert=None):
+            parsed = urlparse(request.url)
+            address = check_public_url(request.url)
+            host_params, pool_kwargs = self.build_connection_pool_key_attributes(request, verify, cert)
+            host_params['host'] = str(address)
+            if parsed.scheme == 'https':
+                pool_kwargs['server_hostname'] = parsed.hostname
+                pool_kwargs['assert_hostname'] = parsed.hostname
+            request.headers['Host'] = parsed.netloc.rpartition('@')[2]
+            return self.poolmanager.connection_from_host(**host_params, pool_kwargs=pool_kwargs)
+
+    return PinningAdapter()
+
+
+def _get_session():
+    global _session
+    if _session is None:
+        import requests
+        _session = timing.instrument_session(requests.Session())
+        _session.headers.update({'User-Agent': USER_AGENT})
+        # A proxy would resolve the host itself, past the address check
+        _session.trust_env = False
+        adapter = _pinning_adapter()
+        _session.mount('http://', adapter)
+        _session.mount('https://', adapter)
+    return _session
+
+
+def host_addresses(host, port):
+    """Addresses a host name resolves to"""
+    return [ipaddress.ip_address(info[4][0].split('%')[0])
+            for info in socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)]
+
+
+def is_public(address):
+    if getattr(address, 'ipv4_mapped', None):
+        address = address.ipv4_mapped
+    return address.is_global
+
+
+def check_public_url(url):
+    """Return the address to connect to for `url`; raises ValueError unless it
+    is http(s) on a host with only public addresses"""
+    parsed = urlparse(url)
+    if parsed.scheme not in ('http', 'https') or not parsed.hostname:
+        raise ValueError(f'Not a thumbnail URL: {url}')
+    try:
+        addresses = host_addresses(parsed.hostname, parsed.port or (443 if parsed.scheme == 'https' else 80))
+    except (OSError, ValueError) as e:
+        raise ValueError(f'Cannot resolve {parsed.hostname}: {e}')
+    if not addresses:
+        raise ValueError(f'Cannot resolve {parsed.hostname}')
+    for address in addresses:
+        if not is_public(address):
+            raise ValueError(f'{parsed.hostname} resolves to internal address {address}')
+    return addresses[0]
+
+
+def fetch(url, referer=None):
+    """Download a thumbnail from the platform CDN. The session's adapter
+    checks the host of every request, redirects included"""
+    headers = {'Referer': referer} if referer else {}
+    for _ in range(MAX_REDIRECTS + 1):
+        response = _get_session().get(url, headers=headers, timeout=10, stream=True, allow_redirects=False)
+        if not response.is_redirect:
+            break
+        response.close()
+        url = urljoin(url, response.headers['Location'])
+    else:
+        raise ValueError('Too many thumbnail redirects')
+
+    with response:
+        response.raise_for_status()
+        data = bytearray()
+        size = int(response.headers.get('Content-Length') or 0) or None
+        with bandwidth.scheduler.register('ingress', label='thumbnail', size=size or MAX_SOURCE_BYTES) as transfer:
+            for chunk in response.iter_content(64 * 1024):
+                transfer.consume(len(chunk))
+                data.extend(chunk)
+                if len(data) > MAX_SOURCE_BYTES:
+                    raise ValueError('Thumbnail too large')
+    return bytes(data)
+
+
+def _cache_path(url, width):
+    name = hashlib.sha256(url.encode('utf-8')).hexdigest()
+    return os.path.join(cache_dir(), f'{name}_{width or "orig"}')
+
+
+def _read_cached(path):
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except OSError:
+        return None
+    # Bump the mtime so eviction drops the least recently served files first
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+    return data
+
+
+def _write_cached(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def evict(limit=None):
+    """Delete the least recently used files until the cache fits its size limit"""
+    limit = cache_max_bytes() if limit is None else limit
+    try:
+        entries = [entry for entry in os.scandir(cache_dir()) if entry.is_file() and not entry.name.startswith('.tmp-')]
+    except OSError:
+        return 0
+    files = sorted(((entry.stat().st_mtime, entry.stat().st_size, entry.path) for entry in entries))
+    total = sum(size for _, size, _ in files)
+    removed = 0
+    for _, size, path in files:
+        if total <= limit:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        removed += 1
+    return removed
+
+
+@contextlib.contextmanager
+def _locked(path):
+    """Hold the lock for `path`; it is dropped once no request holds or waits for it"""
+    with _locks_guard:
+        entry = _locks.setdefault(path, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _locks_guard:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del _locks[path]
+
+
+def get_thumbnail(url, referer=None, width=None):
+    """Return the thumbnail bytes for a width bucket, from the cache when possible"""
+    path = _cache_path(url, width)
+    data = _read_cached(path)
+    if data is not None:
+        return data
+
+    # One fetch per thumbnail, even when a page asks for several widths at once
+    original_path = _cache_path(url, None)
+    with _locked(original_path):
+        data = _read_cached(path)
+        if data is not None:
+            return data
+
+        original = _read_cached(original_path)
+        if original is None:
+            with timing.phase('download'):
+                original = fetch(url, referer)
+            _write_cached(original_path, original)
+
+        data = original
+        if width:
+            with timing.phase('postprocess'):
+                data = resize(original, width)
+            _write_cached(path, data)
+
+    evict()
+    return data
+
+
+def serve(key):
+    """Flask view body for GET /api/thumbnail/<key>?w=<width>"""
+    parsed = parse_key(key)
+    if parsed is None:
+        return jsonify({'error': 'Unknown thumbnail'}), 404
+    url, referer = parsed
+
+    width = width_bucket(request.args.get('w', type=int))
+    try:
+        data = get_thumbnail(url, referer, width)
+    except Exception as e:
+        logger.warning("Thumbnail fetch failed for %s: %s", url, e)
+        return jsonify({'error': 'Thumbnail unavailable'}), 502
+
+    with timing.phase('serve'):
+        response = Response(data, mimetype=sniff_content_type(data))
+        response.headers['Cache-Control'] = CACHE_CONTROL
+        response.set_etag(hashlib.sha256(data).hexdigest()[:32])
+        return response.make_conditional(request)
@@ -46,7 +46,7 @@ class TikTokExtractor:
             
             return None
         except Exception as e:
-            logger.error(f"Error extracting TikTok video ID: {e}")
+            logger.error("Error extracting TikTok video ID: %s", e)
             return None
 
     def get_video_info(self, url):
@@ -69,7 +69,7 @@ class TikTokExtractor:
             }
             
         except Exception as e:
-            logger.error(f"TikTok fallback extraction failed: {e}")
+            logger.error("TikTok fallback extraction failed: %s", e)
             return None
 
 def is_tiktok_url(url):
@@ -8,6 +8,8 @@ import logging
 import re
 import json
 from urllib.parse import urlparse, parse_qs, quote
+import timing
+import deadline
 
 logger = logging.getLogger(__name__)
 
@@ -22,6 +24,9 @@ class TikWMExtractor:
             'Referer': 'https://www.tikwm.com/',
             'Origin': 'https://www.tikwm.com'
         })
+        timing.instrument_session(self.session)
+        # Caps the per-call timeouts below to the request's remaining budget
+        deadline.instrument_session(self.session)
         
         # Multiple API endpoints for better reliability
         self.api_endpoints = [
@@ -56,20 +61,21 @@ class TikWMExtractor:
         try:
             # Handle different TikTok URL formats
             if 'vm.tiktok.com' in url or 'vt.tiktok.com' in url:
-                logger.info(f"Resolving shortened TikTok URL: {url}")
-                response = self.session.head(url, allow_redirects=True, timeout=10)
+                logger.info("Resolving shortened TikTok URL: %s", url)
+                with timing.phase('resolve'):
+                    response = self.session.head(url, allow_redirects=True, timeout=10)
                 resolved_url = response.url
-                logger.info(f"Resolved URL: {url} -> {resolved_url}")
+                logger.info("Resolved URL: %s -> %s", url, resolved_url)
                 
                 # Check if the resolved URL is valid (not a 404 page)
                 if 'notfound' in resolved_url or response.status_code == 404:
-                    logger.warning(f"TikTok URL may be invalid or video not found: {url} -> {resolved_url}")
+                    logger.warning("TikTok URL may be invalid or video not found: %s -> %s", url, resolved_url)
                     return url  # Return original URL to try anyway
                 
                 return resolved_url
             return url
         except Exception as e:
-            logger.error(f"Error resolving TikTok URL {url}: {e}")
+            logger.error("Error resolving TikTok URL %s: %s", url, e)
             return url
 
     def get_video_info(self, url):
@@ -91,28 +97,38 @@ class TikWMExtractor:
             
             # Try fallback APIs with both URLs
             for api in self.fallback_apis:
-                for test_url in [resolved_url, url]:
+                for test_url in dict.fromkeys([resolved_url, url]):
+                    if not deadline.allows(deadline.MIN_ATTEMPT_SECONDS):
+                        logger.warning("Skipping remaining fallback APIs: request deadline too close")
+                        return None
                     try:
-                        logger.info(f"Trying fallback API: {api['name']} with URL: {test_url}")
+                        logger.info("Trying fallback API: %s with URL: %s", api['name'], test_url)
                         info = api['method'](test_url)
                         if info:
-                            logger.info(f"Successfully extracted with {api['name']}")
+                            logger.info("Successfully extracted with %s", api['name'])
                             return info
                     except Exception as e:
-                        logger.warning(f"Fallback API {api['name']} failed with {test_url}: {e}")
+                        logger.warning("Fallback API %s failed with %s: %s", api['name'], test_url, e)
                         continue
             
             return None
             
         except Exception as e:
-            logger.error(f"Error in get_video_info: {e}")
+            logger.error("Error in get_video_info: %s", e)
             return None
 
-    def _extract_with_tikwm(self, url):
+    def get_video_info_fast(self, url, timeout=15, max_endpoints=None):
+        """TikWM API only, without the slower fallback APIs; None when it has no answer"""
+        return self._extract_with_tikwm(self.resolve_tiktok_url(url), timeout, max_endpoints)
+
+    def _extract_with_tikwm(self, url, timeout=15, max_endpoints=None):
         """Extract using TikWM API with multiple endpoints"""
-        for endpoint in self.api_endpoints:
+        for endpoint in self.api_endpoints[:max_endpoints]:
+            if not deadline.allows(deadline.MIN_ATTEMPT_SECONDS):
+                logger.warning("Skipping remaining TikWM mirrors: request deadline too close")
+                break
             try:
-                logger.info(f"Requesting TikWM API for resolved URL: {url}")
+                logger.info("Requesting TikWM API for resolved URL: %s", url)
                 
                 params = {
                     'url': url,
@@ -130,20 +146,20 @@ class TikWMExtractor:
                     'Referer': 'https://www.tikwm.com/',
                 }
                 
-                response = self.session.get(endpoint, params=params, headers=headers, timeout=15)
+                response = self.session.get(endpoint, params=params, headers=headers, timeout=timeout)
                 response.raise_for_status()
                 
                 # Check content type first
                 content_type = response.headers.get('content-type', '').lower()
                 if 'application/json' not in content_type:
-                    logger.error(f"TikWM API returned non-JSON content type: {content_type}")
+                    logger.error("TikWM API returned non-JSON content type: %s", content_type)
                     continue
                 
                 # Check if response is valid JSON
                 try:
                     data = response.json()
                 except json.JSONDecodeError:
-                    logger.error(f"TikWM API returned invalid JSON for URL {url}: {response.text[:100]}")
+                    logger.error("TikWM API returned invalid JSON for URL %s: %s", url, response.content[:100])
                     continue
                 
                 if data.get('code') == 0 and data.get('data'):
@@ -151,6 +167,7 @@ class TikWMExtractor:
                     
                     # Extract video information
                     info = {
+                        'id': video_data.get('id'),
                         'title': video_data.get('title', 'TikTok Video'),
                         'uploader': video_data.get('author', {}).get('unique_id', 'Unknown'),
                         'duration': video_data.get('duration'),
@@ -184,6 +201,7 @@ class TikWMExtractor:
                             info['formats'].append({
                                 'format_id': 'hd',
                                 'url': fixed_url,
+                                'filesize': video_data.get('hd_size'),
                                 'quality': 'HD',
                                 'ext': 'mp4'
                             })
@@ -194,6 +212,7 @@ class TikWMExtractor:
                             info['formats'].append({
                                 'format_id': 'sd',
                                 'url': fixed_url,
+                                'filesize': video_data.get('size'),
                                 'quality': 'SD',
                                 'ext': 'mp4'
                             })
@@ -204,6 +223,7 @@ class TikWMExtractor:
                             info['formats'].append({
                                 'format_id': 'watermark',
                                 'url': fixed_url,
+                                'filesize': video_data.get('wm_size'),
                                 'quality': 'SD (with watermark)',
                                 'ext': 'mp4'
                             })
@@ -222,17 +242,17 @@ class TikWMExtractor:
                     if video_data.get('cover'):
                         info['thumbnail'] = fix_url(video_data['cover'])
                     
-                    logger.info(f"Successfully extracted TikTok info using TikWM: {info['title']}")
+                    logger.info("Successfully extracted TikTok info using TikWM: %s", info['title'])
                     return info
                 else:
-                    logger.warning(f"TikWM API returned error for {url}: {data}")
+                    logger.warning("TikWM API returned error for %s: %s", url, data)
                     continue
                     
             except requests.exceptions.RequestException as e:
-                logger.error(f"TikWM API request failed for endpoint {endpoint}: {e}")
+                logger.error("TikWM API request failed for endpoint %s: %s", endpoint, e)
                 continue
             except Exception as e:
-                logger.error(f"Unexpected error with TikWM API endpoint {endpoint}: {e}")
+                logger.error("Unexpected error with TikWM API endpoint %s: %s", endpoint, e)
                 continue
         
         return None
@@ -266,7 +286,7 @@ class TikWMExtractor:
                     'note': 'Extracted using SnapTik fallback'
                 }
         except Exception as e:
-            logger.error(f"SnapTik extraction failed: {e}")
+            logger.error("SnapTik extraction failed: %s", e)
         
         return None
 
@@ -315,7 +335,7 @@ class TikWMExtractor:
                     'note': 'Extracted using TikMate fallback'
                 }
         except Exception as e:
-            logger.error(f"TikMate extraction failed: {e}")
+            logger.error("TikMate extraction failed: %s", e)
         
         return None
 
@@ -386,7 +406,7 @@ class TikWMExtractor:
                     pass
                     
         except Exception as e:
-            logger.error(f"SaveTT extraction failed: {e}")
+            logger.error("SaveTT extraction failed: %s", e)
         
         return None
 
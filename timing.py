@@ -0,0 +1,214 @@
+"""
+Per-request phase timing exposed through Server-Timing headers
+Each request gets a RequestTimer that records named phase spans
+(resolve, extract, select-format, download, postprocess, serve) and
+the number of upstream HTTP calls made while each phase was active.
+"""
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from flask import g, has_request_context, request
+
+logger = logging.getLogger(__name__)
+
+# Known phase names, in the order they normally happen
+PHASES = ('resolve', 'extract', 'select-format', 'download', 'postprocess', 'serve')
+
+# Clients opt into the timing echo in JSON bodies with either of these
+DEBUG_HEADER = 'X-Debug-Timing'
+DEBUG_QUERY_PARAM = 'debug'
+
+
+class RequestTimer:
+    """Collect phase spans and upstream call counts for a single request
+
+    Phases nest: while an inner phase runs, the outer one is paused, so each
+    span reports its own (exclusive) time and the spans add up to at most the
+    request total.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans = []
+        self.unattributed_calls = 0
+        self._stack = []
+        self._lock = threading.Lock()
+
+    def push(self, name):
+        """Start a phase, pausing the currently running one"""
+        now = time.perf_counter()
+        span = {'name': name, 'elapsed': 0.0, 'resumed': now, 'upstream_calls': 0}
+        with self._lock:
+            if self._stack:
+                parent = self._stack[-1]
+                parent['elapsed'] += now - parent['resumed']
+            self._stack.append(span)
+        return span
+
+    def pop(self, span=None):
+        """Finish a phase (and any phases left open above it)"""
+        now = time.perf_counter()
+        with self._lock:
+            if not self._stack:
+                return
+            if span is not None and span not in self._stack:
+                return
+            while self._stack:
+                top = self._stack.pop()
+                top['elapsed'] += now - top['resumed']
+                self.spans.append(top)
+                if span is None or top is span:
+                    break
+            if self._stack:
+                self._stack[-1]['resumed'] = now
+
+    def close(self):
+        """Finish every phase that is still running"""
+        while self._stack:
+            self.pop()
+
+    @contextmanager
+    def phase(self, name):
+        span = self.push(name)
+        try:
+            yield self
+        finally:
+            self.pop(span)
+
+    def record_upstream_call(self):
+        """Attribute one upstream HTTP call to the running phase"""
+        with self._lock:
+            if self._stack:
+                self._stack[-1]['upstream_calls'] += 1
+            else:
+                self.unattributed_calls += 1
+
+    @property
+    def total_ms(self):
+        return round((time.perf_counter() - self.started) * 1000, 2)
+
+    def as_dict(self):
+        """Return spans in a JSON-friendly form"""
+        phases = [{
+            'name': span['name'],
+            'duration_ms': round(span['elapsed'] * 1000, 2),
+            'upstream_calls': span['upstream_calls'],
+        } for span in self.spans]
+        return {
+            'total_ms': self.total_ms,
+            'upstream_calls': sum(p['upstream_calls'] for p in phases) + self.unattributed_calls,
+            'phases': phases,
+        }
+
+    def server_timing_header(self):
+        """Render spans as a Server-Timing header value"""
+        entries = []
+        for span in self.as_dict()['phases']:
+            entries.append(f'{span["name"]};dur={span["duration_ms"]};desc="upstream={span["upstream_calls"]}"')
+        entries.append(f'total;dur={self.total_ms}')
+        return ', '.join(entries)
+
+
+def current_timer():
+    """Return the timer for the active request, or None outside a request"""
+    if not has_request_context():
+        return None
+    return g.get('request_timer')
+
+
+@contextmanager
+def phase(name):
+    """Time a block as a named phase of the current request (no-op outside one)"""
+    timer = current_timer()
+    if timer is None:
+        yield None
+        return
+    with timer.phase(name):
+        yield timer
+
+
+def instrument_ydl(ydl):
+    """Count every HTTP request a YoutubeDL instance makes against the current request"""
+    timer = current_timer()
+    if timer is None:
+        return ydl
+    original_urlopen = ydl.urlopen
+
+    def urlopen(req):
+        timer.record_upstream_call()
+        return original_urlopen(req)
+
+    ydl.urlopen = urlopen
+    return ydl
+
+
+def instrument_session(session):
+    """Count every HTTP request made through a requests.Session"""
+    def count_response(response, *args, **kwargs):
+        timer = current_timer()
+        if timer is not None:
+            timer.record_upstream_call()
+        return response
+
+    session.hooks['response'].append(count_response)
+    return session
+
+
+def postprocessor_hook():
+    """Build a yt-dlp postprocessor hook that times postprocessing as its own phase"""
+    timer = current_timer()
+    open_spans = []
+
+    def hook(status):
+        if timer is None:
+            return
+        if status.get('status') == 'started':
+            open_spans.append(timer.push('postprocess'))
+        elif status.get('status') == 'finished' and open_spans:
+            timer.pop(open_spans.pop())
+
+    return hook
+
+
+def _debug_requested():
+    if request.headers.get(DEBUG_HEADER, '').lower() in ('1', 'true', 'yes'):
+        return True
+    return request.args.get(DEBUG_QUERY_PARAM) == 'timing'
+
+
+def init_app(app):
+    """Attach a RequestTimer to every request served by the app"""
+
+    @app.before_request
+    def start_request_timer():
+        g.request_timer = RequestTimer()
+
+    @app.after_request
+    def emit_request_timing(response):
+        timer = g.pop('request_timer', None)
+        if timer is None:
+            return response
+        timer.close()
+
+        response.headers['Server-Timing'] = timer.server_timing_header()
+        timing = timer.as_dict()
+
+        if _debug_requested() and response.is_json and not response.direct_passthrough:
+            data = response.get_json(silent=True)
+            if isinstance(data, dict):
+                data['timing'] = timing
+                response.set_data(json.dumps(data))
+
+        if logger.isEnabledFor(logging.INFO):
+            logger.info('request_timing', extra={'fields': {
+                'event': 'request_timing',
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                **timing,
+            }})
+        return response
+
+    return app
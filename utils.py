@@ -18,9 +18,9 @@ def cleanup_file(file_path):
     try:
         if os.path.exists(file_path):
             os.remove(file_path)
-            logger.info(f"Cleaned up file: {file_path}")
+            logger.info("Cleaned up file: %s", file_path)
     except Exception as e:
-        logger.error(f"Failed to cleanup file {file_path}: {str(e)}")
+        logger.error("Failed to cleanup file %s: %s", file_path, e)
 
 def get_supported_formats():
     """Return list of commonly supported format selectors"""
@@ -194,3 +194,63 @@ def sanitize_filename(filename):
         filename = "file"
     
     return filename
+
+def build_format_record(fmt):
+    """Shape one yt-dlp format dict for API responses"""
+    return {
+        'format_id': fmt.get('format_id'),
+        'ext': fmt.get('ext'),
+        'resolution': fmt.get('resolution', 'audio only' if fmt.get('vcodec') == 'none' else 'unknown'),
+        'height': fmt.get('height'),
+        'width': fmt.get('width'),
+        'filesize': fmt.get('filesize'),
+        'fps': fmt.get('fps'),
+        'vcodec': fmt.get('vcodec'),
+        'acodec': fmt.get('acodec'),
+        'format_note': fmt.get('format_note', '')
+    }
+
+FIELDS_PATTERN = re.compile(r'\s*(\w+)\s*(?:\[([\w\s,]*)\])?\s*(?:,|$)')
+
+def parse_fields(spec):
+    """
+    Parse a field projection such as "title,duration,formats[height,ext,filesize]"
+    into {'title': None, 'duration': None, 'formats': ('height', 'ext', 'filesize')}.
+    Accepts a list of such strings; returns None when no projection was given.
+    """
+    if spec is None or spec == '' or spec == []:
+        return None
+    if isinstance(spec, (list, tuple)):
+        spec = ','.join(spec)
+    if not isinstance(spec, str):
+        raise ValueError('fields must be a string or a list of strings')
+
+    fields = {}
+    position = 0
+    spec = spec.strip()
+    while position < len(spec):
+        match = FIELDS_PATTERN.match(spec, position)
+        if not match or match.end() == position:
+            raise ValueError(f'Invalid fields specification near "{spec[position:]}"')
+        name, sub = match.groups()
+        fields[name] = tuple(s.strip() for s in sub.split(',') if s.strip()) if sub is not None else None
+        position = match.end()
+    return fields
+
+def project_fields(document, fields):
+    """Keep only the requested fields (and sub-fields of lists/objects) of a response document"""
+    if fields is None:
+        return document
+    unknown = [name for name in fields if name not in document]
+    if unknown:
+        raise ValueError(f'Unknown fields: {", ".join(unknown)}')
+
+    projected = {}
+    for name, sub in fields.items():
+        value = document[name]
+        if sub and isinstance(value, list):
+            value = [{key: item.get(key) for key in sub} if isinstance(item, dict) else item for item in value]
+        elif sub and isinstance(value, dict):
+            value = {key: value.get(key) for key in sub}
+        projected[name] = value
+    return projected